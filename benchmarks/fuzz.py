@@ -0,0 +1,231 @@
+"""
+Fuzzing harness for the model parser. Mutates synthetic models (byte flips,
+extreme counts and offsets, truncation, splices) and checks that
+`Model.parse_bytes` either parses them or raises ModelParseError, never
+anything else, and that its worst case time stays linear in the input size:
+
+    python -m benchmarks.fuzz                       # 2000 mutations
+    python -m benchmarks.fuzz --iterations 20000 --seed 7
+
+Exits non-zero on a crash or superlinear scaling.
+"""
+
+import argparse
+import random
+import struct
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from jtn64 import Model
+from jtn64.limits import ModelParseError
+
+from .synthetic import build_model
+
+# (offset, struct format) of the model header's offset and count fields
+HEADER_FIELDS = [
+    (4, ">I"), (8, ">H"), (12, ">I"), (16, ">I"), (24, ">I"), (28, ">I"),
+    (48, ">H"), (50, ">H"),
+]
+
+# (header field holding the section offset, offset in the section, format)
+# of the counts inside each section
+SECTION_COUNTS = [
+    (8, ">H", 4, ">H"),     # Texture count
+    (12, ">I", 0, ">I"),    # Display list command count
+    (16, ">I", 20, ">H"),   # Vertex count
+    (24, ">I", 4, ">H"),    # Bone count
+    (28, ">I", 16, ">H"),   # Collision geo count
+    (28, ">I", 20, ">H"),   # Collision triangle count
+]
+
+# Triangle counts of the models timed for scaling, the largest 16x the
+# smallest
+SCALING_TRIANGLES = (500, 2000, 8000)
+
+# Worst case parse time per byte may grow by at most this factor from the
+# smallest to the largest model. Quadratic behaviour would show up as ~16.
+LINEAR_TOLERANCE = 4.0
+
+
+@dataclass
+class FuzzReport:
+    __slots__ = ("parsed", "rejected", "crashes")
+
+    parsed: int
+    rejected: int
+    # (mutation description, formatted exception) of every failure that
+    # wasn't a ModelParseError
+    crashes: List[Tuple[str, str]]
+
+
+def _extreme(rng: random.Random, fmt: str, data_length: int) -> int:
+    limit = 2 ** (8 * struct.calcsize(fmt)) - 1
+
+    return rng.choice([0, 1, limit, limit // 2, rng.randrange(limit), min(data_length, limit)])
+
+
+def _put(data: bytearray, offset: int, fmt: str, value: int):
+    if offset + struct.calcsize(fmt) <= len(data):
+        struct.pack_into(fmt, data, offset, value)
+
+
+def mutate(model_data: bytes, rng: random.Random) -> Tuple[str, bytes]:
+    """
+    A randomly corrupted copy of `model_data`, and a description of what
+    was done to it.
+    """
+
+    data = bytearray(model_data)
+    kind = rng.choice(["flip", "header", "count", "truncate", "splice"])
+
+    if kind == "flip":
+        positions = [rng.randrange(len(data)) for _ in range(rng.randint(1, 8))]
+
+        for position in positions:
+            data[position] ^= rng.randrange(1, 256)
+
+        return f"flip {positions}", bytes(data)
+
+    if kind == "header":
+        offset, fmt = rng.choice(HEADER_FIELDS)
+        value = _extreme(rng, fmt, len(data))
+        _put(data, offset, fmt, value)
+
+        return f"header+{offset} = {value}", bytes(data)
+
+    if kind == "count":
+        header_offset, header_fmt, offset, fmt = rng.choice(SECTION_COUNTS)
+        section = struct.unpack_from(header_fmt, data, header_offset)[0]
+
+        if not section:
+            return "count (no section)", bytes(data)
+
+        value = _extreme(rng, fmt, len(data))
+        _put(data, section + offset, fmt, value)
+
+        return f"count {section + offset} = {value}", bytes(data)
+
+    if kind == "truncate":
+        length = rng.randrange(len(data))
+
+        return f"truncate {length}", bytes(data[:length])
+
+    start = rng.randrange(len(data))
+    end = min(len(data), start + rng.randint(1, 4096))
+
+    return f"splice {start}:{end}", bytes(data[:end] + data[start:])
+
+
+def _corpus(seed: int) -> List[bytes]:
+    return [
+        build_model(triangle_count=60, texture_count=2, seed=seed),
+        build_model(triangle_count=300, collision=True, seed=seed),
+        build_model(triangle_count=200, bone_count=3, layout_groups=2, seed=seed),
+    ]
+
+
+def fuzz(iterations: int, seed: int = 0) -> FuzzReport:
+    rng = random.Random(seed)
+    corpus = _corpus(seed)
+    report = FuzzReport(parsed=0, rejected=0, crashes=[])
+
+    for _ in range(iterations):
+        description, data = mutate(rng.choice(corpus), rng)
+
+        try:
+            Model.parse_bytes(data)
+        except ModelParseError:
+            report.rejected += 1
+        except Exception:
+            report.crashes.append((description, traceback.format_exc()))
+        else:
+            report.parsed += 1
+
+    return report
+
+
+def worst_case_times(mutations: int, seed: int = 0) -> List[Tuple[int, float]]:
+    """
+    (size in bytes, worst parse time in seconds) of the unmodified model and
+    `mutations` corrupted copies, for models of each SCALING_TRIANGLES size.
+    Every count and header field is also tried at its maximum.
+    """
+
+    rng = random.Random(seed)
+    results = []
+
+    for triangle_count in SCALING_TRIANGLES:
+        model_data = build_model(triangle_count=triangle_count, collision=True, seed=seed)
+        inputs = [model_data]
+
+        for header_offset, header_fmt, offset, fmt in SECTION_COUNTS:
+            data = bytearray(model_data)
+            section = struct.unpack_from(header_fmt, data, header_offset)[0]
+
+            if section:
+                _put(data, section + offset, fmt, 2 ** (8 * struct.calcsize(fmt)) - 1)
+                inputs.append(bytes(data))
+
+        inputs += [mutate(model_data, rng)[1] for _ in range(mutations)]
+
+        worst = 0.0
+
+        for data in inputs:
+            start = time.perf_counter()
+
+            try:
+                Model.parse_bytes(data)
+            except ModelParseError:
+                pass
+
+            worst = max(worst, time.perf_counter() - start)
+
+        results.append((len(model_data), worst))
+
+    return results
+
+
+def superlinearity(times: List[Tuple[int, float]]) -> float:
+    """
+    How much the worst case time per byte grew from the smallest to the
+    largest input; about 1 (or less, with fixed costs) when linear.
+    """
+
+    (small_size, small_time), (large_size, large_time) = times[0], times[-1]
+
+    return (large_time / large_size) / (small_time / small_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--scaling-mutations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = fuzz(args.iterations, args.seed)
+
+    print(
+        f"{args.iterations} mutations: {report.parsed} parsed, {report.rejected}"
+        f" rejected, {len(report.crashes)} crashed"
+    )
+
+    for description, error in report.crashes[:10]:
+        print(f"\n{description}\n{error}")
+
+    times = worst_case_times(args.scaling_mutations, args.seed)
+
+    for size, seconds in times:
+        print(f"{size:>10} bytes  worst {seconds * 1000:8.3f}ms  {seconds / size * 1e9:8.1f}ns/byte")
+
+    growth = superlinearity(times)
+    print(f"Worst case time per byte grew {growth:.2f}x (limit {LINEAR_TOLERANCE}x)")
+
+    return 1 if report.crashes or growth > LINEAR_TOLERANCE else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
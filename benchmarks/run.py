@@ -0,0 +1,241 @@
+"""
+Standalone benchmark runner. Times each stage of the extraction pipeline
+against synthetic models, and records the peak memory of parsing:
+
+    python -m benchmarks.run                 # print timings
+    python -m benchmarks.run --save          # overwrite benchmarks/baseline.json
+    python -m benchmarks.run --compare       # compare against the baseline
+
+The baseline is checked in, so a regression shows up as a diff when it is
+regenerated.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from jtn64 import Model
+from jtn64.chunks import write_chunks
+from jtn64.glb import geometry_to_glb, model_image_uris, write_glb
+from jtn64.gltf import model_to_gltf
+from jtn64.render import render_geometry, texture_arrays
+from jtn64.textures import TextureType
+from jtn64.util import encode_png
+
+from .synthetic import build_model, build_rom
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# name -> build_model keyword arguments
+SCENARIOS = {
+    "small": dict(triangle_count=300, texture_count=2, texture_size=16),
+    "medium": dict(triangle_count=3000, texture_count=8, texture_size=32),
+    "large": dict(
+        triangle_count=30000, texture_count=16, texture_size=64,
+        noop_commands=2
+    ),
+    "ci4": dict(
+        triangle_count=3000, texture_count=8, texture_size=64,
+        texture_type=TextureType.CI4
+    ),
+    "ci8": dict(
+        triangle_count=3000, texture_count=8, texture_size=64,
+        texture_type=TextureType.CI8
+    ),
+    "ia8": dict(
+        triangle_count=3000, texture_count=8, texture_size=64,
+        texture_type=TextureType.IA8
+    ),
+}
+
+ROM_MODEL_COUNT = 8
+
+# Grid cell size for the chunked export, in N64 units
+CHUNK_SIZE = 512
+
+
+def measure(func, repeat: int) -> float:
+    """
+    Return the best wall time of `repeat` calls, in seconds.
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def measure_memory(func) -> int:
+    """
+    Return the peak traced allocation of one call, in bytes. The result of
+    `func` is held until the peak is read, so it counts towards it.
+    """
+
+    tracemalloc.start()
+
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    del result
+
+    return peak
+
+
+def bench_scenario(name: str, options: dict, repeat: int) -> dict:
+    import decompile
+
+    model_data = build_model(**options)
+    model = Model.parse_bytes(model_data)
+    displaylist_result = model.simulate_displaylist()
+    image_uris = model_image_uris(model)
+
+    rom_data = build_rom([model_data] * ROM_MODEL_COUNT)
+
+    def find_models():
+        with tempfile.TemporaryDirectory() as output_dir:
+            with contextlib.redirect_stdout(io.StringIO()):
+                decompile.find_models(rom_data, Path(output_dir))
+
+    def to_rgba():
+        for texture in model.texture_data:
+            texture.to_rgba()
+
+    def png_encode():
+        for texture in model.texture_data:
+            encode_png(texture.to_image())
+
+    def gltf_write():
+        gltf = model_to_gltf(model, displaylist_result, image_uris=image_uris)
+        b"".join(gltf.save_to_bytes())
+
+    def glb_write():
+        geometry_to_glb(model.build_geometry(displaylist_result), image_uris)
+
+    geometry = model.build_geometry(displaylist_result)
+    texture_files = [f"texture_{i}.png" for i in range(len(model.texture_data))]
+
+    def glb_file_write():
+        with tempfile.TemporaryFile() as f:
+            write_glb(f, geometry, texture_files)
+
+    def chunk_write():
+        with tempfile.TemporaryDirectory() as output_dir:
+            write_chunks(Path(output_dir), "bench", geometry, texture_files, CHUNK_SIZE)
+
+    textures = texture_arrays(model)
+
+    return {
+        "rom_bytes": len(rom_data),
+        "model_bytes": len(model_data),
+        "triangles": model.model_header.tri_count,
+        "vertices": model.model_header.vert_count,
+        "commands": model.display_list_setup_header.command_count,
+        "textures": len(model.texture_data),
+        "timings": {
+            "find_models": measure(find_models, repeat),
+            "parse_bytes": measure(lambda: Model.parse_bytes(model_data), repeat),
+            "simulate_displaylist": measure(model.simulate_displaylist, repeat),
+            "to_rgba": measure(to_rgba, repeat),
+            "png_encode": measure(png_encode, repeat),
+            "gltf_write": measure(gltf_write, repeat),
+            "glb_write": measure(glb_write, repeat),
+            "chunk_write": measure(chunk_write, repeat),
+            "render": measure(lambda: render_geometry(geometry, textures), repeat),
+        },
+        "memory": {
+            "parse_bytes": measure_memory(lambda: Model.parse_bytes(model_data)),
+            "simulate_displaylist": measure_memory(model.simulate_displaylist),
+            "glb_write": measure_memory(glb_file_write),
+            "chunk_write": measure_memory(chunk_write),
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Print a per-stage comparison against the baseline. Returns False if any
+    stage got slower than `threshold` times the baseline.
+    """
+
+    ok = True
+
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: no baseline")
+            continue
+
+        for kind, unit, scale in (("timings", "ms", 1000), ("memory", "KB", 1 / 1024)):
+            for stage, value in result[kind].items():
+                base = baseline[name].get(kind, {}).get(stage)
+
+                if not base:
+                    continue
+
+                ratio = value / base
+                marker = ""
+
+                if ratio > threshold:
+                    marker = "  REGRESSION"
+                    ok = False
+
+                print(
+                    f"{name:>8} {stage:<22} {base * scale:10.3f}{unit}"
+                    f" -> {value * scale:10.3f}{unit}  x{ratio:.2f}{marker}"
+                )
+
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", action="store_true", help="Write the baseline file")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline file")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    results = {}
+
+    for name in args.scenarios:
+        results[name] = bench_scenario(name, SCENARIOS[name], args.repeat)
+
+        if not args.compare:
+            for stage, seconds in results[name]["timings"].items():
+                print(f"{name:>8} {stage:<22} {seconds * 1000:10.3f}ms")
+
+            for stage, peak in results[name]["memory"].items():
+                print(f"{name:>8} {stage + ' peak':<22} {peak / 1024:10.3f}KB")
+
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())
+
+        if not compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""
+Builds synthetic Banjo Kazooie model binaries and ROM images for benchmarks
+and tests. The layout follows what `jtn64.Model.parse_bytes` expects, so the
+generated data exercises the same code paths as a real dump without needing
+a copyrighted ROM on disk.
+"""
+
+import math
+import random
+import struct
+import zlib
+
+from jtn64.textures import TextureType
+
+# Vertices per G_VTX load. Every batch is a 2x16 strip which produces 30
+# triangles out of the 32 entry vertex cache.
+BATCH_COLUMNS = 16
+BATCH_VERTICES = BATCH_COLUMNS * 2
+BATCH_TRIANGLES = (BATCH_COLUMNS - 1) * 2
+
+HEADER_SIZE = 0x38
+
+
+def texture_data_length(texture_type: TextureType, width: int, height: int) -> int:
+    if texture_type is TextureType.CI4:
+        return 2 * 2**4 + (width * height) // 2
+    elif texture_type is TextureType.CI8:
+        return 2 * 2**8 + width * height
+    elif texture_type is TextureType.RGBA16:
+        return width * height * 2
+    elif texture_type is TextureType.RGBA32:
+        return width * height * 4
+    elif texture_type is TextureType.IA8:
+        return width * height
+
+    raise ValueError(f"Unknown texture type {texture_type}")
+
+
+def _build_texture_setup(textures, rng):
+    sub_headers = []
+    texture_data = []
+    offset = 0
+
+    for texture_type, width, height in textures:
+        length = texture_data_length(texture_type, width, height)
+
+        sub_headers.append(
+            struct.pack(">IHHBB6x", offset, texture_type, 0, width, height)
+        )
+        texture_data.append(bytes(rng.getrandbits(8) for _ in range(length)))
+
+        offset += length
+
+    body = b"".join(sub_headers) + b"".join(texture_data)
+    header = struct.pack(">IHH", 8 + len(body), len(textures), 0)
+
+    return header + body
+
+
+def _build_vertex_store(vertex_count, rng):
+    vertices = []
+
+    for i in range(vertex_count):
+        batch, local = divmod(i, BATCH_VERTICES)
+        row, column = divmod(local, BATCH_COLUMNS)
+
+        vertices.append(struct.pack(
+            ">hhhHhhBBBB",
+            column * 64 - 512,
+            (batch % 64) * 32,
+            row * 64 + (batch // 64) * 128 - 2048,
+            0,
+            column * 256,
+            row * 4096,
+            rng.randrange(256), rng.randrange(256), rng.randrange(256),
+            255
+        ))
+
+    # 0x14 holds the vertex count, vertices start at 0x18
+    header = struct.pack(">20xH2x", vertex_count)
+
+    return header + b"".join(vertices)
+
+
+def _build_collision(batch_count, triangle_count):
+    triangles = []
+
+    for batch in range(batch_count):
+        base = batch * BATCH_VERTICES
+
+        for column in range(BATCH_COLUMNS - 1):
+            a = base + column
+            b = a + BATCH_COLUMNS
+
+            triangles.append((a, b, a + 1))
+            triangles.append((a + 1, b, b + 1))
+
+    triangles = triangles[:triangle_count]
+
+    # Bounds and strides don't matter to the parser beyond being stored
+    header = struct.pack(
+        ">3h3hhhhhh2x",
+        -512, 0, -2048, 512, 2048, 2048,
+        1, 1, 1, 1000, len(triangles)
+    )
+    geos = struct.pack(">hh", 0, len(triangles))
+
+    return header + geos + b"".join(
+        struct.pack(">3HHI", *triangle, 0, 1) for triangle in triangles
+    )
+
+
+def _build_bone_setup(bone_count):
+    # A chain of bones up the Y axis, each the parent of the next
+    bones = [
+        struct.pack(">3fhh", 0.0, i * 256.0, 0.0, i, i - 1)
+        for i in range(bone_count)
+    ]
+
+    return struct.pack(">fH2x", 1.0, bone_count) + b"".join(bones)
+
+
+def build_animation(bone_count: int = 4, frame_count: int = 30,
+                    keyframe_every: int = 5) -> bytes:
+    """
+    Build an animation asset swinging every bone of a `bone_count` bone
+    setup around the X axis and moving the root bone up and down, with a
+    keyframe every `keyframe_every` frames.
+    """
+
+    frames = list(range(0, frame_count - 1, keyframe_every)) + [frame_count - 1]
+    tracks = []
+
+    for bone in range(bone_count):
+        tracks.append((bone, 0, [
+            (frame, int(45 * 64 * math.sin(frame / frame_count * 2 * math.pi)))
+            for frame in frames
+        ]))
+
+    tracks.append((0, 7, [(frame, frame * 8) for frame in frames]))
+
+    body = b"".join(
+        struct.pack(">Hh", bone << 4 | transform, len(keyframes))
+        + b"".join(struct.pack(">Hh", *keyframe) for keyframe in keyframes)
+        for bone, transform, keyframes in tracks
+    )
+
+    return struct.pack(">hhH2x", 0, frame_count - 1, len(tracks)) + body
+
+
+def _command(command_type, *fields, fmt=">7B"):
+    return bytes([command_type]) + struct.pack(fmt, *fields)
+
+
+def _build_display_list(batch_count, triangle_count, texture_count,
+                        texture_offsets, texture_switch_every, noop_commands):
+    commands = [
+        _command(0xBB, 0, 0, 1, 0x8000, 0x8000, fmt=">BBBHH"),
+    ]
+
+    remaining = triangle_count
+    # (first command, command count) of every batch
+    batch_ranges = []
+
+    for batch in range(batch_count):
+        batch_start = len(commands)
+
+        if texture_count and batch % texture_switch_every == 0:
+            texture_index = (batch // texture_switch_every) % texture_count
+
+            commands.append(_command(
+                0xFD, 2 << 3, 0, 0x02000000 + texture_offsets[texture_index],
+                fmt=">BHI"
+            ))
+
+        load_address = 0x01000000 + batch * BATCH_VERTICES * 16
+        vert_len = (BATCH_VERTICES << 10) | ((BATCH_VERTICES * 16) & 0x3FF)
+
+        commands.append(_command(0x04, 0, vert_len, load_address, fmt=">BHI"))
+
+        faces = []
+
+        for column in range(BATCH_COLUMNS - 1):
+            a = column
+            b = column + 1
+            c = column + BATCH_COLUMNS
+            d = column + BATCH_COLUMNS + 1
+
+            faces.append((a, c, b))
+            faces.append((b, c, d))
+
+        faces = faces[:min(remaining, BATCH_TRIANGLES)]
+        remaining -= len(faces)
+
+        for i in range(0, len(faces) - 1, 2):
+            (v1, v2, v3), (v4, v5, v6) = faces[i], faces[i + 1]
+
+            commands.append(_command(
+                0xB1, v1 * 2, v2 * 2, v3 * 2, 0, v4 * 2, v5 * 2, v6 * 2
+            ))
+
+        if len(faces) % 2:
+            v1, v2, v3 = faces[-1]
+
+            commands.append(_command(0xBF, 0, 0, 0, 0, v1 * 2, v2 * 2, v3 * 2))
+
+        for _ in range(noop_commands):
+            commands.append(_command(0xE7, 0, 0, 0, 0, 0, 0, 0))
+
+        batch_ranges.append((batch_start, len(commands) - batch_start))
+
+    commands.append(_command(0xB8, 0, 0, 0, 0, 0, 0, 0))
+
+    return struct.pack(">I4x", len(commands)) + b"".join(commands), batch_ranges
+
+
+def _build_geometry_layout(batch_ranges, group_count):
+    # One BONE command per group of consecutive batches, holding a LOAD_DL
+    # command per batch
+    group_size = math.ceil(len(batch_ranges) / group_count)
+    groups = [
+        batch_ranges[i:i + group_size]
+        for i in range(0, len(batch_ranges), group_size)
+    ]
+    layout = b""
+
+    for bone, group in enumerate(groups):
+        children = b"".join(
+            struct.pack(">IIhh", 0x03, 0 if i == len(group) - 1 else 12, start, count)
+            for i, (start, count) in enumerate(group)
+        )
+        size = 0 if bone == len(groups) - 1 else 12 + len(children)
+
+        layout += struct.pack(">IIBB2x", 0x02, size, 12, bone) + children
+
+    return layout
+
+
+def build_model(
+    triangle_count: int = 1000,
+    texture_count: int = 4,
+    texture_size: int = 32,
+    texture_type: TextureType = TextureType.RGBA16,
+    texture_switch_every: int = 4,
+    noop_commands: int = 0,
+    collision: bool = False,
+    bone_count: int = 0,
+    layout_groups: int = 0,
+    seed: int = 0,
+) -> bytes:
+    """
+    Build a decompressed model binary.
+
+    `triangle_count` triangles are emitted as strips of 2x16 vertices, one
+    G_VTX load per strip, switching texture every `texture_switch_every`
+    strips. `noop_commands` pads the display list with G_RDPPIPESYNC commands
+    after every strip to grow the display list without adding geometry.
+    With `collision`, the same triangles are also written as collision
+    geometry, in a single grid cell. `bone_count` adds an animation setup
+    with a chain of that many bones. `layout_groups` adds a geometry layout
+    splitting the strips into that many BONE commands (bones 0, 1, ...),
+    with one LOAD_DL command per strip.
+    """
+
+    rng = random.Random(seed)
+
+    batch_count = max(1, math.ceil(triangle_count / BATCH_TRIANGLES))
+    vertex_count = batch_count * BATCH_VERTICES
+
+    if vertex_count > 0xFFFF:
+        raise ValueError("Too many vertices for a single model")
+
+    textures = [
+        (TextureType(texture_type), texture_size, texture_size)
+    ] * texture_count
+
+    texture_offsets = []
+    offset = 0
+
+    for t, w, h in textures:
+        texture_offsets.append(offset)
+        offset += texture_data_length(t, w, h)
+
+    texture_setup = _build_texture_setup(textures, rng)
+    display_list, batch_ranges = _build_display_list(
+        batch_count, triangle_count, texture_count, texture_offsets,
+        texture_switch_every, noop_commands
+    )
+    vertex_store = _build_vertex_store(vertex_count, rng)
+
+    texture_setup_offset = HEADER_SIZE
+    display_list_offset = texture_setup_offset + len(texture_setup)
+    vertex_store_offset = display_list_offset + len(display_list)
+    collision_offset = 0
+    collision_setup = b""
+
+    if collision:
+        collision_offset = vertex_store_offset + len(vertex_store)
+        collision_setup = _build_collision(batch_count, triangle_count)
+
+    animation_offset = 0
+    bone_setup = b""
+
+    if bone_count:
+        animation_offset = vertex_store_offset + len(vertex_store) + len(collision_setup)
+        bone_setup = _build_bone_setup(bone_count)
+
+    layout_offset = 0
+    layout = b""
+
+    if layout_groups:
+        layout_offset = vertex_store_offset + len(vertex_store) \
+            + len(collision_setup) + len(bone_setup)
+        layout = _build_geometry_layout(batch_ranges, layout_groups)
+
+    header = struct.pack(
+        ">IIHHIIIIIIIIIHH4x",
+        0x0B,
+        layout_offset,
+        texture_setup_offset,
+        0,  # geo_type
+        display_list_offset,
+        vertex_store_offset,
+        0,  # unused_1
+        animation_offset,
+        collision_offset,
+        0,  # effects_setup_end_address
+        0,  # effects_setup_offset
+        0,  # unused_2
+        0,  # unused_3
+        triangle_count,
+        vertex_count,
+    )
+
+    return header + texture_setup + display_list + vertex_store \
+        + collision_setup + bone_setup + layout
+
+
+def build_rom(models, padding: int = 0x1000, seed: int = 0) -> bytes:
+    """
+    Build a ROM image holding each model binary compressed the same way the
+    game does it: a 0x1172 magic, a 4 byte size, then a raw deflate stream.
+    Models are separated by `padding` bytes of random filler.
+    """
+
+    rng = random.Random(seed)
+    # Big endian (.z64) header magic, then zeroes up to the first model
+    chunks = [b"\x80\x37\x12\x40" + bytes(0x1000 - 4)]
+
+    for model in models:
+        compressor = zlib.compressobj(wbits=-15)
+        compressed = compressor.compress(model) + compressor.flush()
+
+        chunks.append(b"\x11\x72" + struct.pack(">I", len(compressed) + 6))
+        chunks.append(compressed)
+
+        # Filler never contains the 0x1172 magic so the model count stays
+        # predictable.
+        chunks.append(bytes(rng.randrange(0x12, 0x100) for _ in range(padding)))
+
+    rom = b"".join(chunks)
+
+    # Real ROMs are a whole number of words, which byte order conversion
+    # relies on.
+    return rom + bytes(-len(rom) % 4)
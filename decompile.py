@@ -1,433 +1,905 @@
 #!/usr/bin/env python3
 
-import zlib
+# Heavy dependencies (zlib, PIL, pygltflib and the parser) are imported inside
+# the commands that need them, so short invocations only pay for click.
+# tests/test_startup.py guards this.
+
 import struct
 import click
-import io
-import math
+import json
+import sys
 
+from contextlib import contextmanager
+from dataclasses import replace
+from functools import partial
 from pathlib import Path
-from PIL import Image
-import jtn64
-from jtn64 import read_palette_rgb565, print_hex, BitReader, \
-    iter_colors_rgb5a3, iter_colors_rgb565, iter_colors_rgb555a, \
-    iter_colors_ia8, Model
+from typing import Optional, Tuple
+from jtn64 import stats, profiling
 
-import pygltflib
 
+def find_models(rom_data, output_dir=Path("models")):
+    """
+    Finds models from rom data and writes them into `output_dir`.
+    See `jtn64.rom.iter_models`.
+    """
 
-class MinMaxTracker:
-    def __init__(self):
-        self.min = None
-        self.max = None
+    from jtn64.rom import iter_models
 
-    def add(self, v):
-        if self.min is None:
-            self.min = v
-        elif v < self.min:
-            self.min = v
+    model_count = 0
 
-        if self.max is None:
-            self.max = v
-        elif v > self.max:
-            self.max = v
+    for i, decompressed in iter_models(rom_data):
+        _, triangle_count, vertex_count, _ = struct.unpack(">HHHH", decompressed[0x30:0x38])
 
+        # print_hex(decompressed[0:0x38])
 
-class BoundingBoxTracker:
-    def __init__(self):
-        self.min = None
-        self.max = None
+        print(f"Triangle_count={triangle_count}, vertex_count={vertex_count}")
 
-    def add(self, v):
-        if self.min is None:
-            self.min = list(v)
-        else:
-            for i, x in enumerate(v):
-                if x < self.min[i]:
-                    self.min[i] = x
+        model_path = Path(output_dir, f"{i:08x}_model.bin")
 
-        if self.max is None:
-            self.max = list(v)
-        else:
-            for i, x in enumerate(v):
-                if x > self.max[i]:
-                    self.max[i] = x
+        print(f"Writing to {model_path}")
 
+        model_path.parent.mkdir(exist_ok=True)
+        model_path.write_bytes(decompressed)
 
-def is_readable(t):
-    readable_chars = 0
+        model_count += 1
 
-    for c in t:
-        i = ord(c)
+    print(f"Found {model_count} models.")
 
-        if i > 48 and i < 122:
-            readable_chars += 1
 
-    return (readable_chars / len(t)) > 0.3
+@contextmanager
+def model_scope(name: str):
+    """
+    Attribute stats and profiles recorded inside the block to one model.
+    """
 
+    with stats.model_scope(name), profiling.model_scope(name):
+        yield
 
-def find_strings(rom_data):
-    running_string = ""
 
-    for c in rom_data:
-        i = int(c)
+def png_options(command):
+    """
+    PNG compression options shared by the commands that write textures.
+    """
 
-        if i == 32 or (i >= 48 and i <= 56) or (i >= 65 and i <= 90) or (i >= 97 and i <= 122):
-            running_string += chr(c)
-        else:
-            if len(running_string) >= 4:
-                print(running_string)
+    command = click.option(
+        "--png-workers", type=int, default=None,
+        help="Threads used to encode PNGs. Defaults to one per core."
+    )(command)
+    command = click.option(
+        "--fast-png", is_flag=True,
+        help="Shorthand for a low --png-level; faster, slightly larger files."
+    )(command)
+    command = click.option(
+        "--png-level", type=click.IntRange(0, 9), default=None,
+        help="zlib level for PNG textures, 0 (stored) to 9. Defaults to 6."
+    )(command)
 
-            running_string = ""
+    return command
 
 
-def find_models(rom_data):
+def budget_options(command):
     """
-    Finds models from rom data. Scans the entire ROM looking for
-    the Zlib header (0x1172) and then attempts to decompress it.
+    Per-model resource limits shared by the batch commands. See `_budget`.
     """
 
-    model_count = 0
-
-    for i in range(len(rom_data) - 17):
-        a = rom_data[i]
-        b = rom_data[i + 1]
-
-        if a == 0x11 and b == 0x72:
-            size = int.from_bytes(rom_data[i + 2:i + 6], byteorder='big')
+    command = click.option(
+        "--max-model-bytes", type=click.IntRange(min=1), default=None,
+        metavar="BYTES", help="Skip models bigger than this, decompressed."
+    )(command)
+    command = click.option(
+        "--max-seconds", type=float, default=None, metavar="SECONDS",
+        help="Give up on a model that takes longer than this, and move on."
+    )(command)
 
-            # If it's greater than 5mb, it's probably not a valid object.
-            if size > 5 * 1024 * 1024:
-                continue
+    return command
 
-            data = rom_data[i + 6:i + size]
 
-            try:
-                decompressed = zlib.decompress(data, wbits=-15)
+def _budget(max_seconds: Optional[float], max_model_bytes: Optional[int]):
+    from jtn64.limits import Budget
 
-                if len(decompressed) > 32:
-                    start, geometry_offset, texture_offset, \
-                        display_list_offset, vertex_store_offset = struct.unpack(">IIIII", decompressed[0:20])
+    if max_seconds is not None and max_seconds <= 0:
+        raise click.BadParameter("must be positive", param_hint="--max-seconds")
 
-                    if start == 0x0B:
-                        _, triangle_count, vertex_count, _ = struct.unpack(">HHHH", decompressed[0x30:0x38])
+    return Budget(seconds=max_seconds, max_bytes=max_model_bytes)
 
-                        # print_hex(decompressed[0:0x38])
 
-                        print(f"Triangle_count={triangle_count}, vertex_count={vertex_count}")
+def _parse_offset(ctx, param, value):
+    if value is None:
+        return None
 
-                        model_path = Path(f"models/{i:08x}_model.bin")
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise click.BadParameter(f"{value!r} is not an offset, e.g. 0x3c") from None
 
-                        print(f"Writing to {model_path}")
 
-                        model_path.parent.mkdir(exist_ok=True)
-                        model_path.write_bytes(decompressed)
+def _png_level(level, fast_png: bool) -> int:
+    from jtn64.util import DEFAULT_PNG_LEVEL, FAST_PNG_LEVEL
 
-                        model_count += 1
-            except zlib.error as e:
-                # print(e)
-                pass
+    if level is not None:
+        return level
 
-    print(f"Found {model_count} models.")
+    return FAST_PNG_LEVEL if fast_png else DEFAULT_PNG_LEVEL
 
 
 @click.group()
-def cli():
-    pass
+@click.option(
+    "--stats-json", type=click.Path(dir_okay=False, writable=True),
+    help="Write per-model and aggregate timings and counters to this file"
+    " ('-' for stdout)."
+)
+@click.option(
+    "--profile", "profile_prefix", metavar="PREFIX",
+    help="Profile the command, writing PREFIX.pstats and a PREFIX.collapsed"
+    " stack file for flamegraphs."
+)
+@click.option(
+    "--profile-per-model", is_flag=True,
+    help="With --profile, also write a PREFIX.<model>.pstats per model."
+)
+@click.pass_context
+def cli(ctx, stats_json: str, profile_prefix: str, profile_per_model: bool):
+    if profile_prefix:
+        profiling.start(profile_prefix, per_model=profile_per_model)
+
+        def write_profile():
+            for path in profiling.stop():
+                print(f"Wrote {path}", file=sys.stderr)
+
+        ctx.call_on_close(write_profile)
+
+    if stats_json:
+        recorder = stats.enable()
+
+        def write_stats():
+            report = json.dumps(recorder.report(), indent=2)
+
+            if stats_json == "-":
+                print(report)
+            else:
+                Path(stats_json).write_text(report + "\n")
+
+        ctx.call_on_close(write_stats)
 
 
 @cli.command()
 @click.argument("rom-path")
-def dump_models(rom_path: str):
+@click.option(
+    "--byte-order", type=click.Choice(["auto", "z64", "v64", "n64"]),
+    default="auto", show_default=True,
+    help="Layout of the ROM dump. auto reads it from the header; anything"
+    " other than z64 is converted to big endian in memory."
+)
+def dump_models(rom_path: str, byte_order: str):
     """
-    Dump models from a Banjo Kazooie normal (big endian) ROM file
-    into a folder called `roms`.
+    Dump models from a Banjo Kazooie ROM file into a folder called `models`.
     """
 
-    rom = Path(rom_path)
+    from jtn64.rom import ByteOrder, detect_byte_order, open_rom
+
+    order = None if byte_order == "auto" else ByteOrder(byte_order)
 
-    rom_data = rom.read_bytes()
+    if order is None:
+        with Path(rom_path).open("rb") as f:
+            order = detect_byte_order(f.read(4))
 
-    print(f"{len(rom_data)} bytes read.")
+        if order is None:
+            print("Unrecognised ROM header, assuming big endian.", file=sys.stderr)
 
-    find_models(rom_data)
+    with open_rom(rom_path, order) as rom_data:
+        print(f"{len(rom_data)} bytes read ({(order or ByteOrder.Z64).value}).")
+
+        with stats.timer("find_models"):
+            find_models(rom_data)
 
 
 @cli.command()
-@click.argument("path")
-def dump_model_textures(path: str):
-    model = Model.parse_bytes(Path(path).read_bytes())
+@click.argument("rom-path")
+@click.option(
+    "--min-length", default=4, show_default=True, type=click.IntRange(min=1),
+    help="Shortest run of characters reported."
+)
+@click.option(
+    "--encoding", type=click.Choice(["ascii", "shift_jis"]), default="ascii",
+    show_default=True, help="Character set to look for."
+)
+@click.option(
+    "--json", "as_json", is_flag=True,
+    help="Print a JSON list of {offset, text} objects instead of one string"
+    " per line."
+)
+def dump_strings(rom_path: str, min_length: int, encoding: str, as_json: bool):
+    """
+    Print every run of printable text in a ROM (in any byte order) or other
+    binary file, with its offset in the big endian ROM.
+    """
 
-    print(f"Texture_count={model.texture_setup_header.texture_count}")
+    from jtn64.rom import open_rom
+    from jtn64.strings import find_strings
 
-    for texture_num, texture in enumerate(model.texture_data):
-        print(
-            f" texture_type={texture.texture_type!s},"
-            f" width={texture.width}, y={texture.height}"
+    with open_rom(rom_path) as rom_data:
+        strings = find_strings(rom_data, min_length, encoding)
+
+    if as_json:
+        json.dump(
+            [{"offset": offset, "text": text} for offset, text in strings],
+            sys.stdout, ensure_ascii=False, indent=1
         )
+        print()
+    else:
+        for offset, text in strings:
+            print(f"{offset:08x}  {text}")
 
-        image = Image.new('RGBA', (texture.width, texture.height))
 
-        for p, color in enumerate(texture.to_rgba()):
-            y = texture.height - (p // texture.width) - 1
-            x = p % texture.width
+@cli.command()
+@click.argument("path")
+@png_options
+@click.option(
+    "--raw", is_flag=True,
+    help="Write uncompressed RGBA bytes to image_<n>_<w>x<h>.rgba instead of"
+    " PNGs, for pipelines that re-encode anyway."
+)
+def dump_model_textures(path: str, png_level: int, fast_png: bool,
+                        png_workers: int, raw: bool):
+    from PIL import Image
+    from jtn64 import Model
+    from jtn64.util import encode_pngs
 
-            image.putpixel(
-                (x, y), color
+    compress_level = _png_level(png_level, fast_png)
+
+    with model_scope(path):
+        model = Model.parse_bytes(Path(path).read_bytes())
+
+        print(f"Texture_count={model.texture_setup_header.texture_count}")
+
+        images = []
+
+        for texture in model.texture_data:
+            print(
+                f" texture_type={texture.texture_type!s},"
+                f" width={texture.width}, y={texture.height}"
             )
 
-        image.save(f"image_{texture_num}.png")
+            image = texture.to_image(rgba=raw)
+            images.append(image.transpose(Image.FLIP_TOP_BOTTOM))
+
+        if raw:
+            for texture_num, image in enumerate(images):
+                with stats.timer("write"):
+                    Path(
+                        f"image_{texture_num}_{image.width}x{image.height}.rgba"
+                    ).write_bytes(image.tobytes())
+
+            return
+
+        pngs = encode_pngs(images, compress_level, png_workers)
+
+        for texture_num, png in enumerate(pngs):
+            with stats.timer("write"):
+                Path(f"image_{texture_num}.png").write_bytes(png)
 
 
 @cli.command()
 @click.argument("paths", nargs=-1)
 @click.option("--verbose", is_flag=True)
-def dump_model_gltf(paths: str, verbose: bool):
+@click.option(
+    "--quantize", is_flag=True,
+    help="Store positions and UVs as int16 (KHR_mesh_quantization)."
+)
+@click.option(
+    "--optimize", is_flag=True,
+    help="Reorder triangles and vertices for GPU vertex cache and fetch"
+    " locality, and report the ACMR before and after."
+)
+@click.option(
+    "--lods", default=0, show_default=True,
+    help="Number of simplified LOD levels to generate, each with half the"
+    " triangles of the previous one."
+)
+@click.option(
+    "--lod-files", is_flag=True,
+    help="Write LOD levels as separate <model>_lod<n>.gltf files instead of"
+    " MSFT_lod nodes."
+)
+@click.option(
+    "--atlas", is_flag=True,
+    help="Pack non-tiling textures into one atlas and merge their meshes"
+    " into a single draw call."
+)
+@click.option(
+    "--collision", is_flag=True,
+    help="Add the model's collision mesh as a separate node named"
+    " \"collision\"."
+)
+@click.option(
+    "--animation", "animation_paths", multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Decompressed animation asset to export with the model's skeleton."
+    " Can be repeated."
+)
+@click.option(
+    "--nodes", is_flag=True,
+    help="Write the model's geometry layout as a node tree, each node with"
+    " its own vertex range and bounds, so viewers can cull it."
+)
+@click.option(
+    "--subtree", metavar="OFFSET", callback=_parse_offset,
+    help="Only export the geometry layout command at this offset (e.g."
+    " 0x3c) and its children."
+)
+@click.option(
+    "--chunk-size", type=click.IntRange(min=1), default=None, metavar="UNITS",
+    help="Split the model into a grid of cells this many N64 units across,"
+    " written to gltf/<model>/ as one GLB per cell, PNG textures and an"
+    " index.json of the cell bounds."
+)
+@click.option(
+    "--jobs", type=click.IntRange(min=0), default=None, metavar="N",
+    help="Convert N models at a time in worker processes, reading and"
+    " writing files in the background while they work. 0 uses one per core."
+    " --profile only covers the main process."
+)
+@click.option(
+    "--prefetch", type=click.IntRange(min=1), default=4, show_default=True,
+    help="With --jobs, how many models to read ahead of the workers, and how"
+    " many converted models can wait to be written."
+)
+@budget_options
+@png_options
+def dump_model_gltf(paths: str, verbose: bool, quantize: bool, optimize: bool,
+                    lods: int, lod_files: bool, atlas: bool, collision: bool,
+                    animation_paths: Tuple[str, ...], nodes: bool,
+                    subtree: Optional[int], chunk_size: Optional[int],
+                    jobs: Optional[int], prefetch: int,
+                    png_level: int, fast_png: bool, png_workers: int,
+                    max_seconds: Optional[float], max_model_bytes: Optional[int]):
     """
     Convert exported BIN models to GLTF. Saves to gltf/ in the folder running
-    the script.
+    the script. Models that are corrupt or over budget are reported and
+    skipped.
     """
 
+    budget = _budget(max_seconds, max_model_bytes)
+
+    if nodes and (optimize or atlas or lods or lod_files):
+        raise click.UsageError(
+            "--nodes can't be combined with --optimize, --atlas or LODs."
+        )
+
+    if chunk_size and (nodes or lods or lod_files or collision or animation_paths):
+        raise click.UsageError(
+            "--chunk-size can't be combined with --nodes, LODs, --collision"
+            " or --animation."
+        )
+
+    if chunk_size and jobs is not None:
+        raise click.UsageError("--chunk-size can't be combined with --jobs.")
+
+    options = dict(
+        verbose=verbose, quantize=quantize, optimize=optimize, lods=lods,
+        lod_files=lod_files, atlas=atlas, collision=collision,
+        animations=_read_animations(animation_paths), nodes=nodes,
+        subtree=subtree, chunk_size=chunk_size,
+        compress_level=_png_level(png_level, fast_png), png_workers=png_workers
+    )
+
+    if jobs is not None:
+        _dump_model_gltf_pipeline(paths, options, budget, jobs, prefetch)
+
+        return
+
     for path in paths:
-        path = Path(path)
-        model = Model.parse_bytes(path.read_bytes())
+        with model_scope(path):
+            _dump_model_gltf(Path(path), budget, **options)
 
-        print("--------------------------")
-        print(f"  Model file={path}")
-        print(f"  Command count={model.display_list_setup_header.command_count}")
-        print(f"  tris={model.model_header.tri_count}, verts={model.model_header.vert_count}")
-        print(f"  texture count={model.texture_setup_header.texture_count}")
 
-        if model.model_header.tri_count == 0:
-            print("  Model has no triangles, skipping.")
+def _dump_model_gltf_pipeline(paths, options: dict, budget, jobs: int, prefetch: int):
+    """
+    Convert `paths` in `jobs` worker processes with jtn64.pipeline, printing
+    each model's log as it's written.
+    """
 
-            continue
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from jtn64.pipeline import run_pipeline
 
-        images = []
-        textures = []
-        materials = []
-        nodes = []
-        scene_nodes = []
-        accessors = []
-
-        vertex_io = io.BytesIO()
-        triangle_io = io.BytesIO()
-
-        vertex_count = 0
-
-        vertex_minmax = BoundingBoxTracker()
-        color_minmax = BoundingBoxTracker()
-        uv_minmax = BoundingBoxTracker()
-
-        displaylist_result = model.simulate_displaylist()
-
-        gltf_meshes = []
-
-        position_accessor_index = len(displaylist_result.meshes)
-        color_accessor_index = len(displaylist_result.meshes) + 1
-        uv_accessor_index = len(displaylist_result.meshes) + 2
-
-        for mesh_index, mesh in enumerate(displaylist_result.meshes):
-            triangle_minmax = MinMaxTracker()
-            byte_offset = len(triangle_io.getvalue())
-
-            if verbose:
-                print(f'Mesh: texture_index={mesh.texture_index}, tri_count={len(mesh.indices)}')
-
-            scene_nodes.append(mesh_index)
-
-            gltf_meshes.append(
-                pygltflib.Mesh(
-                    primitives=[
-                        pygltflib.Primitive(
-                            attributes=pygltflib.Attributes(
-                                POSITION=position_accessor_index,
-                                COLOR_0=color_accessor_index,
-                                TEXCOORD_0=uv_accessor_index,
-                            ),
-                            indices=mesh_index,
-                            material=mesh.texture_index
-                        )
-                    ]
-                )
-            )
+    jobs = jobs or os.cpu_count() or 1
+    recorder = stats.get_recorder()
 
-            nodes.append(
-                pygltflib.Node(
-                    mesh=mesh_index,
-                    name=f"mesh_{mesh_index}"
-                )
-            )
+    if options["png_workers"] is None:
+        # The workers already keep every core busy
+        options = dict(options, png_workers=1)
 
-            for face_index, face in enumerate(mesh.indices):
-                triangle_io.write(struct.pack("HHH", *face))
-
-                triangle_minmax.add(face[0])
-                triangle_minmax.add(face[1])
-                triangle_minmax.add(face[2])
-
-            accessors.append(
-                pygltflib.Accessor(
-                    bufferView=0,
-                    componentType=pygltflib.UNSIGNED_SHORT,
-                    byteOffset=byte_offset,
-                    count=len(mesh.indices)*3,
-                    type=pygltflib.SCALAR,
-                    max=[triangle_minmax.max],
-                    min=[triangle_minmax.min],
-                )
-            )
+    def on_result(path: str, result):
+        log, model_stats = result
 
-        # Pad to 4 bytes
-        while len(triangle_io.getvalue()) % 4 != 0:
-            triangle_io.write(struct.pack("B", 0))
+        print(log, end="")
 
-        for vertex_index, vertex in enumerate(model.vertex_store_setup_header.vertices):
-            position = (
-                vertex.position[0] / 128,
-                vertex.position[1] / 128,
-                vertex.position[2] / 128
-            )
+        if recorder is not None:
+            recorder.add_model(path, model_stats)
 
-            color = (
-                vertex.rgb_or_norm[0],
-                vertex.rgb_or_norm[1],
-                vertex.rgb_or_norm[2],
-            )
+    with ProcessPoolExecutor(jobs) as executor:
+        run_pipeline(
+            paths, partial(_pipeline_job, options, budget, recorder is not None),
+            executor, jobs, prefetch, on_result
+        )
 
-            # Fetch the UV scale from the Displaylist result, since it modifies
-            # the vertex buffer
-            uv_scale = displaylist_result.vertex_uv_scaling.get(
-                vertex_index, (1.0, 1.0)
-            )
 
-            uv = (
-                float(vertex.uv[0]) * uv_scale[0],
-                float(vertex.uv[1]) * uv_scale[1],
-            )
+def _read_animations(paths):
+    """
+    Parse animation assets into (name, Animation) pairs, named after their
+    files.
+    """
 
-            vertex_io.write(struct.pack("fff", *position))
-            vertex_io.write(struct.pack("BBBB", *color, 0))
-            vertex_io.write(struct.pack("ff", *uv))
-
-            vertex_minmax.add(position)
-            color_minmax.add(color)
-            uv_minmax.add(uv)
-
-            vertex_count += 1
-
-        # Pad to 4 bytes
-        while len(vertex_io.getvalue()) % 4 != 0:
-            vertex_io.write(struct.pack("B", 0))
-
-        # Add the vertex accessors (position, color, then UV)
-
-        accessors += [
-            pygltflib.Accessor(
-                bufferView=1,
-                componentType=pygltflib.FLOAT,
-                count=vertex_count,
-                type=pygltflib.VEC3,
-                max=list(vertex_minmax.max),
-                min=list(vertex_minmax.min),
-            ),
-            pygltflib.Accessor(
-                bufferView=1,
-                componentType=pygltflib.UNSIGNED_BYTE,
-                normalized=True,
-                count=vertex_count,
-                type=pygltflib.VEC3,
-                byteOffset=12,
-                max=list(color_minmax.max),
-                min=list(color_minmax.min),
-            ),
-            pygltflib.Accessor(
-                bufferView=1,
-                componentType=pygltflib.FLOAT,
-                count=vertex_count,
-                type=pygltflib.VEC2,
-                byteOffset=16,
-                max=list(uv_minmax.max),
-                min=list(uv_minmax.min),
-            ),
-        ]
-
-        for i, texture in enumerate(model.texture_data):
-            if verbose:
-                print(f"Texture {i}: {texture.width}x{texture.height}")
-
-            image = texture.to_image()
-
-            images.append(
-                pygltflib.Image(uri=jtn64.image_to_data_uri(image))
-            )
+    if not paths:
+        return []
 
-            textures.append(
-                pygltflib.Texture(sampler=0, source=i)
-            )
+    from jtn64.animation import Animation
+    from jtn64.limits import ModelParseError
 
-            materials.append(
-                pygltflib.Material(
-                    pbrMetallicRoughness=pygltflib.PbrMetallicRoughness(
-                        baseColorTexture=pygltflib.TextureInfo(index=i),
-                        metallicFactor=0.0
-                    ),
-                    name=f"texture_{i}",
-                    alphaMode=pygltflib.MASK
-                )
-            )
+    animations = []
 
-        gltf = pygltflib.GLTF2(
-            scene=0,
-            scenes=[pygltflib.Scene(nodes=scene_nodes)],
-            nodes=nodes,
-            meshes=gltf_meshes,
-            accessors=accessors,
-            images=images,
-            textures=textures,
-            materials=materials,
-            samplers=[
-                pygltflib.Sampler(
-                    magFilter=pygltflib.LINEAR,
-                    minFilter=pygltflib.NEAREST_MIPMAP_LINEAR,
-                    wrapS=pygltflib.REPEAT,
-                    wrapT=pygltflib.REPEAT,
-                )
-            ],
-            bufferViews=[
-                pygltflib.BufferView(
-                    buffer=0,
-                    byteOffset=0,
-                    byteLength=len(triangle_io.getvalue()),
-                    target=pygltflib.ELEMENT_ARRAY_BUFFER,
-                ),
-                pygltflib.BufferView(
-                    buffer=0,
-                    byteOffset=len(triangle_io.getvalue()),
-                    byteLength=len(vertex_io.getvalue()),
-                    byteStride=24,
-                    target=pygltflib.ARRAY_BUFFER,
-                ),
-            ],
-            buffers=[
-                pygltflib.Buffer(
-                    byteLength=len(triangle_io.getvalue()) + len(vertex_io.getvalue())
+    for path in map(Path, paths):
+        with stats.timer("read"):
+            data = path.read_bytes()
+
+        try:
+            animations.append((path.stem, Animation.parse_bytes(data)))
+        except ModelParseError as e:
+            raise click.BadParameter(f"{path}: {e}", param_hint="'--animation'")
+
+    return animations
+
+
+def _dump_model_gltf(path: Path, budget, **options):
+    from jtn64.limits import ModelParseError
+
+    with stats.timer("read"):
+        model_data = path.read_bytes()
+
+    try:
+        budget.check_size(len(model_data))
+
+        with budget.deadline():
+            for outpath, write in _convert_model_gltf(path, model_data, **options):
+                outpath.parent.mkdir(exist_ok=True)
+
+                try:
+                    with stats.timer("write"), outpath.open("wb") as f:
+                        written = write(f)
+                except BaseException:
+                    # Don't leave half a file behind
+                    outpath.unlink()
+                    raise
+
+                stats.count("write.bytes", written)
+    except ModelParseError as e:
+        print(f"Skipping {path}: {e}")
+
+
+def _pipeline_job(options: dict, budget, record_stats: bool, path: str,
+                  model_data: bytes):
+    """
+    Convert one model in a pipeline worker process. Returns the GLTF files
+    as (path, data) pairs, plus what the conversion printed and, if
+    `record_stats`, its Stats for the parent to merge.
+    """
+
+    import io
+    from contextlib import redirect_stdout
+    from jtn64.limits import ModelParseError
+
+    recorder = stats.enable() if record_stats else None
+    log = io.StringIO()
+    outputs = []
+
+    with redirect_stdout(log):
+        try:
+            budget.check_size(len(model_data))
+
+            with budget.deadline():
+                for outpath, write in _convert_model_gltf(Path(path), model_data, **options):
+                    buffer = io.BytesIO()
+                    write(buffer)
+                    outputs.append((str(outpath), buffer.getvalue()))
+        except ModelParseError as e:
+            outputs = []
+            print(f"Skipping {path}: {e}")
+
+    return outputs, (log.getvalue(), recorder.aggregate if recorder else None)
+
+
+def _convert_model_gltf(path: Path, model_data: bytes, verbose: bool, quantize: bool,
+                        optimize: bool, lods: int, lod_files: bool, atlas: bool,
+                        collision: bool, animations: list, nodes: bool,
+                        subtree: Optional[int], chunk_size: Optional[int],
+                        compress_level: int, png_workers: int):
+    """
+    Convert a model, yielding an (output path, write) pair per GLTF file,
+    where write(f) writes it into a binary file object and returns the
+    number of bytes written. Chunked exports write their directory
+    directly and yield nothing.
+    """
+
+    from jtn64 import Model
+    from jtn64.glb import model_image_uris, write_glb
+    from jtn64.util import images_to_data_uris
+
+    model = Model.parse_bytes(model_data)
+
+    print("--------------------------")
+    print(f"  Model file={path}")
+    print(f"  Command count={model.display_list_setup_header.command_count}")
+    print(f"  tris={model.model_header.tri_count}, verts={model.model_header.vert_count}")
+    print(f"  texture count={model.texture_setup_header.texture_count}")
+
+    if model.model_header.tri_count == 0:
+        print("  Model has no triangles, skipping.")
+
+        return
+
+    collision_mesh = None
+
+    if collision:
+        if model.collision and model.collision.tris:
+            collision_mesh = model.collision.to_mesh([
+                vertex.position for vertex in model.vertex_store_setup_header.vertices
+            ])
+
+            print(f"  collision tris={len(model.collision.tris)}")
+        else:
+            print("  Model has no collision.")
+
+    layout = model.geometry_layout
+    root = None
+
+    if subtree is not None or nodes:
+        if layout is None:
+            print("  Model has no geometry layout, skipping.")
+
+            return
+
+        print(f"  geometry layout nodes={sum(1 for _ in layout.walk())}")
+
+    if subtree is not None:
+        root = layout.find(subtree)
+
+        if root is None:
+            print(f"  No geometry layout command at 0x{subtree:x}, skipping.")
+
+            return
+
+    scene = None
+
+    if nodes:
+        from jtn64.layout import build_scene
+
+        scene = build_scene(model, root)
+        geometry = scene.geometry
+    else:
+        displaylist_result = model.simulate_displaylist(
+            root.subtree_display_lists() if root is not None else None
+        )
+
+        if displaylist_result.unresolved_textures:
+            print("  unresolved G_SETTIMG addresses=" + ", ".join(
+                f"0x{address:08x}" for address in displaylist_result.unresolved_textures
+            ))
+
+        geometry = model.build_geometry(displaylist_result)
+
+    skin = None
+
+    if animations:
+        if model.bone_setup and model.bone_setup.bones:
+            from jtn64.animation import build_skin
+
+            # Bind vertices to the bones of the geometry layout's BONE
+            # commands. --atlas and --optimize renumber vertices, so those
+            # exports (and models without a layout) bind everything to the
+            # root bone.
+            vertex_joints = None
+
+            if layout is not None and not (atlas or optimize):
+                vertex_joints = layout.vertex_bones(
+                    model.display_list_setup_header,
+                    len(model.vertex_store_setup_header.vertices)
                 )
-            ],
+
+                if scene is not None:
+                    vertex_joints = [vertex_joints[v] for v in scene.source_vertices]
+
+            skin = build_skin(model.bone_setup, animations, vertex_joints)
+
+            print(f"  bones={len(model.bone_setup.bones)}, animations={len(animations)}")
+        else:
+            print("  Model has no bones, skipping animations.")
+
+    images = None
+
+    if atlas:
+        from jtn64.atlas import build_atlas
+
+        result = build_atlas(
+            geometry, [texture.to_image() for texture in model.texture_data]
         )
+        geometry = result.geometry
+        images = result.images
 
-        gltf.set_binary_blob(triangle_io.getvalue() + vertex_io.getvalue())
+        print(
+            f"  atlased {len(result.placements)} of"
+            f" {len(model.texture_data)} textures, meshes={len(geometry.meshes)}"
+        )
+
+    if optimize:
+        from jtn64.optimize import optimize_geometry
+
+        geometry, report = optimize_geometry(geometry)
+
+        print(
+            f"  ACMR {report.acmr_before:.3f} -> {report.acmr_after:.3f},"
+            f" vertices {report.vertices_before} -> {report.vertices_after}"
+        )
 
-        outpath = Path(f"gltf/{path.stem}.gltf")
-        outpath.parent.mkdir(exist_ok=True)
+    if chunk_size:
+        if images is None:
+            images = [texture.to_image() for texture in model.texture_data]
 
-        outpath.write_bytes(
-            b"".join(gltf.save_to_bytes())
+        _write_chunks(
+            path.stem, geometry, images, quantize, chunk_size, compress_level,
+            png_workers
         )
 
+        return
+
+    lod_levels = []
+
+    if lods:
+        from jtn64.simplify import generate_lods
+
+        lod_levels = generate_lods(geometry, [0.5 ** (n + 1) for n in range(lods)])
+
+        print("  LOD triangles=" + ", ".join(
+            str(sum(len(mesh.indices) for mesh in level)) for level in lod_levels
+        ))
+
+    if images is None:
+        image_uris = model_image_uris(model, verbose, compress_level, png_workers)
+    else:
+        image_uris = images_to_data_uris(images, compress_level, png_workers)
+
+    # (name, geometry, LOD levels written as MSFT_lod, collision mesh)
+    outputs = []
+
+    if lod_files:
+        outputs.append((path.stem, geometry, (), collision_mesh))
+
+        for n, level in enumerate(lod_levels):
+            outputs.append((
+                f"{path.stem}_lod{n + 1}", replace(geometry, meshes=level), (), None
+            ))
+    else:
+        outputs.append((path.stem, geometry, lod_levels, collision_mesh))
+
+    scene_nodes = scene.nodes if scene is not None else None
+
+    for name, output_geometry, output_lods, output_collision in outputs:
+        yield Path(f"gltf/{name}.gltf"), partial(
+            write_glb, geometry=output_geometry, image_uris=image_uris,
+            quantize=quantize, lods=output_lods, verbose=verbose,
+            collision=output_collision, skin=skin, scene_nodes=scene_nodes
+        )
+
+
+def _write_chunks(name: str, geometry, images: list, quantize: bool, chunk_size: int,
+                  compress_level: int, png_workers: int):
+    """
+    Write gltf/<name>/: the textures as PNG files shared by every chunk, one
+    GLB per chunk and the chunk index.
+    """
+
+    from jtn64.chunks import write_chunks
+    from jtn64.util import encode_pngs
+
+    directory = Path(f"gltf/{name}")
+    directory.mkdir(parents=True, exist_ok=True)
+
+    image_uris = []
+
+    for i, png in enumerate(encode_pngs(images, compress_level, png_workers)):
+        image_uris.append(f"texture_{i}.png")
+
+        with stats.timer("write"):
+            (directory / image_uris[-1]).write_bytes(png)
+
+    with stats.timer("write"):
+        index = write_chunks(directory, name, geometry, image_uris, chunk_size, quantize)
+
+    print(f"  chunks={len(index['chunks'])}")
+
+    stats.count("write.bytes", sum(chunk["bytes"] for chunk in index["chunks"]))
+
+
+@cli.command()
+@click.argument("paths", nargs=-1)
+@click.option(
+    "--size", type=click.IntRange(16, 2048), default=128, show_default=True,
+    help="Width and height of the thumbnails in pixels."
+)
+@click.option(
+    "--output-dir", default="thumbnails", show_default=True,
+    type=click.Path(file_okay=False),
+    help="Folder to write <model>.png thumbnails to."
+)
+@click.option(
+    "--jobs", type=click.IntRange(min=0), default=0, show_default=True,
+    metavar="N", help="Worker processes. 0 uses one per core."
+)
+@click.option(
+    "--prefetch", type=click.IntRange(min=1), default=4, show_default=True,
+    help="How many models to read ahead of the workers."
+)
+@budget_options
+def thumbnails(paths: Tuple[str, ...], size: int, output_dir: str, jobs: int,
+               prefetch: int, max_seconds: Optional[float],
+               max_model_bytes: Optional[int]):
+    """
+    Render a PNG preview of each exported BIN model with the built in
+    software renderer, in parallel. Models that fail to parse are reported
+    and skipped, as are models without triangles.
+    """
+
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from jtn64.pipeline import run_pipeline
+
+    budget = _budget(max_seconds, max_model_bytes)
+    jobs = jobs or os.cpu_count() or 1
+    rendered = 0
+    empty = 0
+
+    def on_result(path: str, result: Tuple[bool, Optional[str]]):
+        nonlocal rendered, empty
+
+        has_triangles, error = result
+
+        if error:
+            print(f"{path}: {error}", file=sys.stderr)
+        elif has_triangles:
+            rendered += 1
+        else:
+            empty += 1
+
+    with ProcessPoolExecutor(jobs) as executor:
+        run_pipeline(
+            paths, partial(_thumbnail_job, output_dir, size, budget), executor, jobs,
+            prefetch, on_result
+        )
+
+    print(f"Rendered {rendered} of {len(paths)} models to {output_dir}/.")
+
+    if empty:
+        print(f"Skipped {empty} models without triangles.")
+
+
+def _thumbnail_job(output_dir: str, size: int, budget, path: str, model_data: bytes):
+    """
+    Render one thumbnail in a worker process. Returns the PNG to write,
+    and whether the model had triangles and an error message, if any.
+    """
+
+    from jtn64.render import render_thumbnail
+
+    try:
+        budget.check_size(len(model_data))
+
+        with budget.deadline():
+            png = render_thumbnail(model_data, size)
+    except Exception as e:
+        return [], (False, f"{type(e).__name__}: {e}")
+
+    if png is None:
+        return [], (False, None)
+
+    return [(str(Path(output_dir, f"{Path(path).stem}.png")), png)], (True, None)
+
+
+@cli.command()
+@click.argument("paths", nargs=-1)
+@click.option(
+    "--db", "db_path", default="catalog.sqlite", show_default=True,
+    type=click.Path(dir_okay=False),
+    help="SQLite catalog to create or update."
+)
+@click.option(
+    "--force", is_flag=True,
+    help="Rescan sources even if they haven't changed, for example to retry"
+    " models that failed under a smaller budget."
+)
+@click.option(
+    "--query", "sql", metavar="SQL",
+    help="Run this query against the catalog afterwards and print the rows"
+    " tab separated."
+)
+@budget_options
+def catalog(paths: Tuple[str, ...], db_path: str, force: bool, sql: Optional[str],
+            max_seconds: Optional[float], max_model_bytes: Optional[int]):
+    """
+    Record every model in PATHS (ROMs in any byte order, or decompressed
+    model files) in a queryable SQLite catalog. See jtn64/catalog.py for
+    the tables.
+    """
+
+    from jtn64.catalog import Catalog
+
+    budget = _budget(max_seconds, max_model_bytes)
+
+    with Catalog(db_path, budget) as model_catalog:
+        for path in paths:
+            update = model_catalog.add_source(path, force)
+
+            if update.skipped:
+                print(f"{path}: unchanged, skipped.")
+            else:
+                print(f"{path}: {update.models} models, {update.new_models} new.")
+
+        if sql:
+            rows = model_catalog.query(sql)
+
+            if rows:
+                print("\t".join(rows[0].keys()))
+
+            for row in rows:
+                print("\t".join("" if value is None else str(value) for value in row))
+
+
+@cli.command()
+@click.option(
+    "--socket", "socket_path", default="bk-model-extractor.sock",
+    show_default=True, help="Unix socket to listen on."
+)
+@click.option(
+    "--rom", "rom_paths", multiple=True,
+    help="Index this ROM at startup. Can be repeated."
+)
+@click.option(
+    "--max-models", default=256, show_default=True,
+    help="Number of parsed models to keep in memory."
+)
+def serve(socket_path: str, rom_paths: list, max_models: int):
+    """
+    Run a conversion server on a Unix socket, keeping ROM indexes, parsed
+    models and encoded textures warm between requests. See jtn64/server.py
+    for the protocol.
+    """
+
+    from jtn64.server import ConversionServer, ConversionService
+
+    service = ConversionService(max_models=max_models)
+
+    for rom_path in rom_paths:
+        index = service.load_rom(rom_path)
+
+        print(f"Indexed {rom_path}: {len(index.offsets)} models.")
+
+    try:
+        server = ConversionServer(socket_path, service)
+    except FileExistsError as e:
+        raise click.BadParameter(str(e), param_hint="'--socket'")
+
+    with server:
+        print(f"Listening on {socket_path}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
 
 @cli.command()
 def convert_all_models():
+    from jtn64 import Model
+
     for path in Path("models").glob("*.bin"):
         model = Model.parse_bytes(path.read_bytes())
 
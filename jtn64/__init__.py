@@ -1,6 +1,39 @@
-from .util import BitReader, print_hex, image_to_data_uri
-from .textures import read_palette_rgb565, read_palette_rgb565, \
-    iter_colors_rgb565, iter_colors_rgb5a3, iter_colors_rgb555a, \
-    iter_colors_ia8
-from .model import ModelHeader, Model, TextureSetupHeader, TextureSubHeader
-from .f3d import F3DCommandType
+# Names are resolved on first access (PEP 562) so that importing a single
+# submodule, or the package itself, doesn't pull in the parser and PIL.
+
+from importlib import import_module
+
+_LAZY_NAMES = {
+    "BitReader": ".util",
+    "print_hex": ".util",
+    "image_to_data_uri": ".util",
+    "read_palette_rgb565": ".textures",
+    "iter_colors_rgb565": ".textures",
+    "iter_colors_rgb5a3": ".textures",
+    "iter_colors_rgb555a": ".textures",
+    "iter_colors_ia8": ".textures",
+    "ModelHeader": ".model",
+    "Model": ".model",
+    "TextureSetupHeader": ".model",
+    "TextureSubHeader": ".model",
+    "F3DCommandType": ".f3d",
+    "ModelParseError": ".limits",
+}
+
+__all__ = list(_LAZY_NAMES)
+
+
+def __getattr__(name):
+    try:
+        module_name = _LAZY_NAMES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,362 @@
+"""
+Bones and animations.
+
+The animation setup of a model lists its bones, each a pivot position in
+model space and the id of its parent. Animations are separate assets: a
+frame range, then one keyframe track per animated (bone, transform
+component) pair. A transform component is one axis of a bone's rotation
+(Euler angles), scale or translation.
+
+`Animation.sample` evaluates every track at every frame and converts the
+rotations to quaternions with NumPy, one array operation per step rather
+than per keyframe, so a ROM's worth of animations converts quickly. The
+result maps directly onto GLTF animation samplers, see `jtn64.glb`.
+"""
+
+from dataclasses import dataclass
+from enum import IntEnum
+from struct import Struct
+from typing import List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from . import stats
+from .limits import ModelParseError, require_bytes
+
+if TYPE_CHECKING:
+    import numpy
+
+Vector = Tuple[float, float, float]
+
+BONE_SETUP_HEADER = Struct(">fH2x")
+BONE = Struct(">3fhh")
+ANIMATION_HEADER = Struct(">hhH2x")
+# Bone id (top 12 bits) and transform (bottom 4 bits), then keyframe count
+TRACK_HEADER = Struct(">Hh")
+KEYFRAME_SIZE = 4
+
+# Keyframe frame numbers share their halfword with an interpolation mode in
+# the top two bits, which isn't emulated: every track is interpolated
+# linearly.
+FRAME_MASK = 0x3FFF
+
+FRAMES_PER_SECOND = 30
+
+# Fixed point divisors of keyframe values. Rotations are in degrees.
+ROTATION_UNITS = 64
+SCALE_UNITS = 1024
+TRANSLATION_UNITS = 1
+
+
+class Transform(IntEnum):
+    ROTATE_X = 0
+    ROTATE_Y = 1
+    ROTATE_Z = 2
+    SCALE_X = 3
+    SCALE_Y = 4
+    SCALE_Z = 5
+    TRANSLATE_X = 6
+    TRANSLATE_Y = 7
+    TRANSLATE_Z = 8
+
+
+@dataclass
+class Bone:
+    __slots__ = ("position", "id", "parent_id")
+
+    position: Vector
+    id: int
+    # -1 for root bones
+    parent_id: int
+
+
+@dataclass
+class BoneSetup:
+    __slots__ = ("scale", "bones")
+
+    scale: float
+    bones: List[Bone]
+
+    @classmethod
+    def parse_bytes(cls: 'BoneSetup', data: bytes) -> 'BoneSetup':
+        scale, bone_count = BONE_SETUP_HEADER.unpack_from(data)
+        end = BONE_SETUP_HEADER.size + bone_count * BONE.size
+
+        if end > len(data):
+            raise ModelParseError(
+                f"Bone setup needs {end} bytes, only {len(data)} available"
+            )
+
+        bones = [
+            Bone(position=(x, y, z), id=bone_id, parent_id=parent_id)
+            for x, y, z, bone_id, parent_id
+            in BONE.iter_unpack(data[BONE_SETUP_HEADER.size:end])
+        ]
+
+        stats.count("animation.bones", len(bones))
+
+        return BoneSetup(scale=scale, bones=bones)
+
+    def parents(self) -> List[Optional[int]]:
+        """
+        Index of each bone's parent in `bones`, None for roots and bones whose
+        parent is missing.
+        """
+
+        index = {bone.id: i for i, bone in enumerate(self.bones)}
+
+        return [index.get(bone.parent_id) for bone in self.bones]
+
+
+@dataclass
+class AnimationTrack:
+    """
+    Keyframes of one transform component of one bone. `frames` and `values`
+    are NumPy arrays, values still in fixed point.
+    """
+
+    __slots__ = ("bone_id", "transform", "frames", "values")
+
+    bone_id: int
+    transform: Transform
+    frames: 'numpy.ndarray'
+    values: 'numpy.ndarray'
+
+
+@dataclass
+class SampledAnimation:
+    """
+    Every bone of a BoneSetup evaluated at every frame of an Animation. The
+    per bone arrays are indexed [bone, frame]. Translations are in N64 units
+    and include the bone's rest offset from its parent. `rotated`, `scaled`
+    and `translated` flag the bones that have any track of that kind.
+    """
+
+    __slots__ = (
+        "times", "rotations", "scales", "translations",
+        "rotated", "scaled", "translated",
+    )
+
+    times: 'numpy.ndarray'
+    rotations: 'numpy.ndarray'
+    scales: 'numpy.ndarray'
+    translations: 'numpy.ndarray'
+    rotated: 'numpy.ndarray'
+    scaled: 'numpy.ndarray'
+    translated: 'numpy.ndarray'
+
+
+@dataclass
+class Animation:
+    __slots__ = ("start_frame", "end_frame", "tracks")
+
+    start_frame: int
+    end_frame: int
+    tracks: List[AnimationTrack]
+
+    @classmethod
+    @stats.timed("animation_parse")
+    def parse_bytes(cls: 'Animation', data: bytes) -> 'Animation':
+        import numpy as np
+
+        require_bytes("Animation header", ANIMATION_HEADER.size, len(data))
+
+        start_frame, end_frame, track_count = ANIMATION_HEADER.unpack_from(data)
+        keyframe_type = np.dtype([("frame", ">u2"), ("value", ">i2")])
+
+        tracks = []
+        offset = ANIMATION_HEADER.size
+
+        for _ in range(track_count):
+            if offset + TRACK_HEADER.size > len(data):
+                raise ModelParseError(f"Animation track header at {offset} is out of bounds")
+
+            key, keyframe_count = TRACK_HEADER.unpack_from(data, offset)
+            offset += TRACK_HEADER.size
+
+            if offset + keyframe_count * KEYFRAME_SIZE > len(data):
+                raise ModelParseError(
+                    f"Animation track at {offset} needs {keyframe_count} keyframes,"
+                    f" only {(len(data) - offset) // KEYFRAME_SIZE} available"
+                )
+
+            keyframes = np.frombuffer(
+                data, dtype=keyframe_type, count=keyframe_count, offset=offset
+            )
+            offset += keyframe_count * KEYFRAME_SIZE
+
+            transform = key & 0xF
+
+            if transform > Transform.TRANSLATE_Z:
+                raise ModelParseError(f"Unknown animation transform {transform}")
+
+            tracks.append(AnimationTrack(
+                bone_id=key >> 4,
+                transform=Transform(transform),
+                frames=(keyframes["frame"] & FRAME_MASK).astype(np.float64),
+                values=keyframes["value"].astype(np.float64),
+            ))
+
+        stats.count("animation.tracks", len(tracks))
+
+        return Animation(start_frame=start_frame, end_frame=end_frame, tracks=tracks)
+
+    @property
+    def frame_count(self) -> int:
+        return max(self.end_frame - self.start_frame, 0) + 1
+
+    @stats.timed("animation_sample")
+    def sample(self, bone_setup: BoneSetup) -> SampledAnimation:
+        """
+        Evaluate the tracks at every frame for the bones of `bone_setup`.
+        Tracks of bones that aren't in the setup are ignored.
+        """
+
+        import numpy as np
+
+        bone_index = {bone.id: i for i, bone in enumerate(bone_setup.bones)}
+        bone_count = len(bone_setup.bones)
+
+        frames = np.arange(self.start_frame, self.start_frame + self.frame_count, dtype=np.float64)
+
+        # [bone, transform, frame], rotations and translations default to 0,
+        # scales to 1
+        channels = np.zeros((bone_count, len(Transform), len(frames)))
+        channels[:, Transform.SCALE_X:Transform.SCALE_Z + 1] = SCALE_UNITS
+        animated = np.zeros((bone_count, len(Transform)), dtype=bool)
+
+        for track in self.tracks:
+            bone = bone_index.get(track.bone_id)
+
+            if bone is None or not len(track.frames):
+                continue
+
+            order = np.argsort(track.frames, kind="stable")
+            channels[bone, track.transform] = np.interp(
+                frames, track.frames[order], track.values[order]
+            )
+            animated[bone, track.transform] = True
+
+        # Back to [bone, frame, axis]
+        channels = channels.transpose(0, 2, 1)
+
+        rotations = euler_to_quaternion(
+            np.radians(channels[..., Transform.ROTATE_X:Transform.ROTATE_Z + 1] / ROTATION_UNITS)
+        )
+
+        scales = channels[..., Transform.SCALE_X:Transform.SCALE_Z + 1] / SCALE_UNITS
+        translations = (
+            channels[..., Transform.TRANSLATE_X:Transform.TRANSLATE_Z + 1] / TRANSLATION_UNITS
+            + rest_translations(bone_setup)[:, None, :]
+        )
+
+        stats.count("animation.frames", len(frames))
+
+        return SampledAnimation(
+            times=(frames - self.start_frame) / FRAMES_PER_SECOND,
+            rotations=rotations,
+            scales=scales,
+            translations=translations,
+            rotated=animated[:, Transform.ROTATE_X:Transform.ROTATE_Z + 1].any(axis=1),
+            scaled=animated[:, Transform.SCALE_X:Transform.SCALE_Z + 1].any(axis=1),
+            translated=animated[:, Transform.TRANSLATE_X:Transform.TRANSLATE_Z + 1].any(axis=1),
+        )
+
+
+def rest_translations(bone_setup: BoneSetup) -> 'numpy.ndarray':
+    """
+    Offset of every bone's pivot from its parent's, shaped [bone, axis].
+    """
+
+    import numpy as np
+
+    positions = np.array(
+        [bone.position for bone in bone_setup.bones], dtype=np.float64
+    ).reshape(-1, 3)
+    parents = bone_setup.parents()
+
+    parent_positions = np.array([
+        positions[parent] if parent is not None else (0.0, 0.0, 0.0)
+        for parent in parents
+    ]).reshape(-1, 3)
+
+    return positions - parent_positions
+
+
+def quaternion_multiply(a: 'numpy.ndarray', b: 'numpy.ndarray') -> 'numpy.ndarray':
+    """
+    Hamilton product of (..., 4) arrays of XYZW quaternions.
+    """
+
+    import numpy as np
+
+    ax, ay, az, aw = np.moveaxis(a, -1, 0)
+    bx, by, bz, bw = np.moveaxis(b, -1, 0)
+
+    return np.stack([
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    ], axis=-1)
+
+
+def euler_to_quaternion(angles: 'numpy.ndarray') -> 'numpy.ndarray':
+    """
+    Convert (..., frame, 3) arrays of X, Y, Z rotations in radians to XYZW
+    quaternions. Rotations apply Z first, then X, then Y (R = Ry Rx Rz).
+
+    Neighbouring frames are kept in the same hemisphere, so linearly
+    interpolating between them never takes the long way round.
+    """
+
+    import numpy as np
+
+    half = np.asarray(angles, dtype=np.float64) / 2
+    sin = np.sin(half)
+    cos = np.cos(half)
+    zero = np.zeros_like(half[..., 0])
+
+    qx = np.stack([sin[..., 0], zero, zero, cos[..., 0]], axis=-1)
+    qy = np.stack([zero, sin[..., 1], zero, cos[..., 1]], axis=-1)
+    qz = np.stack([zero, zero, sin[..., 2], cos[..., 2]], axis=-1)
+
+    quaternions = quaternion_multiply(quaternion_multiply(qy, qx), qz)
+
+    if quaternions.ndim >= 2 and quaternions.shape[-2] > 1:
+        dots = np.sum(quaternions[..., 1:, :] * quaternions[..., :-1, :], axis=-1)
+        flips = np.cumprod(np.where(dots < 0, -1.0, 1.0), axis=-1)
+        quaternions[..., 1:, :] *= flips[..., None]
+
+    return quaternions
+
+
+@dataclass
+class Skin:
+    """
+    Everything `jtn64.glb.write_glb` needs to write a skeleton and its
+    animations. `vertex_joints` holds the bone index of every geometry
+    vertex, None binds everything to the first bone.
+    """
+
+    __slots__ = ("bone_setup", "animations", "vertex_joints")
+
+    bone_setup: BoneSetup
+    animations: List[Tuple[str, SampledAnimation]]
+    vertex_joints: Optional[Sequence[int]]
+
+
+def build_skin(bone_setup: BoneSetup, animations: Sequence[Tuple[str, Animation]],
+               vertex_joints: Optional[Sequence[int]] = None) -> Skin:
+    """
+    Sample named animations against `bone_setup`, ready for export.
+    """
+
+    if not bone_setup.bones:
+        raise ValueError("Bone setup has no bones")
+
+    return Skin(
+        bone_setup=bone_setup,
+        animations=[
+            (name, animation.sample(bone_setup)) for name, animation in animations
+        ],
+        vertex_joints=vertex_joints
+    )
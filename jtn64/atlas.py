@@ -0,0 +1,219 @@
+"""
+Texture atlas packing.
+
+`simulate_displaylist` starts a new mesh at every texture change, so a model
+with 20 textures turns into 20 draw calls. `build_atlas` packs every texture
+that doesn't tile into one image, remaps the UVs of the meshes using them and
+merges those meshes into one. Textures whose UVs leave the 0-1 range rely on
+wrapping, so they keep their own image and mesh.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import stats
+from .mesh import Geometry, Mesh
+
+# UVs this far outside 0-1 still count as not tiling
+UV_EPSILON = 1e-3
+
+# Pixels of edge padding around each packed texture, so linear filtering
+# doesn't bleed neighbours in.
+DEFAULT_PADDING = 2
+
+
+@dataclass
+class AtlasResult:
+    geometry: Geometry
+    # The atlas first (if anything was packed), then every texture that was
+    # left out of it.
+    images: list
+    # Source texture index -> (x, y) of its top left corner in the atlas
+    placements: Dict[int, Tuple[int, int]]
+
+
+def pack_rectangles(sizes: Sequence[Tuple[int, int]]) -> Tuple[int, int, List[Tuple[int, int]]]:
+    """
+    Shelf-pack rectangles, tallest first. Returns the atlas width, height and
+    the top left corner of every rectangle, in input order.
+    """
+
+    if not sizes:
+        return 0, 0, []
+
+    total_area = sum(w * h for w, h in sizes)
+    width = 1
+
+    while width * width < total_area or width < max(w for w, _ in sizes):
+        width *= 2
+
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    positions: List[Optional[Tuple[int, int]]] = [None] * len(sizes)
+
+    x = 0
+    y = 0
+    shelf_height = 0
+
+    for i in order:
+        w, h = sizes[i]
+
+        if x + w > width:
+            x = 0
+            y += shelf_height
+            shelf_height = 0
+
+        positions[i] = (x, y)
+
+        x += w
+        shelf_height = max(shelf_height, h)
+
+    return width, y + shelf_height, positions
+
+
+def tiling_textures(geometry: Geometry) -> set:
+    """
+    Texture indices that are sampled outside of the 0-1 UV range.
+    """
+
+    tiling = set()
+
+    for mesh in geometry.meshes:
+        if mesh.texture_index is None or mesh.texture_index in tiling:
+            continue
+
+        for triangle in mesh.indices:
+            if any(
+                c < -UV_EPSILON or c > 1 + UV_EPSILON
+                for vertex in triangle for c in geometry.uvs[vertex]
+            ):
+                tiling.add(mesh.texture_index)
+                break
+
+    return tiling
+
+
+def _padded(image, padding: int):
+    """
+    Copy of `image` with its edge pixels repeated `padding` times outwards.
+    """
+
+    from PIL import Image
+
+    width, height = image.size
+    result = Image.new("RGBA", (width + padding * 2, height + padding * 2))
+    result.paste(image, (padding, padding))
+
+    for i in range(padding):
+        result.paste(image.crop((0, 0, width, 1)), (padding, i))
+        result.paste(image.crop((0, height - 1, width, height)), (padding, padding + height + i))
+
+    for i in range(padding):
+        result.paste(result.crop((padding, 0, padding + 1, height + padding * 2)), (i, 0))
+        result.paste(
+            result.crop((padding + width - 1, 0, padding + width, height + padding * 2)),
+            (padding + width + i, 0)
+        )
+
+    return result
+
+
+@stats.timed("atlas")
+def build_atlas(geometry: Geometry, images: list, padding: int = DEFAULT_PADDING) -> AtlasResult:
+    """
+    Pack the non-tiling textures of `geometry` into one image. `images` holds
+    one RGBA PIL image per texture index.
+    """
+
+    from PIL import Image
+
+    tiling = tiling_textures(geometry)
+    atlased = [i for i in range(len(images)) if i not in tiling]
+
+    width, height, positions = pack_rectangles([
+        (images[i].width + padding * 2, images[i].height + padding * 2)
+        for i in atlased
+    ])
+
+    placements = {}
+    new_images = []
+
+    if atlased:
+        atlas = Image.new("RGBA", (width, height))
+
+        for i, (x, y) in zip(atlased, positions):
+            atlas.paste(_padded(images[i].convert("RGBA"), padding), (x, y))
+            placements[i] = (x + padding, y + padding)
+
+        new_images.append(atlas)
+
+    # Source texture index -> new image index, for textures left alone
+    texture_map = {}
+
+    for i in range(len(images)):
+        if i not in placements:
+            texture_map[i] = len(new_images)
+            new_images.append(images[i])
+
+    positions_out = []
+    colors_out = []
+    uvs_out = []
+    vertex_map: Dict[Tuple[int, Optional[int]], int] = {}
+
+    def remap(vertex, texture_index):
+        # Vertices used by an atlased texture need their own copy, since the
+        # same vertex can also be used with a different texture.
+        key = (vertex, texture_index if texture_index in placements else None)
+
+        new_vertex = vertex_map.get(key)
+
+        if new_vertex is None:
+            u, v = geometry.uvs[vertex]
+
+            if key[1] is not None:
+                x, y = placements[texture_index]
+                image = images[texture_index]
+
+                u = (x + u * image.width) / width
+                v = (y + v * image.height) / height
+
+            new_vertex = vertex_map[key] = len(positions_out)
+
+            positions_out.append(geometry.positions[vertex])
+            colors_out.append(geometry.colors[vertex])
+            uvs_out.append((u, v))
+
+        return new_vertex
+
+    atlas_mesh = Mesh(texture_index=0, indices=[], vertices=[])
+    meshes = []
+
+    for mesh in geometry.meshes:
+        indices = [
+            tuple(remap(vertex, mesh.texture_index) for vertex in triangle)
+            for triangle in mesh.indices
+        ]
+
+        if mesh.texture_index in placements:
+            if not atlas_mesh.indices:
+                meshes.append(atlas_mesh)
+
+            atlas_mesh.indices.extend(indices)
+        else:
+            meshes.append(Mesh(
+                texture_index=texture_map.get(mesh.texture_index),
+                indices=indices,
+                vertices=mesh.vertices
+            ))
+
+    stats.count("atlas.textures", len(placements))
+
+    return AtlasResult(
+        geometry=Geometry(
+            positions=positions_out,
+            colors=colors_out,
+            uvs=uvs_out,
+            meshes=meshes
+        ),
+        images=new_images,
+        placements=placements
+    )
@@ -0,0 +1,370 @@
+"""
+SQLite catalog of models.
+
+`Catalog.add_source` scans a ROM (or a single decompressed model file) and
+records every model it finds, so questions like "which models have more
+than 2000 triangles and use CI4 textures" become one indexed query instead
+of re-parsing every model:
+
+    SELECT DISTINCT models.hash, models.tri_count
+    FROM models JOIN textures ON textures.model_hash = models.hash
+    WHERE models.tri_count > 2000 AND textures.texture_type = 'CI4'
+
+Tables:
+
+- sources: one row per scanned file, with its size, mtime and SHA-1.
+- models: one row per distinct model, keyed by the SHA-1 of its
+  decompressed data. Holds the ModelHeader fields, counts, vertex bounds,
+  and `error` (the other columns NULL) if it didn't parse.
+- textures: one row per texture sub header of a model, plus the SHA-1 of
+  its data, so shared textures can be found across models.
+- occurrences: where each model was found (source and ROM offset, 0 for
+  model files).
+
+Updates are incremental: a source whose size and mtime (or failing that,
+hash) haven't changed is skipped, and models already in the catalog (from
+any source) aren't parsed again. Models recorded with an error are, since
+the error may have been a Budget that has since been raised.
+"""
+
+import hashlib
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from . import stats
+from .limits import Budget, ModelParseError
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    scanned_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS models (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    error TEXT,
+    geometry_layout_offset INTEGER,
+    texture_setup_offset INTEGER,
+    display_list_setup_offset INTEGER,
+    vertex_store_setup_offset INTEGER,
+    animation_setup_offset INTEGER,
+    collision_setup_offset INTEGER,
+    vert_count INTEGER,
+    tri_count INTEGER,
+    texture_count INTEGER,
+    command_count INTEGER,
+    vertex_count INTEGER,
+    bone_count INTEGER,
+    collision_tri_count INTEGER,
+    layout_node_count INTEGER,
+    min_x INTEGER, min_y INTEGER, min_z INTEGER,
+    max_x INTEGER, max_y INTEGER, max_z INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS textures (
+    model_hash TEXT NOT NULL REFERENCES models (hash) ON DELETE CASCADE,
+    texture_index INTEGER NOT NULL,
+    segment_address_offset INTEGER NOT NULL,
+    texture_type TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    texture_data_length INTEGER NOT NULL,
+    data_hash TEXT NOT NULL,
+    PRIMARY KEY (model_hash, texture_index)
+);
+
+CREATE TABLE IF NOT EXISTS occurrences (
+    source_id INTEGER NOT NULL REFERENCES sources (id) ON DELETE CASCADE,
+    offset INTEGER NOT NULL,
+    model_hash TEXT NOT NULL REFERENCES models (hash),
+    PRIMARY KEY (source_id, offset)
+);
+
+CREATE INDEX IF NOT EXISTS models_tri_count ON models (tri_count);
+CREATE INDEX IF NOT EXISTS models_vert_count ON models (vert_count);
+CREATE INDEX IF NOT EXISTS models_texture_count ON models (texture_count);
+CREATE INDEX IF NOT EXISTS textures_type ON textures (texture_type, model_hash);
+CREATE INDEX IF NOT EXISTS textures_data_hash ON textures (data_hash);
+CREATE INDEX IF NOT EXISTS occurrences_model ON occurrences (model_hash);
+"""
+
+MODEL_COLUMNS = (
+    "hash", "size", "error", "geometry_layout_offset", "texture_setup_offset",
+    "display_list_setup_offset", "vertex_store_setup_offset",
+    "animation_setup_offset", "collision_setup_offset", "vert_count",
+    "tri_count", "texture_count", "command_count", "vertex_count", "bone_count",
+    "collision_tri_count", "layout_node_count", "min_x", "min_y", "min_z",
+    "max_x", "max_y", "max_z",
+)
+
+TEXTURE_COLUMNS = (
+    "model_hash", "texture_index", "segment_address_offset", "texture_type",
+    "width", "height", "texture_data_length", "data_hash",
+)
+
+# Read size when hashing source files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SourceUpdate:
+    __slots__ = ("path", "skipped", "models", "new_models")
+
+    path: str
+    # The source was unchanged since it was last scanned
+    skipped: bool
+    # Models found in the source
+    models: int
+    # Models that were parsed: those that weren't in the catalog before, or
+    # were recorded with an error
+    new_models: int
+
+
+def _hash(data) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha1()
+
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def catalog_model(data: bytes, model_hash: Optional[str] = None,
+                  budget: Optional[Budget] = None) -> Tuple[dict, List[dict]]:
+    """
+    Parse a decompressed model into a models row and its textures rows. A
+    model that fails to parse, or goes over `budget`, gets a row with only
+    its hash, size and error.
+    """
+
+    from .model import Model
+
+    if model_hash is None:
+        model_hash = _hash(data)
+
+    row = dict.fromkeys(MODEL_COLUMNS)
+    row.update(hash=model_hash, size=len(data))
+
+    try:
+        if budget is None:
+            model = Model.parse_bytes(data)
+        else:
+            budget.check_size(len(data))
+
+            with budget.deadline():
+                model = Model.parse_bytes(data)
+    except ModelParseError as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+
+        return row, []
+
+    header = model.model_header
+    vertices = model.vertex_store_setup_header.vertices
+
+    row.update(
+        geometry_layout_offset=header.geometry_layout_offset,
+        texture_setup_offset=header.texture_setup_offset,
+        display_list_setup_offset=header.display_list_setup_offset,
+        vertex_store_setup_offset=header.vertex_store_setup_offset,
+        animation_setup_offset=header.animation_setup_offset,
+        collision_setup_offset=header.collision_setup_offset,
+        vert_count=header.vert_count,
+        tri_count=header.tri_count,
+        texture_count=model.texture_setup_header.texture_count,
+        command_count=model.display_list_setup_header.command_count,
+        vertex_count=len(vertices),
+        bone_count=len(model.bone_setup.bones) if model.bone_setup else 0,
+        collision_tri_count=len(model.collision.tris) if model.collision else 0,
+        layout_node_count=(
+            sum(1 for _ in model.geometry_layout.walk()) if model.geometry_layout else 0
+        ),
+    )
+
+    if vertices:
+        columns = list(zip(*(vertex.position for vertex in vertices)))
+
+        row.update(
+            min_x=min(columns[0]), min_y=min(columns[1]), min_z=min(columns[2]),
+            max_x=max(columns[0]), max_y=max(columns[1]), max_z=max(columns[2]),
+        )
+
+    # texture_data is in sub header order
+    textures = [
+        {
+            "model_hash": model_hash,
+            "texture_index": i,
+            "segment_address_offset": sub_header.segment_address_offset,
+            "texture_type": sub_header.texture_type.name,
+            "width": sub_header.width,
+            "height": sub_header.height,
+            "texture_data_length": sub_header.texture_data_length,
+            "data_hash": _hash(texture.data),
+        }
+        for i, (sub_header, texture) in enumerate(zip(
+            model.texture_setup_header.texture_sub_headers, model.texture_data
+        ))
+    ]
+
+    return row, textures
+
+
+def _insert(table: str, columns: Tuple[str, ...]) -> str:
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})"
+        f" VALUES ({', '.join(':' + column for column in columns)})"
+    )
+
+
+def _update(table: str, columns: Tuple[str, ...], key: str) -> str:
+    return (
+        f"UPDATE {table} SET {', '.join(f'{column} = :{column}' for column in columns)}"
+        f" WHERE {key} = :{key}"
+    )
+
+
+class Catalog:
+    def __init__(self, path, budget: Optional[Budget] = None):
+        # Applied to parsing each new model
+        self.budget = budget
+        self.connection = sqlite3.connect(str(path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(
+                f"{path} is a version {version} catalog, expected {SCHEMA_VERSION}"
+            )
+
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'Catalog':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sql: str, parameters=()) -> List[sqlite3.Row]:
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def _iter_source_models(self, path: Path, byte_order) -> Iterator[Tuple[int, bytes]]:
+        from .rom import iter_models, open_rom
+
+        if byte_order is None:
+            yield 0, path.read_bytes()
+
+            return
+
+        with open_rom(path, byte_order) as rom_data:
+            yield from iter_models(rom_data)
+
+    @stats.timed("catalog_add")
+    def add_source(self, path, force: bool = False) -> SourceUpdate:
+        """
+        Catalog every model in `path`, a ROM in any byte order or a
+        decompressed model file, replacing what was recorded for it before.
+        Unchanged sources are skipped unless `force`.
+        """
+
+        from .rom import detect_byte_order
+
+        path = Path(path)
+        key = str(path.resolve())
+        status = path.stat()
+
+        source = self.connection.execute(
+            "SELECT id, size, mtime_ns, hash FROM sources WHERE path = ?", (key,)
+        ).fetchone()
+
+        if source is not None and not force and (
+            source["size"], source["mtime_ns"]
+        ) == (status.st_size, status.st_mtime_ns):
+            return SourceUpdate(key, skipped=True, models=0, new_models=0)
+
+        source_hash = _hash_file(path)
+
+        if source is not None and not force and source["hash"] == source_hash:
+            # Touched but not modified
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE sources SET mtime_ns = ? WHERE id = ?",
+                    (status.st_mtime_ns, source["id"])
+                )
+
+            return SourceUpdate(key, skipped=True, models=0, new_models=0)
+
+        found = 0
+        new = 0
+
+        with self.connection:
+            if source is not None:
+                self.connection.execute("DELETE FROM sources WHERE id = ?", (source["id"],))
+
+            with path.open("rb") as f:
+                byte_order = detect_byte_order(f.read(4))
+
+            source_id = self.connection.execute(
+                "INSERT INTO sources (path, kind, size, mtime_ns, hash, scanned_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key, "model" if byte_order is None else "rom", status.st_size,
+                    status.st_mtime_ns, source_hash, time.time()
+                )
+            ).lastrowid
+
+            for offset, data in self._iter_source_models(path, byte_order):
+                model_hash = _hash(data)
+                found += 1
+
+                known = self.connection.execute(
+                    "SELECT error FROM models WHERE hash = ?", (model_hash,)
+                ).fetchone()
+
+                # Failures are retried, in case they were over a smaller budget
+                if known is None or known["error"] is not None:
+                    row, textures = catalog_model(data, model_hash, self.budget)
+
+                    if known is None:
+                        self.connection.execute(_insert("models", MODEL_COLUMNS), row)
+                    else:
+                        self.connection.execute(_update("models", MODEL_COLUMNS, "hash"), row)
+
+                    self.connection.executemany(_insert("textures", TEXTURE_COLUMNS), textures)
+                    new += 1
+
+                self.connection.execute(
+                    "INSERT INTO occurrences (source_id, offset, model_hash) VALUES (?, ?, ?)",
+                    (source_id, offset, model_hash)
+                )
+
+            # Models only the replaced scan referenced
+            self.connection.execute(
+                "DELETE FROM models WHERE hash NOT IN (SELECT model_hash FROM occurrences)"
+            )
+
+        stats.count("catalog.models", found)
+        stats.count("catalog.new_models", new)
+
+        return SourceUpdate(key, skipped=False, models=found, new_models=new)
@@ -0,0 +1,202 @@
+"""
+Spatially chunked export.
+
+Level models are big enough that loading them all-or-nothing hurts.
+`iter_chunks` sorts the triangles of a Geometry into a uniform grid of
+`chunk_size` N64 units by centroid, and yields one self contained Geometry
+per occupied cell. `write_chunks` writes each one as its own GLB as soon as
+it's built, plus an index of every chunk's bounds so a client can stream in
+only what it can see.
+
+Only one chunk is alive at a time: beyond the source geometry, the extra
+memory is a cell number per triangle and the current chunk.
+"""
+
+import json
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from . import stats
+from .glb import POSITION_SCALE, write_glb
+from .mesh import Geometry, Mesh
+
+Cell = Tuple[int, int, int]
+
+INDEX_FILENAME = "index.json"
+
+
+@dataclass
+class Chunk:
+    __slots__ = ("cell", "bounds", "geometry", "textures")
+
+    # Grid coordinates, the chunk covers [cell * chunk_size, (cell + 1) * chunk_size)
+    # on each axis (by triangle centroid; triangles can stick out of it)
+    cell: Cell
+    # (min, max) of the chunk's vertices in N64 units
+    bounds: Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+    # Meshes are merged per texture, and their texture indices point into
+    # `textures`
+    geometry: Geometry
+    # Source texture index of each of the chunk's textures
+    textures: List[int]
+
+
+def _triangle_cell(geometry: Geometry, triangle, chunk_size: int) -> Cell:
+    a, b, c = (geometry.positions[v] for v in triangle)
+
+    return tuple(int((a[i] + b[i] + c[i]) / 3 // chunk_size) for i in range(3))
+
+
+def _build_chunk(geometry: Geometry, cell: Cell, triangles: Sequence[Tuple[int, tuple]]) -> Chunk:
+    """
+    Gather `triangles`, (mesh index, triangle) pairs in draw order, into a
+    Geometry holding only the vertices they use.
+    """
+
+    positions = []
+    colors = []
+    uvs = []
+    remap: Dict[int, int] = {}
+
+    # Source texture index -> mesh, in order of first use
+    meshes: Dict[object, Mesh] = {}
+
+    for mesh_index, triangle in triangles:
+        texture_index = geometry.meshes[mesh_index].texture_index
+        mesh = meshes.get(texture_index)
+
+        if mesh is None:
+            mesh = meshes[texture_index] = Mesh(texture_index=texture_index, indices=[], vertices=[])
+
+        for vertex in triangle:
+            if vertex not in remap:
+                remap[vertex] = len(positions)
+                positions.append(geometry.positions[vertex])
+                colors.append(geometry.colors[vertex])
+                uvs.append(geometry.uvs[vertex])
+
+        mesh.indices.append(tuple(remap[vertex] for vertex in triangle))
+
+    textures = [i for i in meshes if i is not None]
+
+    for mesh in meshes.values():
+        if mesh.texture_index is not None:
+            mesh.texture_index = textures.index(mesh.texture_index)
+
+    columns = list(zip(*positions))
+
+    return Chunk(
+        cell=cell,
+        bounds=(tuple(min(c) for c in columns), tuple(max(c) for c in columns)),
+        geometry=Geometry(positions=positions, colors=colors, uvs=uvs, meshes=list(meshes.values())),
+        textures=textures
+    )
+
+
+def iter_chunks(geometry: Geometry, chunk_size: int) -> Iterator[Chunk]:
+    """
+    Yield a Chunk for every grid cell of `chunk_size` N64 units holding at
+    least one triangle centroid, in the order the cells are first drawn in.
+    """
+
+    if chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}")
+
+    # Cell number of every triangle, triangles numbered across meshes in
+    # draw order
+    cell_numbers: Dict[Cell, int] = {}
+    triangle_cells = array("I")
+    mesh_starts = []
+
+    for mesh in geometry.meshes:
+        mesh_starts.append(len(triangle_cells))
+
+        for triangle in mesh.indices:
+            cell = _triangle_cell(geometry, triangle, chunk_size)
+            triangle_cells.append(cell_numbers.setdefault(cell, len(cell_numbers)))
+
+    cells = sorted(cell_numbers, key=cell_numbers.get)
+
+    # Counting sort of the triangle numbers by cell, which keeps every
+    # cell's triangles in draw order
+    ends = [0] * len(cells)
+
+    for cell_number in triangle_cells:
+        ends[cell_number] += 1
+
+    for i in range(1, len(ends)):
+        ends[i] += ends[i - 1]
+
+    order = array("I", [0]) * len(triangle_cells)
+    fill = [0] + ends[:-1]
+
+    for triangle_number, cell_number in enumerate(triangle_cells):
+        order[fill[cell_number]] = triangle_number
+        fill[cell_number] += 1
+
+    del fill
+
+    for cell_number, end in enumerate(ends):
+        start = ends[cell_number - 1] if cell_number else 0
+        triangles = []
+
+        for triangle_number in order[start:end]:
+            mesh_index = bisect_right(mesh_starts, triangle_number) - 1
+            triangles.append((
+                mesh_index,
+                geometry.meshes[mesh_index].indices[triangle_number - mesh_starts[mesh_index]]
+            ))
+
+        yield _build_chunk(geometry, cells[cell_number], triangles)
+
+
+def chunk_filename(name: str, cell: Cell) -> str:
+    return f"{name}_{cell[0]}_{cell[1]}_{cell[2]}.glb"
+
+
+@stats.timed("chunk_write")
+def write_chunks(directory: Path, name: str, geometry: Geometry, image_uris: Sequence[str],
+                 chunk_size: int, quantize: bool = False) -> dict:
+    """
+    Write one GLB per chunk of `geometry` into `directory`, then the chunk
+    index (INDEX_FILENAME). Each chunk only gets the images it uses, so
+    `image_uris` should be relative file names rather than data URIs, or
+    every chunk embeds its own copy. Returns the index.
+    """
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    index = {
+        "name": name,
+        "chunk_size": chunk_size,
+        # Chunk bounds are in exported units, like the GLB positions
+        "scale": 1 / POSITION_SCALE,
+        "chunks": [],
+    }
+
+    for chunk in iter_chunks(geometry, chunk_size):
+        filename = chunk_filename(name, chunk.cell)
+
+        with (directory / filename).open("wb") as f:
+            written = write_glb(
+                f, chunk.geometry, [image_uris[i] for i in chunk.textures], quantize
+            )
+
+        index["chunks"].append({
+            "file": filename,
+            "cell": list(chunk.cell),
+            "min": [c / POSITION_SCALE for c in chunk.bounds[0]],
+            "max": [c / POSITION_SCALE for c in chunk.bounds[1]],
+            "triangles": sum(len(mesh.indices) for mesh in chunk.geometry.meshes),
+            "vertices": len(chunk.geometry.positions),
+            "bytes": written,
+        })
+
+    (directory / INDEX_FILENAME).write_text(json.dumps(index, indent=2) + "\n")
+
+    stats.count("chunk_write.chunks", len(index["chunks"]))
+
+    return index
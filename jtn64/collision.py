@@ -0,0 +1,899 @@
+"""
+Collision geometry.
+
+The collision setup of a model is a header describing a grid of cells over
+the model's bounding box, one (start, count) range of triangles per cell,
+then the triangles themselves. Collision triangles index into the model's
+vertex store, like the display list does.
+
+`CollisionBVH` indexes the triangles for ray, segment and nearest point
+queries. The hierarchy lives in flat arrays rather than node objects: nodes
+are stored depth first, so a node's left child is always the next node and
+only the right child's index has to be kept.
+
+The `*_many` queries run a whole batch through the tree at once with NumPy:
+each step tests every live (query, node) pair, leaves test all of their
+triangles against all of their queries, and pairs that can't beat their
+query's best result so far are dropped.
+"""
+
+import math
+from array import array
+from dataclasses import dataclass
+from struct import Struct
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from . import stats
+from .limits import ModelParseError
+
+Vector = Tuple[float, float, float]
+
+HEADER = Struct(">3h3hhhhhh2x")
+GEO = Struct(">hh")
+TRI = Struct(">3HHI")
+
+# Triangles per BVH leaf
+LEAF_SIZE = 4
+
+# Rays closer to parallel with a triangle than this miss it
+EPSILON = 1e-9
+
+
+@dataclass
+class CollisionGeo:
+    """
+    One grid cell: a range of `CollisionList.tris`.
+    """
+
+    __slots__ = ("start", "count")
+
+    start: int
+    count: int
+
+
+@dataclass
+class CollisionTri:
+    __slots__ = ("vertices", "unknown", "flags")
+
+    vertices: Tuple[int, int, int]
+    unknown: int
+    flags: int
+
+
+@dataclass
+class CollisionList:
+    __slots__ = ("min", "max", "y_stride", "z_stride", "scale", "geos", "tris")
+
+    min: Tuple[int, int, int]
+    max: Tuple[int, int, int]
+    y_stride: int
+    z_stride: int
+    scale: int
+    geos: List[CollisionGeo]
+    tris: List[CollisionTri]
+
+    @classmethod
+    def parse_bytes(cls: 'CollisionList', data: bytes,
+                    vertex_count: Optional[int] = None) -> 'CollisionList':
+        """
+        With `vertex_count` (the size of the model's vertex store), every
+        triangle's vertex indices are checked against it.
+        """
+
+        fields = HEADER.unpack_from(data)
+        geo_count, scale, tri_count = fields[8:11]
+
+        geo_start = HEADER.size
+        tri_start = geo_start + geo_count * GEO.size
+        tri_end = tri_start + tri_count * TRI.size
+
+        if tri_end > len(data):
+            raise ModelParseError(
+                f"Collision data needs {tri_end} bytes, only {len(data)} available"
+            )
+
+        geos = [
+            CollisionGeo(start=start, count=count)
+            for start, count in GEO.iter_unpack(data[geo_start:tri_start])
+        ]
+        tris = [
+            CollisionTri(vertices=(a, b, c), unknown=unknown, flags=flags)
+            for a, b, c, unknown, flags in TRI.iter_unpack(data[tri_start:tri_end])
+        ]
+
+        if vertex_count is not None:
+            for i, tri in enumerate(tris):
+                if max(tri.vertices) >= vertex_count:
+                    raise ModelParseError(
+                        f"Collision triangle {i} uses vertex {max(tri.vertices)},"
+                        f" past the {vertex_count} in the vertex store"
+                    )
+
+        stats.count("collision.triangles", len(tris))
+
+        return CollisionList(
+            min=fields[0:3],
+            max=fields[3:6],
+            y_stride=fields[6],
+            z_stride=fields[7],
+            scale=scale,
+            geos=geos,
+            tris=tris
+        )
+
+    def to_mesh(self, positions: Sequence[Vector]) -> Tuple[List[Vector], List[Tuple[int, int, int]]]:
+        """
+        The collision triangles as their own vertex and index lists, holding
+        only the vertices they use.
+        """
+
+        remap = {}
+        vertices = []
+        indices = []
+
+        for tri in self.tris:
+            triangle = []
+
+            for vertex in tri.vertices:
+                if vertex not in remap:
+                    remap[vertex] = len(vertices)
+                    vertices.append(positions[vertex])
+
+                triangle.append(remap[vertex])
+
+            indices.append(tuple(triangle))
+
+        return vertices, indices
+
+    def build_bvh(self, positions: Sequence[Vector]) -> 'CollisionBVH':
+        """
+        Index the triangles, with vertex positions taken from `positions`
+        (usually the model's vertex store).
+        """
+
+        return CollisionBVH(
+            [tuple(positions[v] for v in tri.vertices) for tri in self.tris]
+        )
+
+
+@dataclass
+class RayHit:
+    __slots__ = ("distance", "triangle", "point")
+
+    distance: float
+    # Index into the triangles the BVH was built from
+    triangle: int
+    point: Vector
+
+
+@dataclass
+class NearestPoint:
+    __slots__ = ("distance", "triangle", "point")
+
+    distance: float
+    triangle: int
+    point: Vector
+
+
+def closest_point_on_triangle(p, a, b, c) -> Vector:
+    """
+    Real-Time Collision Detection, 5.1.5.
+    """
+
+    ab = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+    ac = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+    ap = (p[0] - a[0], p[1] - a[1], p[2] - a[2])
+
+    d1 = ab[0] * ap[0] + ab[1] * ap[1] + ab[2] * ap[2]
+    d2 = ac[0] * ap[0] + ac[1] * ap[1] + ac[2] * ap[2]
+
+    if d1 <= 0 and d2 <= 0:
+        return a
+
+    bp = (p[0] - b[0], p[1] - b[1], p[2] - b[2])
+    d3 = ab[0] * bp[0] + ab[1] * bp[1] + ab[2] * bp[2]
+    d4 = ac[0] * bp[0] + ac[1] * bp[1] + ac[2] * bp[2]
+
+    if d3 >= 0 and d4 <= d3:
+        return b
+
+    vc = d1 * d4 - d3 * d2
+
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        v = d1 / (d1 - d3)
+        return (a[0] + v * ab[0], a[1] + v * ab[1], a[2] + v * ab[2])
+
+    cp = (p[0] - c[0], p[1] - c[1], p[2] - c[2])
+    d5 = ab[0] * cp[0] + ab[1] * cp[1] + ab[2] * cp[2]
+    d6 = ac[0] * cp[0] + ac[1] * cp[1] + ac[2] * cp[2]
+
+    if d6 >= 0 and d5 <= d6:
+        return c
+
+    vb = d5 * d2 - d1 * d6
+
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        w = d2 / (d2 - d6)
+        return (a[0] + w * ac[0], a[1] + w * ac[1], a[2] + w * ac[2])
+
+    va = d3 * d6 - d5 * d4
+
+    if va <= 0 and (d4 - d3) >= 0 and (d5 - d6) >= 0:
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        return (b[0] + w * (c[0] - b[0]), b[1] + w * (c[1] - b[1]), b[2] + w * (c[2] - b[2]))
+
+    denominator = 1 / (va + vb + vc)
+    v = vb * denominator
+    w = vc * denominator
+
+    return (
+        a[0] + ab[0] * v + ac[0] * w,
+        a[1] + ab[1] * v + ac[1] * w,
+        a[2] + ab[2] * v + ac[2] * w,
+    )
+
+
+def _dot(a, b):
+    # Summed in the same order as the scalar code, so results match it
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+
+def _closest_points(p, a, b, c):
+    """
+    `closest_point_on_triangle` for (n, 3) arrays of points and corners.
+    Every region's answer is computed, then picked in reverse order of the
+    scalar version's tests, so the first test that matches wins.
+    """
+
+    import numpy as np
+
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+
+    bp = p - b
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+
+    cp = p - c
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+
+    vc = d1 * d4 - d3 * d2
+    vb = d5 * d2 - d1 * d6
+    va = d3 * d6 - d5 * d4
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = 1 / (va + vb + vc)
+        v = (vb * denominator)[:, None]
+        w = (vc * denominator)[:, None]
+        result = a + ab * v + ac * w
+
+        regions = [
+            (
+                (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+                lambda: b + ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None] * (c - b)
+            ),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda: a + (d2 / (d2 - d6))[:, None] * ac),
+            ((d6 >= 0) & (d5 <= d6), lambda: c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda: a + (d1 / (d1 - d3))[:, None] * ab),
+            ((d3 >= 0) & (d4 <= d3), lambda: b),
+            ((d1 <= 0) & (d2 <= 0), lambda: a),
+        ]
+
+        for mask, value in regions:
+            if mask.any():
+                result = np.where(mask[:, None], value(), result)
+
+    return result
+
+
+class CollisionBVH:
+    """
+    Bounding volume hierarchy over a list of triangles, each given as three
+    (x, y, z) positions.
+
+    Flat layout, per node n:
+        bounds[n * 6:n * 6 + 6]  min x, y, z, max x, y, z
+        counts[n]                triangles in a leaf, or -1 - split axis for
+                                 inner nodes
+        offsets[n]               first triangle of a leaf, or the right child
+    and per triangle t (in leaf order):
+        coords[t * 9:t * 9 + 9]  the three corners
+        order[t]                 index of the triangle it was built from
+    """
+
+    def __init__(self, triangles: Sequence[Sequence[Vector]]):
+        self.triangle_count = len(triangles)
+
+        self.bounds = array("d")
+        self.counts = array("l")
+        self.offsets = array("l")
+        self.order = array("l")
+        self.coords = array("d")
+
+        with stats.timer("collision_bvh"):
+            if triangles:
+                self._build(triangles)
+
+        stats.count("collision.nodes", len(self.counts))
+
+        # NumPy copies of the flat arrays, made by the first batch query
+        self._arrays = None
+
+    def _numpy_arrays(self):
+        """
+        (bounds, counts, offsets, coords, corners) as NumPy arrays. bounds
+        and coords are transposed to one row per component (6 x nodes and
+        9 x triangles), which makes the per node and per triangle gathers
+        one dimensional. corners is coords as triangles x 3 x 3.
+        """
+
+        import numpy as np
+
+        if self._arrays is None:
+            corners = np.array(self.coords, dtype=np.float64).reshape(-1, 3, 3)
+
+            self._arrays = (
+                np.ascontiguousarray(np.array(self.bounds, dtype=np.float64).reshape(-1, 6).T),
+                np.array(self.counts, dtype=np.int64),
+                np.array(self.offsets, dtype=np.int64),
+                np.ascontiguousarray(corners.reshape(-1, 9).T),
+                corners,
+            )
+
+        return self._arrays
+
+    def _leaf_triangles(self, queries, nodes):
+        """
+        Expand (query, leaf) pairs into (query, triangle) pairs.
+        """
+
+        import numpy as np
+
+        _, counts, offsets, _, _ = self._numpy_arrays()
+        node_counts = counts[nodes]
+
+        pair_queries = []
+        pair_triangles = []
+
+        for k in range(LEAF_SIZE):
+            has = node_counts > k
+            pair_queries.append(queries[has])
+            pair_triangles.append(offsets[nodes[has]] + k)
+
+        return np.concatenate(pair_queries), np.concatenate(pair_triangles)
+
+    def _descend(self, queries, nodes):
+        """
+        (query, child) pairs for the inner nodes among `nodes`, and the
+        (query, node) pairs of the leaves.
+        """
+
+        import numpy as np
+
+        _, counts, offsets, _, _ = self._numpy_arrays()
+        inner = counts[nodes] < 0
+
+        inner_queries = queries[inner]
+        inner_nodes = nodes[inner]
+
+        return (
+            np.concatenate((inner_queries, inner_queries)),
+            np.concatenate((inner_nodes + 1, offsets[inner_nodes])),
+            queries[~inner],
+            nodes[~inner],
+        )
+
+    def _build(self, triangles):
+        boxes = []
+        centroids = []
+
+        for a, b, c in triangles:
+            boxes.append((
+                min(a[0], b[0], c[0]), min(a[1], b[1], c[1]), min(a[2], b[2], c[2]),
+                max(a[0], b[0], c[0]), max(a[1], b[1], c[1]), max(a[2], b[2], c[2]),
+            ))
+            centroids.append((
+                (a[0] + b[0] + c[0]) / 3,
+                (a[1] + b[1] + c[1]) / 3,
+                (a[2] + b[2] + c[2]) / 3,
+            ))
+
+        # (node index to patch with its right child, or -1; triangle indices)
+        stack = [(-1, list(range(len(triangles))))]
+
+        while stack:
+            parent, items = stack.pop()
+            node = len(self.counts)
+
+            if parent >= 0:
+                self.offsets[parent] = node
+
+            self.bounds.extend((
+                min(boxes[i][0] for i in items),
+                min(boxes[i][1] for i in items),
+                min(boxes[i][2] for i in items),
+                max(boxes[i][3] for i in items),
+                max(boxes[i][4] for i in items),
+                max(boxes[i][5] for i in items),
+            ))
+
+            if len(items) <= LEAF_SIZE:
+                self.counts.append(len(items))
+                self.offsets.append(len(self.order))
+
+                for i in items:
+                    self.order.append(i)
+
+                    for corner in triangles[i]:
+                        self.coords.extend(corner)
+
+                continue
+
+            # Median split along the axis the centroids spread most on
+            spans = [
+                max(centroids[i][axis] for i in items) - min(centroids[i][axis] for i in items)
+                for axis in range(3)
+            ]
+            axis = spans.index(max(spans))
+
+            items.sort(key=lambda i: centroids[i][axis])
+            middle = len(items) // 2
+
+            self.counts.append(-1 - axis)
+            self.offsets.append(-1)
+
+            # The left half is popped first so it lands right after its
+            # parent.
+            stack.append((node, items[middle:]))
+            stack.append((-1, items[:middle]))
+
+    def raycast(self, origin: Vector, direction: Vector,
+                max_distance: float = math.inf) -> Optional[RayHit]:
+        """
+        Nearest triangle hit by the ray, within `max_distance` along it.
+        Distances are in units of `direction`'s length.
+        """
+
+        if not self.counts:
+            return None
+
+        ox, oy, oz = origin
+        dx, dy, dz = direction
+
+        inv_x = 1 / dx if dx else math.inf
+        inv_y = 1 / dy if dy else math.inf
+        inv_z = 1 / dz if dz else math.inf
+
+        bounds = self.bounds
+        counts = self.counts
+        offsets = self.offsets
+        coords = self.coords
+
+        best_t = max_distance
+        best_triangle = -1
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            b = node * 6
+
+            # Slab test. 0 * inf gives nan for rays parallel to a slab they
+            # start on the boundary of; treat that as inside.
+            t1 = (bounds[b] - ox) * inv_x
+            t2 = (bounds[b + 3] - ox) * inv_x
+            t_near = min(t1, t2) if t1 == t1 and t2 == t2 else -math.inf
+            t_far = max(t1, t2) if t1 == t1 and t2 == t2 else math.inf
+
+            t1 = (bounds[b + 1] - oy) * inv_y
+            t2 = (bounds[b + 4] - oy) * inv_y
+
+            if t1 == t1 and t2 == t2:
+                t_near = max(t_near, min(t1, t2))
+                t_far = min(t_far, max(t1, t2))
+
+            t1 = (bounds[b + 2] - oz) * inv_z
+            t2 = (bounds[b + 5] - oz) * inv_z
+
+            if t1 == t1 and t2 == t2:
+                t_near = max(t_near, min(t1, t2))
+                t_far = min(t_far, max(t1, t2))
+
+            if t_near > t_far or t_far < 0 or t_near > best_t:
+                continue
+
+            count = counts[node]
+
+            if count < 0:
+                # Visit the child on the ray's side of the split first, so
+                # hits found there can cull the other one.
+                if direction[-1 - count] >= 0:
+                    stack.append(offsets[node])
+                    stack.append(node + 1)
+                else:
+                    stack.append(node + 1)
+                    stack.append(offsets[node])
+
+                continue
+
+            start = offsets[node]
+
+            for t in range(start, start + count):
+                c = t * 9
+
+                ax, ay, az = coords[c], coords[c + 1], coords[c + 2]
+                e1x, e1y, e1z = coords[c + 3] - ax, coords[c + 4] - ay, coords[c + 5] - az
+                e2x, e2y, e2z = coords[c + 6] - ax, coords[c + 7] - ay, coords[c + 8] - az
+
+                # Möller–Trumbore
+                px = dy * e2z - dz * e2y
+                py = dz * e2x - dx * e2z
+                pz = dx * e2y - dy * e2x
+                det = e1x * px + e1y * py + e1z * pz
+
+                if -EPSILON < det < EPSILON:
+                    continue
+
+                inv_det = 1 / det
+                sx, sy, sz = ox - ax, oy - ay, oz - az
+                u = (sx * px + sy * py + sz * pz) * inv_det
+
+                if u < 0 or u > 1:
+                    continue
+
+                qx = sy * e1z - sz * e1y
+                qy = sz * e1x - sx * e1z
+                qz = sx * e1y - sy * e1x
+                v = (dx * qx + dy * qy + dz * qz) * inv_det
+
+                if v < 0 or u + v > 1:
+                    continue
+
+                distance = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+
+                if 0 <= distance < best_t:
+                    best_t = distance
+                    best_triangle = t
+
+        if best_triangle < 0:
+            return None
+
+        return RayHit(
+            distance=best_t,
+            triangle=self.order[best_triangle],
+            point=(ox + dx * best_t, oy + dy * best_t, oz + dz * best_t)
+        )
+
+    def raycast_many(self, rays: Iterable[Tuple[Vector, Vector]],
+                     max_distance: float = math.inf) -> List[Optional[RayHit]]:
+        """
+        `raycast` for a batch of (origin, direction) pairs, or an (n, 2, 3)
+        array of them.
+        """
+
+        import numpy as np
+
+        rays = np.asarray(
+            rays if isinstance(rays, np.ndarray) else list(rays), dtype=np.float64
+        ).reshape(-1, 2, 3)
+
+        return self._raycast_batch(rays[:, 0], rays[:, 1], max_distance)
+
+    @stats.timed("collision_raycast_many")
+    def _raycast_batch(self, origins, directions, max_distance: float) -> List[Optional[RayHit]]:
+        import numpy as np
+
+        ray_count = len(origins)
+        best_t = np.full(ray_count, float(max_distance))
+        best_triangle = np.full(ray_count, -1)
+
+        if self.counts and ray_count:
+            bounds, _, _, coords, _ = self._numpy_arrays()
+            origin_rows = np.ascontiguousarray(origins.T)
+            direction_rows = np.ascontiguousarray(directions.T)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Like `raycast`, a zero component gets +inf whatever its sign
+                inverse_rows = np.where(direction_rows != 0, 1 / direction_rows, math.inf)
+
+                rays = np.arange(ray_count)
+                nodes = np.zeros(ray_count, dtype=np.int64)
+
+                while len(rays):
+                    t_near = np.full(len(rays), -math.inf)
+                    t_far = np.full(len(rays), math.inf)
+
+                    for axis in range(3):
+                        origin = origin_rows[axis][rays]
+                        inverse = inverse_rows[axis][rays]
+                        t1 = (bounds[axis][nodes] - origin) * inverse
+                        t2 = (bounds[axis + 3][nodes] - origin) * inverse
+
+                        # Slab test. An axis giving nan (a ray parallel to a
+                        # slab it starts on the boundary of) is skipped by
+                        # fmax and fmin, as in `raycast`.
+                        t_near = np.fmax(t_near, np.minimum(t1, t2))
+                        t_far = np.fmin(t_far, np.maximum(t1, t2))
+
+                    hit = (t_near <= t_far) & (t_far >= 0) & (t_near <= best_t[rays])
+                    rays, nodes, leaf_rays, leaves = self._descend(rays[hit], nodes[hit])
+
+                    if len(leaf_rays):
+                        self._intersect(
+                            origin_rows, direction_rows, coords, best_t, best_triangle,
+                            *self._leaf_triangles(leaf_rays, leaves)
+                        )
+
+        stats.count("collision.rays", ray_count)
+
+        order = self.order
+        hits = []
+
+        for (ox, oy, oz), (dx, dy, dz), t, triangle in zip(
+            origins.tolist(), directions.tolist(), best_t.tolist(), best_triangle.tolist()
+        ):
+            if triangle < 0:
+                hits.append(None)
+            else:
+                hits.append(RayHit(
+                    distance=t, triangle=order[triangle],
+                    point=(ox + dx * t, oy + dy * t, oz + dz * t)
+                ))
+
+        return hits
+
+    @staticmethod
+    def _intersect(origin_rows, direction_rows, coords, best_t, best_triangle, rays, triangles):
+        """
+        Möller–Trumbore for (ray, triangle) pairs, keeping the nearest hit
+        of each ray in `best_t` and `best_triangle`. Written out per
+        component like `raycast`, so the results match it exactly.
+        """
+
+        import numpy as np
+
+        ax, ay, az = coords[0][triangles], coords[1][triangles], coords[2][triangles]
+        e1x, e1y, e1z = coords[3][triangles] - ax, coords[4][triangles] - ay, coords[5][triangles] - az
+        e2x, e2y, e2z = coords[6][triangles] - ax, coords[7][triangles] - ay, coords[8][triangles] - az
+        dx, dy, dz = direction_rows[0][rays], direction_rows[1][rays], direction_rows[2][rays]
+
+        px = dy * e2z - dz * e2y
+        py = dz * e2x - dx * e2z
+        pz = dx * e2y - dy * e2x
+        det = e1x * px + e1y * py + e1z * pz
+
+        inverse_det = 1 / det
+        sx = origin_rows[0][rays] - ax
+        sy = origin_rows[1][rays] - ay
+        sz = origin_rows[2][rays] - az
+        u = (sx * px + sy * py + sz * pz) * inverse_det
+
+        qx = sy * e1z - sz * e1y
+        qy = sz * e1x - sx * e1z
+        qz = sx * e1y - sy * e1x
+        v = (dx * qx + dy * qy + dz * qz) * inverse_det
+        distance = (e2x * qx + e2y * qy + e2z * qz) * inverse_det
+
+        hit = (
+            (np.abs(det) >= EPSILON) & (u >= 0) & (u <= 1) & (v >= 0) & (u + v <= 1)
+            & (distance >= 0) & (distance < best_t[rays])
+        )
+        rays, triangles, distance = rays[hit], triangles[hit], distance[hit]
+
+        # Nearest hit per ray
+        order = np.lexsort((triangles, distance, rays))
+        rays, triangles, distance = rays[order], triangles[order], distance[order]
+        first = np.ones(len(rays), dtype=bool)
+        first[1:] = rays[1:] != rays[:-1]
+
+        best_t[rays[first]] = distance[first]
+        best_triangle[rays[first]] = triangles[first]
+
+    def segment_cast(self, start: Vector, end: Vector) -> Optional[RayHit]:
+        """
+        First triangle crossed going from `start` to `end`. The hit distance
+        is a fraction of the segment, from 0 to 1.
+        """
+
+        return self.raycast(
+            start, (end[0] - start[0], end[1] - start[1], end[2] - start[2]), 1.0
+        )
+
+    def segment_cast_many(self, segments: Iterable[Tuple[Vector, Vector]]) -> List[Optional[RayHit]]:
+        """
+        `segment_cast` for a batch of (start, end) pairs, or an (n, 2, 3)
+        array of them.
+        """
+
+        import numpy as np
+
+        segments = np.asarray(
+            segments if isinstance(segments, np.ndarray) else list(segments),
+            dtype=np.float64
+        ).reshape(-1, 2, 3)
+
+        return self._raycast_batch(segments[:, 0], segments[:, 1] - segments[:, 0], 1.0)
+
+    def nearest(self, point: Vector, max_distance: float = math.inf) -> Optional[NearestPoint]:
+        """
+        Closest point on any triangle within `max_distance` of `point`.
+        """
+
+        if not self.counts:
+            return None
+
+        px, py, pz = point
+        bounds = self.bounds
+        counts = self.counts
+        offsets = self.offsets
+        coords = self.coords
+
+        best_squared = max_distance * max_distance
+        best = None
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            b = node * 6
+
+            # Squared distance from the point to the node's box
+            dx = max(bounds[b] - px, 0, px - bounds[b + 3])
+            dy = max(bounds[b + 1] - py, 0, py - bounds[b + 4])
+            dz = max(bounds[b + 2] - pz, 0, pz - bounds[b + 5])
+
+            if dx * dx + dy * dy + dz * dz > best_squared:
+                continue
+
+            count = counts[node]
+
+            if count < 0:
+                # Closer half (by the node's centre) first
+                axis = -1 - count
+
+                if point[axis] * 2 <= bounds[b + axis] + bounds[b + 3 + axis]:
+                    stack.append(offsets[node])
+                    stack.append(node + 1)
+                else:
+                    stack.append(node + 1)
+                    stack.append(offsets[node])
+
+                continue
+
+            start = offsets[node]
+
+            for t in range(start, start + count):
+                c = t * 9
+                closest = closest_point_on_triangle(
+                    point, coords[c:c + 3], coords[c + 3:c + 6], coords[c + 6:c + 9]
+                )
+
+                ex = closest[0] - px
+                ey = closest[1] - py
+                ez = closest[2] - pz
+                squared = ex * ex + ey * ey + ez * ez
+
+                if squared <= best_squared:
+                    best_squared = squared
+                    best = (t, tuple(closest))
+
+        if best is None:
+            return None
+
+        return NearestPoint(
+            distance=math.sqrt(best_squared),
+            triangle=self.order[best[0]],
+            point=best[1]
+        )
+
+    @stats.timed("collision_nearest_many")
+    def nearest_many(self, points: Iterable[Vector],
+                     max_distance: float = math.inf) -> List[Optional[NearestPoint]]:
+        """
+        `nearest` for a batch of points, or an (n, 3) array of them.
+        """
+
+        import numpy as np
+
+        points = np.asarray(
+            points if isinstance(points, np.ndarray) else list(points), dtype=np.float64
+        ).reshape(-1, 3)
+
+        point_count = len(points)
+        best_squared = np.full(point_count, float(max_distance) ** 2)
+        best_triangle = np.full(point_count, -1)
+        best_point = np.zeros((point_count, 3))
+
+        if self.counts and point_count:
+            bounds, counts, offsets, _, corners = self._numpy_arrays()
+            point_rows = np.ascontiguousarray(points.T)
+
+            def box_squared(queries, nodes):
+                squared = np.zeros(len(queries))
+
+                for axis in range(3):
+                    p = point_rows[axis][queries]
+                    outside = np.maximum(
+                        np.maximum(bounds[axis][nodes] - p, 0), p - bounds[axis + 3][nodes]
+                    )
+                    squared += outside * outside
+
+                return squared
+
+            def closest(queries, leaves):
+                self._closest(
+                    points, corners, best_squared, best_triangle, best_point,
+                    *self._leaf_triangles(queries, leaves)
+                )
+
+            queries = np.arange(point_count)
+
+            # Head for the nearer child all the way down first, so every
+            # point starts the full search with a close bound
+            nodes = np.zeros(point_count, dtype=np.int64)
+            inner = counts[nodes] < 0
+
+            while inner.any():
+                left = nodes[inner] + 1
+                right = offsets[nodes[inner]]
+                nodes[inner] = np.where(
+                    box_squared(queries[inner], left) <= box_squared(queries[inner], right),
+                    left, right
+                )
+                inner = counts[nodes] < 0
+
+            closest(queries, nodes)
+
+            nodes = np.zeros(point_count, dtype=np.int64)
+
+            while len(queries):
+                near = box_squared(queries, nodes) <= best_squared[queries]
+                queries, nodes, leaf_queries, leaves = self._descend(queries[near], nodes[near])
+
+                if len(leaf_queries):
+                    closest(leaf_queries, leaves)
+
+        stats.count("collision.points", point_count)
+
+        order = self.order
+
+        return [
+            None if triangle < 0 else NearestPoint(
+                distance=math.sqrt(squared), triangle=order[triangle], point=tuple(point)
+            )
+            for squared, triangle, point in zip(
+                best_squared.tolist(), best_triangle.tolist(), best_point.tolist()
+            )
+        ]
+
+    @staticmethod
+    def _closest(points, corners, best_squared, best_triangle, best_point, queries, triangles):
+        """
+        Closest points for (point, triangle) pairs, keeping the nearest for
+        each point.
+        """
+
+        import numpy as np
+
+        corners = corners[triangles]
+        p = points[queries]
+        closest = _closest_points(p, corners[:, 0], corners[:, 1], corners[:, 2])
+        offset = closest - p
+        squared = _dot(offset, offset)
+
+        keep = squared <= best_squared[queries]
+        queries, triangles, squared, closest = (
+            queries[keep], triangles[keep], squared[keep], closest[keep]
+        )
+
+        order = np.lexsort((triangles, squared, queries))
+        queries = queries[order]
+        first = np.ones(len(queries), dtype=bool)
+        first[1:] = queries[1:] != queries[:-1]
+        chosen = order[first]
+
+        best_squared[queries[first]] = squared[chosen]
+        best_triangle[queries[first]] = triangles[chosen]
+        best_point[queries[first]] = closest[chosen]
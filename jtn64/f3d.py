@@ -1,14 +1,16 @@
 from enum import IntEnum
 from dataclasses import dataclass
-from typing import List, Tuple, Optional
+from typing import Tuple, Optional
 from struct import unpack
 
 
 @dataclass
 class Vertex:
+    __slots__ = ("position", "flag", "uv", "rgb_or_norm", "alpha")
+
     position: Tuple[int, int, int]
     flag: int
-    uv: List[int]
+    uv: Tuple[float, float]
     rgb_or_norm: Tuple[int, int, int]
     alpha: int
 
@@ -30,7 +32,7 @@ class Vertex:
         return Vertex(
             position=(p_x, p_y, p_z),
             flag=flag,
-            uv=[uv_x / 2**12, uv_y / 2**12],
+            uv=(uv_x / 2**12, uv_y / 2**12),
             rgb_or_norm=(r, g, b),
             alpha=alpha
         )
@@ -71,6 +73,8 @@ class F3DCommandType(IntEnum):
 
 @dataclass
 class F3DCommandGVtx:
+    __slots__ = ("write_start", "verts_to_write", "vert_data_len", "load_address")
+
     write_start: int
     verts_to_write: int
     vert_data_len: int
@@ -79,6 +83,8 @@ class F3DCommandGVtx:
 
 @dataclass
 class F3DCommandGTri1:
+    __slots__ = ("vertex_1", "vertex_2", "vertex_3")
+
     vertex_1: int
     vertex_2: int
     vertex_3: int
@@ -86,6 +92,8 @@ class F3DCommandGTri1:
 
 @dataclass
 class F3DCommandGTri2:
+    __slots__ = ("vertex_1", "vertex_2", "vertex_3", "vertex_4", "vertex_5", "vertex_6")
+
     vertex_1: int
     vertex_2: int
     vertex_3: int
@@ -96,6 +104,11 @@ class F3DCommandGTri2:
 
 @dataclass
 class F3DCommandGTexture:
+    __slots__ = (
+        "enable_tile_descriptor", "scaling_factor_s", "scaling_factor_t",
+        "max_mipmap_levels", "tile_descriptor",
+    )
+
     enable_tile_descriptor: bool
     scaling_factor_s: int
     scaling_factor_t: int
@@ -113,6 +126,8 @@ class F3DCommandSetTImgTextureFormat(IntEnum):
 
 @dataclass
 class F3DCommandSetTImg:
+    __slots__ = ("texture_segment_address", "texture_format", "texture_bit_size")
+
     texture_segment_address: int
     texture_format: F3DCommandSetTImgTextureFormat
     texture_bit_size: int
@@ -120,10 +135,12 @@ class F3DCommandSetTImg:
 
 @dataclass
 class F3DCommandDL:
+    __slots__ = ("store_return_address", "segment_address")
+
     store_return_address: bool
     segment_address: int
 
 
 @dataclass
 class F3DCommandEndDL:
-    pass
+    __slots__ = ()
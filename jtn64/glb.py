@@ -0,0 +1,915 @@
+"""
+Direct GLB writer.
+
+`jtn64.gltf.geometry_to_gltf` builds a pygltflib object graph, which is easy
+to inspect but slow to serialize for large models. `write_glb` produces the
+same document straight from a Geometry: the JSON chunk is built as plain
+dicts, and the binary chunk is packed in batches and written to the output
+file as it goes, so the whole buffer never has to exist in memory.
+
+The layout (accessor order, buffer views, LOD nodes, quantization) matches
+`geometry_to_gltf`, which the tests use to check the output. Collision and
+skinning data, which `geometry_to_gltf` doesn't write, go after it.
+"""
+
+import io
+import json
+import struct
+import sys
+from array import array
+from typing import BinaryIO, List, Optional, Sequence, Tuple
+
+from . import stats
+from .mesh import Geometry, Mesh, SceneNode
+from .util import DEFAULT_PNG_LEVEL, images_to_data_uris
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# GLTF enums used below
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+UNSIGNED_BYTE = 5121
+SHORT = 5122
+UNSIGNED_SHORT = 5123
+FLOAT = 5126
+LINEAR = 9729
+NEAREST_MIPMAP_LINEAR = 9986
+REPEAT = 10497
+
+# Vertex layouts: (byte stride, color offset, UV offset)
+FLOAT_LAYOUT = (24, 12, 16)
+QUANTIZED_LAYOUT = (16, 8, 12)
+
+# N64 units per exported unit
+POSITION_SCALE = 128
+
+
+def uv_fraction_bits(uvs) -> int:
+    """
+    Number of fractional bits that fit every UV coordinate into a signed
+    short, for quantized export.
+    """
+
+    largest = max((abs(c) for uv in uvs for c in uv), default=0.0)
+
+    bits = 15
+
+    while bits > 0 and round(largest * 2**bits) > 0x7FFF:
+        bits -= 1
+
+    return bits
+
+
+def model_image_uris(model, verbose=False, compress_level=DEFAULT_PNG_LEVEL,
+                     workers=None):
+    """
+    Encode every texture of a Model as a PNG data URI. Decoding happens here,
+    the PNG encoding on a thread pool (see `jtn64.util.encode_pngs`).
+    """
+
+    images = []
+
+    for i, texture in enumerate(model.texture_data):
+        if verbose:
+            print(f"Texture {i}: {texture.width}x{texture.height}")
+
+        images.append(texture.to_image())
+
+    return images_to_data_uris(images, compress_level, workers)
+
+
+# Positions and triangles, see `jtn64.collision.CollisionList.to_mesh`
+CollisionMesh = Tuple[Sequence[Tuple[int, int, int]], Sequence[Tuple[int, int, int]]]
+
+# Vertices packed per write
+VERTEX_BATCH = 4096
+
+
+def _bounds(values) -> tuple:
+    """
+    Per component (min, max) lists of a sequence of tuples.
+    """
+
+    columns = list(zip(*values))
+
+    return [min(c) for c in columns], [max(c) for c in columns]
+
+
+def _index_accessor(mesh: Mesh, byte_offset: int, base: int = 0) -> dict:
+    flat = [vertex - base for triangle in mesh.indices for vertex in triangle]
+
+    accessor = {
+        "bufferView": 0,
+        "byteOffset": byte_offset,
+        "componentType": UNSIGNED_SHORT,
+        "count": len(flat),
+        "type": "SCALAR",
+    }
+
+    if flat:
+        accessor["max"] = [max(flat)]
+        accessor["min"] = [min(flat)]
+
+    return accessor
+
+
+def _pad(length: int) -> int:
+    return -length % 4
+
+
+def _add_collision(document: dict, collision: CollisionMesh):
+    """
+    Append the collision mesh as its own untextured node, after everything
+    else so the render mesh layout is unchanged. Its indices and float
+    positions get their own buffer views at the end of the binary chunk.
+    """
+
+    positions, triangles = collision
+    buffer = document["buffers"][0]
+
+    index_length = len(triangles) * 6
+    index_length += _pad(index_length)
+
+    accessor_index = len(document["accessors"])
+    position_min, position_max = (
+        [c / POSITION_SCALE for c in bound] for bound in _bounds(positions)
+    )
+
+    document["bufferViews"] += [
+        {
+            "buffer": 0,
+            "byteOffset": buffer["byteLength"],
+            "byteLength": index_length,
+            "target": ELEMENT_ARRAY_BUFFER,
+        },
+        {
+            "buffer": 0,
+            "byteOffset": buffer["byteLength"] + index_length,
+            "byteLength": len(positions) * 12,
+            "target": ARRAY_BUFFER,
+        },
+    ]
+    document["accessors"] += [
+        {
+            "bufferView": len(document["bufferViews"]) - 2,
+            "componentType": UNSIGNED_SHORT,
+            "count": len(triangles) * 3,
+            "type": "SCALAR",
+        },
+        {
+            "bufferView": len(document["bufferViews"]) - 1,
+            "componentType": FLOAT,
+            "count": len(positions),
+            "type": "VEC3",
+            "max": position_max,
+            "min": position_min,
+        },
+    ]
+    document["meshes"].append({
+        "primitives": [{
+            "attributes": {"POSITION": accessor_index + 1},
+            "indices": accessor_index,
+        }]
+    })
+    document["nodes"].append({
+        "mesh": len(document["meshes"]) - 1,
+        "name": "collision",
+        "extras": {"collision": True},
+    })
+    document["scenes"][0]["nodes"].append(len(document["nodes"]) - 1)
+
+    buffer["byteLength"] += index_length + len(positions) * 12
+
+
+def _write_collision(out: BinaryIO, collision: CollisionMesh) -> int:
+    positions, triangles = collision
+
+    length = _write_indices(out, [Mesh(texture_index=None, indices=triangles, vertices=[])])
+    column = _column("f", (c / POSITION_SCALE for position in positions for c in position))
+
+    out.write(column)
+
+    return length + len(column)
+
+
+# Bytes per vertex of the skinning buffer view: JOINTS_0 then WEIGHTS_0, four
+# unsigned bytes each
+SKIN_STRIDE = 8
+
+MAX_JOINTS = 256
+
+
+def _skin_channels(skin):
+    """
+    (bone index, GLTF path, [frame, component] array) of every animated
+    channel of every animation in `skin`, grouped by animation. Translations
+    are converted to exported units.
+    """
+
+    for name, sampled in skin.animations:
+        channels = []
+
+        for bone in range(len(skin.bone_setup.bones)):
+            if sampled.rotated[bone]:
+                channels.append((bone, "rotation", sampled.rotations[bone]))
+
+            if sampled.translated[bone]:
+                channels.append((bone, "translation", sampled.translations[bone] / POSITION_SCALE))
+
+            if sampled.scaled[bone]:
+                channels.append((bone, "scale", sampled.scales[bone]))
+
+        yield name, sampled.times, channels
+
+
+def _add_skin(document: dict, skin, vertex_count: int, render_mesh_count: int,
+              scene_nodes: Optional[Sequence[SceneNode]] = None):
+    """
+    Append the bones as joint nodes, bind the nodes of the first
+    `render_mesh_count` meshes to them and add one animation per sampled animation. The joint
+    and weight attributes, the inverse bind matrices and then the animation
+    samplers get their own buffer views at the end of the binary chunk.
+
+    With `scene_nodes`, each node's mesh gets joint and weight accessors over
+    its own vertex range, matching its other attributes as `_build_tree`
+    lays them out.
+
+    Skinned mesh nodes ignore their own transform, so with quantization the
+    1/POSITION_SCALE node scale moves into the inverse bind matrices.
+    """
+
+    from .animation import rest_translations
+
+    bones = skin.bone_setup.bones
+
+    if len(bones) > MAX_JOINTS:
+        raise ValueError(f"Too many bones to export: {len(bones)}")
+
+    buffer = document["buffers"][0]
+    views = document["bufferViews"]
+    accessors = document["accessors"]
+    nodes = document["nodes"]
+
+    def add_view(length, **fields):
+        views.append({
+            "buffer": 0,
+            "byteOffset": buffer["byteLength"],
+            "byteLength": length,
+            **fields
+        })
+        buffer["byteLength"] += length
+
+        return len(views) - 1
+
+    skin_view = add_view(vertex_count * SKIN_STRIDE, byteStride=SKIN_STRIDE, target=ARRAY_BUFFER)
+
+    if scene_nodes is None:
+        vertex_ranges = [(0, vertex_count)] * render_mesh_count
+    else:
+        vertex_ranges = [node.vertex_range for node in _walk_scene(scene_nodes) if node.meshes]
+
+    # First JOINTS_0 accessor of each vertex range, WEIGHTS_0 follows it
+    joints_accessors = {}
+
+    for mesh, vertex_range in zip(document["meshes"][:render_mesh_count], vertex_ranges):
+        if vertex_range not in joints_accessors:
+            start, count = vertex_range
+            joints_accessors[vertex_range] = len(accessors)
+            accessors += [
+                {
+                    "bufferView": skin_view,
+                    "byteOffset": start * SKIN_STRIDE,
+                    "componentType": UNSIGNED_BYTE,
+                    "count": count,
+                    "type": "VEC4",
+                },
+                {
+                    "bufferView": skin_view,
+                    "byteOffset": start * SKIN_STRIDE + 4,
+                    "componentType": UNSIGNED_BYTE,
+                    "normalized": True,
+                    "count": count,
+                    "type": "VEC4",
+                },
+            ]
+
+        for primitive in mesh["primitives"]:
+            primitive["attributes"]["JOINTS_0"] = joints_accessors[vertex_range]
+            primitive["attributes"]["WEIGHTS_0"] = joints_accessors[vertex_range] + 1
+
+    accessors.append({
+        "bufferView": add_view(len(bones) * 64),
+        "componentType": FLOAT,
+        "count": len(bones),
+        "type": "MAT4",
+    })
+
+    first_joint = len(nodes)
+    rest = rest_translations(skin.bone_setup) / POSITION_SCALE
+
+    for bone, translation in zip(bones, rest.tolist()):
+        nodes.append({"name": f"bone_{bone.id}", "translation": translation})
+
+    for index, parent in enumerate(skin.bone_setup.parents()):
+        if parent is None:
+            document["scenes"][0]["nodes"].append(first_joint + index)
+        else:
+            nodes[first_joint + parent].setdefault("children", []).append(first_joint + index)
+
+    document["skins"] = [{
+        "inverseBindMatrices": len(accessors) - 1,
+        "joints": list(range(first_joint, first_joint + len(bones))),
+    }]
+
+    for node in nodes:
+        if node.get("mesh", render_mesh_count) < render_mesh_count:
+            node.pop("scale", None)
+            node["skin"] = 0
+
+    animations = []
+
+    for name, times, channels in _skin_channels(skin):
+        length = len(times) * 4 + sum(values.size * 4 for _, _, values in channels)
+        view = add_view(length)
+        offset = len(times) * 4
+
+        input_accessor = len(accessors)
+        accessors.append({
+            "bufferView": view,
+            "componentType": FLOAT,
+            "count": len(times),
+            "type": "SCALAR",
+            "max": [float(times.max())],
+            "min": [float(times.min())],
+        })
+
+        samplers = []
+        targets = []
+
+        for bone, path, values in channels:
+            accessors.append({
+                "bufferView": view,
+                "byteOffset": offset,
+                "componentType": FLOAT,
+                "count": len(values),
+                "type": f"VEC{values.shape[1]}",
+            })
+            offset += values.size * 4
+
+            samplers.append({
+                "input": input_accessor,
+                "output": len(accessors) - 1,
+                "interpolation": "LINEAR",
+            })
+            targets.append({"node": first_joint + bone, "path": path})
+
+        animations.append({
+            "name": name,
+            "samplers": samplers,
+            "channels": [
+                {"sampler": i, "target": target} for i, target in enumerate(targets)
+            ],
+        })
+
+    if animations:
+        document["animations"] = animations
+
+
+def _write_skin(out: BinaryIO, skin, vertex_count: int, quantize: bool) -> int:
+    import numpy as np
+
+    weights = np.zeros((vertex_count, SKIN_STRIDE), dtype=np.uint8)
+    weights[:, 4] = 255
+
+    if skin.vertex_joints is not None:
+        if len(skin.vertex_joints) != vertex_count:
+            raise ValueError(
+                f"Skin has {len(skin.vertex_joints)} vertex joints,"
+                f" the geometry {vertex_count} vertices"
+            )
+
+        weights[:, 0] = skin.vertex_joints
+
+    # Column major translate(-pivot) * scale(scale) per bone
+    scale = 1 / POSITION_SCALE if quantize else 1.0
+    pivots = np.array(
+        [bone.position for bone in skin.bone_setup.bones], dtype=np.float64
+    ) / POSITION_SCALE
+    matrices = np.zeros((len(pivots), 4, 4))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = matrices[:, 2, 2] = scale
+    matrices[:, 3, :3] = -pivots
+    matrices[:, 3, 3] = 1.0
+
+    blobs = [weights.tobytes(), matrices.astype("<f4").tobytes()]
+
+    for _, times, channels in _skin_channels(skin):
+        blobs.append(times.astype("<f4").tobytes())
+        blobs += [values.astype("<f4").tobytes() for _, _, values in channels]
+
+    for blob in blobs:
+        out.write(blob)
+
+    return sum(len(blob) for blob in blobs)
+
+
+def _attribute_accessors(geometry: Geometry, start: int, count: int, view: int,
+                         quantize: bool) -> List[dict]:
+    """
+    POSITION, COLOR_0 and TEXCOORD_0 accessors for `count` vertices of
+    `geometry` from `start`, stored in buffer view `view`.
+    """
+
+    positions = geometry.positions[start:start + count]
+    uvs = geometry.uvs[start:start + count]
+
+    if quantize:
+        _, color_offset, uv_offset = QUANTIZED_LAYOUT
+        uv_scale = 2**uv_fraction_bits(geometry.uvs)
+        component_type = SHORT
+
+        position_min, position_max = _bounds(positions)
+        uv_min, uv_max = _bounds(
+            (round(u * uv_scale), round(v * uv_scale)) for u, v in uvs
+        )
+    else:
+        _, color_offset, uv_offset = FLOAT_LAYOUT
+        component_type = FLOAT
+
+        position_min, position_max = (
+            [c / POSITION_SCALE for c in bound] for bound in _bounds(positions)
+        )
+        uv_min, uv_max = _bounds(uvs)
+
+    color_min, color_max = _bounds(geometry.colors[start:start + count])
+
+    return [
+        {
+            "bufferView": view,
+            "componentType": component_type,
+            "count": count,
+            "type": "VEC3",
+            "max": position_max,
+            "min": position_min,
+        },
+        {
+            "bufferView": view,
+            "byteOffset": color_offset,
+            "componentType": UNSIGNED_BYTE,
+            "normalized": True,
+            "count": count,
+            "type": "VEC3",
+            "max": color_max,
+            "min": color_min,
+        },
+        {
+            "bufferView": view,
+            "byteOffset": uv_offset,
+            "componentType": component_type,
+            "count": count,
+            "type": "VEC2",
+            "max": uv_max,
+            "min": uv_min,
+        },
+    ]
+
+
+def _walk_scene(scene_nodes: Sequence[SceneNode]):
+    for node in scene_nodes:
+        yield node
+        yield from _walk_scene(node.children)
+
+
+def _mesh_bases(geometry: Geometry, scene_nodes: Optional[Sequence[SceneNode]]) -> List[int]:
+    """
+    First vertex of the accessors each mesh's indices are relative to.
+    """
+
+    bases = [0] * len(geometry.meshes)
+
+    for node in _walk_scene(scene_nodes or ()):
+        for mesh_index in node.meshes:
+            bases[mesh_index] = node.vertex_range[0]
+
+    return bases
+
+
+def _build_tree(geometry: Geometry, scene_nodes: Sequence[SceneNode], quantize: bool,
+                index_length: int) -> tuple:
+    """
+    Nodes, meshes, vertex attribute accessors and vertex buffer views for a
+    node tree. Every scene node with meshes gets one GLTF mesh with a
+    primitive per geometry mesh, and its own buffer view and accessors over
+    its vertex range, so the accessor bounds are the node's bounds. The mesh
+    hangs off a child node, so that the quantization scale doesn't apply to
+    the node's children.
+    """
+
+    stride = QUANTIZED_LAYOUT[0] if quantize else FLOAT_LAYOUT[0]
+    mesh_count = len(geometry.meshes)
+
+    nodes = []
+    meshes = []
+    accessors = []
+    views = []
+
+    def add(scene_node: SceneNode) -> int:
+        node = {"name": scene_node.name}
+
+        if scene_node.extras:
+            node["extras"] = scene_node.extras
+
+        nodes.append(node)
+        node_index = len(nodes) - 1
+        children = []
+
+        if scene_node.meshes:
+            start, count = scene_node.vertex_range
+
+            views.append({
+                "buffer": 0,
+                "byteOffset": index_length + start * stride,
+                "byteLength": count * stride,
+                "byteStride": stride,
+                "target": ARRAY_BUFFER,
+            })
+
+            attributes = mesh_count + len(accessors)
+            accessors.extend(_attribute_accessors(geometry, start, count, len(views), quantize))
+
+            primitives = []
+
+            for mesh_index in scene_node.meshes:
+                primitive = {
+                    "attributes": {
+                        "POSITION": attributes,
+                        "COLOR_0": attributes + 1,
+                        "TEXCOORD_0": attributes + 2,
+                    },
+                    "indices": mesh_index,
+                }
+
+                texture_index = geometry.meshes[mesh_index].texture_index
+
+                if texture_index is not None:
+                    primitive["material"] = texture_index
+
+                primitives.append(primitive)
+
+            meshes.append({"primitives": primitives})
+
+            mesh_node = {"mesh": len(meshes) - 1, "name": f"{scene_node.name}_mesh"}
+
+            if quantize:
+                mesh_node["scale"] = [1 / POSITION_SCALE] * 3
+
+            nodes.append(mesh_node)
+            children.append(len(nodes) - 1)
+
+        children += [add(child) for child in scene_node.children]
+
+        if children:
+            node["children"] = children
+
+        return node_index
+
+    roots = [add(scene_node) for scene_node in scene_nodes]
+
+    return nodes, meshes, accessors, views, roots
+
+
+def build_document(geometry: Geometry, image_uris: Sequence[str],
+                   quantize: bool = False, lods: Sequence[List[Mesh]] = (),
+                   collision: Optional[CollisionMesh] = None, skin=None,
+                   scene_nodes: Optional[Sequence[SceneNode]] = None) -> dict:
+    """
+    The JSON part of the GLB for `geometry`. See `write_glb`.
+    """
+
+    if scene_nodes is not None and lods:
+        raise ValueError("LODs can't be written with a node tree")
+
+    mesh_count = len(geometry.meshes)
+    vertex_count = len(geometry.positions)
+    bases = _mesh_bases(geometry, scene_nodes)
+
+    position_accessor_index = mesh_count
+    color_accessor_index = mesh_count + 1
+    uv_accessor_index = mesh_count + 2
+
+    if quantize:
+        stride = QUANTIZED_LAYOUT[0]
+        uv_scale = 2**uv_fraction_bits(geometry.uvs)
+    else:
+        stride = FLOAT_LAYOUT[0]
+
+    meshes = []
+    nodes = []
+    index_accessors = []
+    index_length = 0
+
+    def add_mesh(mesh, indices_accessor_index, name):
+        primitive = {
+            "attributes": {
+                "POSITION": position_accessor_index,
+                "COLOR_0": color_accessor_index,
+                "TEXCOORD_0": uv_accessor_index,
+            },
+            "indices": indices_accessor_index,
+        }
+
+        if mesh.texture_index is not None:
+            primitive["material"] = mesh.texture_index
+
+        meshes.append({"primitives": [primitive]})
+
+        node = {"mesh": len(meshes) - 1, "name": name}
+
+        if quantize:
+            node["scale"] = [1 / POSITION_SCALE] * 3
+
+        nodes.append(node)
+
+    for mesh_index, mesh in enumerate(geometry.meshes):
+        index_accessors.append(_index_accessor(mesh, index_length, bases[mesh_index]))
+        index_length += len(mesh.indices) * 6
+
+        if scene_nodes is None:
+            add_mesh(mesh, mesh_index, f"mesh_{mesh_index}")
+
+    for level_index, level in enumerate(lods):
+        for mesh_index, mesh in enumerate(level):
+            add_mesh(
+                mesh,
+                uv_accessor_index + 1 + len(index_accessors) - mesh_count,
+                f"mesh_{mesh_index}_lod{level_index + 1}"
+            )
+
+            index_accessors.append(_index_accessor(mesh, index_length))
+            index_length += len(mesh.indices) * 6
+
+    if lods:
+        coverage = [0.5 ** (level + 1) for level in range(len(lods))] + [0.0]
+
+        for mesh_index in range(mesh_count):
+            nodes[mesh_index]["extensions"] = {
+                "MSFT_lod": {
+                    "ids": [
+                        mesh_count * (level + 1) + mesh_index
+                        for level in range(len(lods))
+                    ]
+                }
+            }
+            nodes[mesh_index]["extras"] = {"MSFT_screencoverage": coverage}
+
+    index_length += _pad(index_length)
+    vertex_length = vertex_count * stride
+
+    if scene_nodes is None:
+        roots = list(range(mesh_count))
+        accessors = index_accessors[:mesh_count] \
+            + _attribute_accessors(geometry, 0, vertex_count, 1, quantize) \
+            + index_accessors[mesh_count:]
+        vertex_views = [{
+            "buffer": 0,
+            "byteOffset": index_length,
+            "byteLength": vertex_length,
+            "byteStride": stride,
+            "target": ARRAY_BUFFER,
+        }]
+    else:
+        nodes, meshes, attribute_accessors, vertex_views, roots = _build_tree(
+            geometry, scene_nodes, quantize, index_length
+        )
+        accessors = index_accessors + attribute_accessors
+
+    materials = []
+
+    for i in range(len(image_uris)):
+        texture_info = {"index": i}
+
+        if quantize:
+            texture_info["extensions"] = {
+                "KHR_texture_transform": {"scale": [1 / uv_scale, 1 / uv_scale]}
+            }
+
+        materials.append({
+            "pbrMetallicRoughness": {
+                "baseColorTexture": texture_info,
+                "metallicFactor": 0.0,
+            },
+            "name": f"texture_{i}",
+            "alphaMode": "MASK",
+        })
+
+    document = {
+        "asset": {"generator": "bk-model-extractor", "version": "2.0"},
+        "scene": 0,
+        "scenes": [{"nodes": roots}],
+        "nodes": nodes,
+        "meshes": meshes,
+        "accessors": accessors,
+        "images": [{"uri": uri} for uri in image_uris],
+        "textures": [{"sampler": 0, "source": i} for i in range(len(image_uris))],
+        "materials": materials,
+        "samplers": [{
+            "magFilter": LINEAR,
+            "minFilter": NEAREST_MIPMAP_LINEAR,
+            "wrapS": REPEAT,
+            "wrapT": REPEAT,
+        }],
+        "bufferViews": [
+            {
+                "buffer": 0,
+                "byteOffset": 0,
+                "byteLength": index_length,
+                "target": ELEMENT_ARRAY_BUFFER,
+            },
+        ] + vertex_views,
+        "buffers": [{"byteLength": index_length + vertex_length}],
+    }
+
+    render_mesh_count = len(meshes)
+
+    if collision is not None:
+        _add_collision(document, collision)
+
+    if skin is not None:
+        _add_skin(document, skin, vertex_count, render_mesh_count, scene_nodes)
+
+    extensions_used = []
+
+    if quantize:
+        extensions_used += ["KHR_mesh_quantization", "KHR_texture_transform"]
+        document["extensionsRequired"] = ["KHR_mesh_quantization"]
+
+        # Without the transform, quantized UVs would be read unscaled
+        if image_uris:
+            document["extensionsRequired"].append("KHR_texture_transform")
+
+    if lods:
+        extensions_used.append("MSFT_lod")
+
+    if extensions_used:
+        document["extensionsUsed"] = extensions_used
+
+    return document
+
+
+def _write_indices(out: BinaryIO, meshes: Sequence[Mesh], bases: Sequence[int] = ()) -> int:
+    """
+    Write the indices of every mesh, minus the matching entry of `bases`
+    (0 for meshes past its end).
+    """
+
+    length = 0
+
+    for i, mesh in enumerate(meshes):
+        base = bases[i] if i < len(bases) else 0
+        indices = array("H", [vertex - base for triangle in mesh.indices for vertex in triangle])
+
+        if sys.byteorder == "big":
+            indices.byteswap()
+
+        out.write(indices.tobytes())
+        length += len(indices) * 2
+
+    out.write(bytes(_pad(length)))
+
+    return length + _pad(length)
+
+
+def _column(typecode: str, values) -> bytes:
+    column = array(typecode, values)
+
+    if sys.byteorder == "big":
+        column.byteswap()
+
+    return column.tobytes()
+
+
+def _interleave(buffer: bytearray, column: bytes, offset: int, width: int, stride: int):
+    """
+    Copy fixed `width` byte elements of `column` into every `stride` bytes of
+    `buffer` starting at `offset`, one byte lane at a time. Each lane is a
+    single extended slice assignment, so no per-vertex Python code runs.
+    """
+
+    for lane in range(width):
+        buffer[offset + lane::stride] = column[lane::width]
+
+
+def _write_vertices(out: BinaryIO, geometry: Geometry, quantize: bool) -> int:
+    length = 0
+
+    if quantize:
+        stride, color_offset, uv_offset = QUANTIZED_LAYOUT
+        position_type = uv_type = "h"
+        component_size = 2
+        uv_scale = 2**uv_fraction_bits(geometry.uvs)
+    else:
+        stride, color_offset, uv_offset = FLOAT_LAYOUT
+        position_type = uv_type = "f"
+        component_size = 4
+
+    for start in range(0, len(geometry.positions), VERTEX_BATCH):
+        positions = geometry.positions[start:start + VERTEX_BATCH]
+        colors = geometry.colors[start:start + VERTEX_BATCH]
+        uvs = geometry.uvs[start:start + VERTEX_BATCH]
+
+        if quantize:
+            position_values = (c for position in positions for c in position)
+            uv_values = (round(c * uv_scale) for uv in uvs for c in uv)
+        else:
+            position_values = (c / POSITION_SCALE for position in positions for c in position)
+            uv_values = (c for uv in uvs for c in uv)
+
+        buffer = bytearray(len(positions) * stride)
+
+        _interleave(
+            buffer, _column(position_type, position_values),
+            0, component_size * 3, stride
+        )
+        _interleave(
+            buffer, bytes(c for color in colors for c in color),
+            color_offset, 3, stride
+        )
+        _interleave(
+            buffer, _column(uv_type, uv_values),
+            uv_offset, component_size * 2, stride
+        )
+
+        out.write(buffer)
+        length += len(buffer)
+
+    return length
+
+
+@stats.timed("glb_write")
+def write_glb(out: BinaryIO, geometry: Geometry, image_uris: Sequence[str],
+              quantize: bool = False, lods: Sequence[List[Mesh]] = (),
+              verbose: bool = False, collision: Optional[CollisionMesh] = None,
+              skin=None, scene_nodes: Optional[Sequence[SceneNode]] = None) -> int:
+    """
+    Write `geometry` as a binary GLTF to `out`, with one material per image
+    URI. `quantize` and `lods` work as in `jtn64.gltf.geometry_to_gltf`.
+    `collision` holds the (positions, triangles) of a collision mesh (see
+    `jtn64.collision.CollisionList.to_mesh`), written as an extra node.
+    `skin` is a `jtn64.animation.Skin` to bind the meshes to, with its
+    animations. `scene_nodes` writes the meshes as a node tree instead of
+    one node per mesh (see `jtn64.layout.build_scene`). Returns the number
+    of bytes written.
+    """
+
+    if verbose:
+        for mesh in geometry.meshes:
+            print(f'Mesh: texture_index={mesh.texture_index}, tri_count={len(mesh.indices)}')
+
+    document = build_document(geometry, image_uris, quantize, lods, collision, skin, scene_nodes)
+
+    json_data = json.dumps(document, separators=(",", ":")).encode()
+    json_data += b" " * _pad(len(json_data))
+
+    bin_length = document["buffers"][0]["byteLength"]
+    total_length = 12 + 8 + len(json_data) + 8 + bin_length
+
+    out.write(struct.pack("<III", GLB_MAGIC, GLB_VERSION, total_length))
+    out.write(struct.pack("<II", len(json_data), CHUNK_JSON))
+    out.write(json_data)
+    out.write(struct.pack("<II", bin_length, CHUNK_BIN))
+
+    written = _write_indices(
+        out, list(geometry.meshes) + [m for level in lods for m in level],
+        _mesh_bases(geometry, scene_nodes)
+    )
+    written += _write_vertices(out, geometry, quantize)
+
+    if collision is not None:
+        written += _write_collision(out, collision)
+
+    if skin is not None:
+        written += _write_skin(out, skin, len(geometry.positions), quantize)
+
+    if written != bin_length:
+        raise ValueError(
+            f"GLB binary chunk is {written} bytes, but its header says {bin_length}"
+        )
+
+    stats.count("glb_write.bytes", total_length)
+
+    return total_length
+
+
+def geometry_to_glb(geometry: Geometry, image_uris: Sequence[str],
+                    quantize: bool = False, lods: Sequence[List[Mesh]] = (),
+                    collision: Optional[CollisionMesh] = None, skin=None,
+                    scene_nodes: Optional[Sequence[SceneNode]] = None) -> bytes:
+    out = io.BytesIO()
+    write_glb(
+        out, geometry, image_uris, quantize, lods,
+        collision=collision, skin=skin, scene_nodes=scene_nodes
+    )
+
+    return out.getvalue()
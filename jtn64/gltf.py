@@ -0,0 +1,339 @@
+import io
+import struct
+
+import pygltflib
+
+from . import stats
+from .glb import (
+    FLOAT_LAYOUT, POSITION_SCALE, QUANTIZED_LAYOUT, model_image_uris, uv_fraction_bits
+)
+
+
+class MinMaxTracker:
+    def __init__(self):
+        self.min = None
+        self.max = None
+
+    def add(self, v):
+        if self.min is None:
+            self.min = v
+        elif v < self.min:
+            self.min = v
+
+        if self.max is None:
+            self.max = v
+        elif v > self.max:
+            self.max = v
+
+
+class BoundingBoxTracker:
+    def __init__(self):
+        self.min = None
+        self.max = None
+
+    def add(self, v):
+        if self.min is None:
+            self.min = list(v)
+        else:
+            for i, x in enumerate(v):
+                if x < self.min[i]:
+                    self.min[i] = x
+
+        if self.max is None:
+            self.max = list(v)
+        else:
+            for i, x in enumerate(v):
+                if x > self.max[i]:
+                    self.max[i] = x
+
+
+@stats.timed("gltf_build")
+def model_to_gltf(model, displaylist_result=None, verbose=False,
+                  image_uris=None, quantize=False) -> pygltflib.GLTF2:
+    """
+    Build a GLTF2 document for a parsed Model. The display list is simulated
+    unless a previous result is passed in, and textures are encoded unless
+    `image_uris` already holds one data URI per texture.
+    """
+
+    geometry = model.build_geometry(displaylist_result)
+
+    if image_uris is None:
+        image_uris = model_image_uris(model, verbose)
+
+    return geometry_to_gltf(geometry, image_uris, verbose, quantize)
+
+
+def geometry_to_gltf(geometry, image_uris, verbose=False,
+                     quantize=False, lods=()) -> pygltflib.GLTF2:
+    """
+    Build a GLTF2 document from a Geometry, with one material per image.
+
+    `lods` holds lists of simplified meshes indexing into the same vertex
+    buffer (see `jtn64.simplify.generate_lods`), written under MSFT_lod.
+
+    With `quantize`, positions are written as the N64's native int16 values
+    and UVs as int16 fixed point, under KHR_mesh_quantization. Node scales
+    and a KHR_texture_transform on every material undo the quantization.
+    """
+
+    images = []
+    textures = []
+    materials = []
+    nodes = []
+    scene_nodes = []
+    accessors = []
+
+    vertex_io = io.BytesIO()
+    triangle_io = io.BytesIO()
+
+    vertex_count = 0
+
+    vertex_minmax = BoundingBoxTracker()
+    color_minmax = BoundingBoxTracker()
+    uv_minmax = BoundingBoxTracker()
+
+    gltf_meshes = []
+
+    position_accessor_index = len(geometry.meshes)
+    color_accessor_index = len(geometry.meshes) + 1
+    uv_accessor_index = len(geometry.meshes) + 2
+
+    if quantize:
+        stride, color_offset, uv_offset = QUANTIZED_LAYOUT
+        node_scale = [1 / POSITION_SCALE] * 3
+        uv_scale = 2**uv_fraction_bits(geometry.uvs)
+    else:
+        stride, color_offset, uv_offset = FLOAT_LAYOUT
+        node_scale = None
+
+    def write_indices(mesh):
+        triangle_minmax = MinMaxTracker()
+        byte_offset = len(triangle_io.getvalue())
+
+        for face_index, face in enumerate(mesh.indices):
+            triangle_io.write(struct.pack("HHH", *face))
+
+            triangle_minmax.add(face[0])
+            triangle_minmax.add(face[1])
+            triangle_minmax.add(face[2])
+
+        return pygltflib.Accessor(
+            bufferView=0,
+            componentType=pygltflib.UNSIGNED_SHORT,
+            byteOffset=byte_offset,
+            count=len(mesh.indices)*3,
+            type=pygltflib.SCALAR,
+            max=[triangle_minmax.max],
+            min=[triangle_minmax.min],
+        )
+
+    def add_mesh(mesh, indices_accessor_index, name):
+        gltf_meshes.append(
+            pygltflib.Mesh(
+                primitives=[
+                    pygltflib.Primitive(
+                        attributes=pygltflib.Attributes(
+                            POSITION=position_accessor_index,
+                            COLOR_0=color_accessor_index,
+                            TEXCOORD_0=uv_accessor_index,
+                        ),
+                        indices=indices_accessor_index,
+                        material=mesh.texture_index
+                    )
+                ]
+            )
+        )
+
+        nodes.append(
+            pygltflib.Node(
+                mesh=len(gltf_meshes) - 1,
+                name=name,
+                scale=node_scale
+            )
+        )
+
+    for mesh_index, mesh in enumerate(geometry.meshes):
+        if verbose:
+            print(f'Mesh: texture_index={mesh.texture_index}, tri_count={len(mesh.indices)}')
+
+        scene_nodes.append(mesh_index)
+
+        add_mesh(mesh, mesh_index, f"mesh_{mesh_index}")
+        accessors.append(write_indices(mesh))
+
+    # LOD meshes get nodes outside of the scene, referenced from their base
+    # node through MSFT_lod. Their index accessors go after the vertex ones.
+    lod_accessors = []
+
+    for level_index, level in enumerate(lods):
+        for mesh_index, mesh in enumerate(level):
+            add_mesh(
+                mesh,
+                uv_accessor_index + 1 + len(lod_accessors),
+                f"mesh_{mesh_index}_lod{level_index + 1}"
+            )
+            lod_accessors.append(write_indices(mesh))
+
+    if lods:
+        coverage = [0.5 ** (level + 1) for level in range(len(lods))] + [0.0]
+
+        for mesh_index in range(len(geometry.meshes)):
+            nodes[mesh_index].extensions = {
+                "MSFT_lod": {
+                    "ids": [
+                        len(geometry.meshes) * (level + 1) + mesh_index
+                        for level in range(len(lods))
+                    ]
+                }
+            }
+            nodes[mesh_index].extras = {"MSFT_screencoverage": coverage}
+
+    # Pad to 4 bytes
+    while len(triangle_io.getvalue()) % 4 != 0:
+        triangle_io.write(struct.pack("B", 0))
+
+    for position, color, uv in zip(geometry.positions, geometry.colors, geometry.uvs):
+        if quantize:
+            uv = (round(uv[0] * uv_scale), round(uv[1] * uv_scale))
+
+            vertex_io.write(struct.pack("hhh2x", *position))
+            vertex_io.write(struct.pack("BBBB", *color, 0))
+            vertex_io.write(struct.pack("hh", *uv))
+        else:
+            position = (
+                position[0] / POSITION_SCALE,
+                position[1] / POSITION_SCALE,
+                position[2] / POSITION_SCALE
+            )
+
+            vertex_io.write(struct.pack("fff", *position))
+            vertex_io.write(struct.pack("BBBB", *color, 0))
+            vertex_io.write(struct.pack("ff", *uv))
+
+        vertex_minmax.add(position)
+        color_minmax.add(color)
+        uv_minmax.add(uv)
+
+        vertex_count += 1
+
+    # Pad to 4 bytes
+    while len(vertex_io.getvalue()) % 4 != 0:
+        vertex_io.write(struct.pack("B", 0))
+
+    # Add the vertex accessors (position, color, then UV)
+
+    component_type = pygltflib.SHORT if quantize else pygltflib.FLOAT
+
+    accessors += [
+        pygltflib.Accessor(
+            bufferView=1,
+            componentType=component_type,
+            count=vertex_count,
+            type=pygltflib.VEC3,
+            max=list(vertex_minmax.max),
+            min=list(vertex_minmax.min),
+        ),
+        pygltflib.Accessor(
+            bufferView=1,
+            componentType=pygltflib.UNSIGNED_BYTE,
+            normalized=True,
+            count=vertex_count,
+            type=pygltflib.VEC3,
+            byteOffset=color_offset,
+            max=list(color_minmax.max),
+            min=list(color_minmax.min),
+        ),
+        pygltflib.Accessor(
+            bufferView=1,
+            componentType=component_type,
+            count=vertex_count,
+            type=pygltflib.VEC2,
+            byteOffset=uv_offset,
+            max=list(uv_minmax.max),
+            min=list(uv_minmax.min),
+        ),
+    ]
+
+    accessors += lod_accessors
+
+    for i, uri in enumerate(image_uris):
+        images.append(pygltflib.Image(uri=uri))
+
+        textures.append(
+            pygltflib.Texture(sampler=0, source=i)
+        )
+
+        texture_info = pygltflib.TextureInfo(index=i)
+
+        if quantize:
+            texture_info.extensions = {
+                "KHR_texture_transform": {
+                    "scale": [1 / uv_scale, 1 / uv_scale]
+                }
+            }
+
+        materials.append(
+            pygltflib.Material(
+                pbrMetallicRoughness=pygltflib.PbrMetallicRoughness(
+                    baseColorTexture=texture_info,
+                    metallicFactor=0.0
+                ),
+                name=f"texture_{i}",
+                alphaMode=pygltflib.MASK
+            )
+        )
+
+    gltf = pygltflib.GLTF2(
+        scene=0,
+        scenes=[pygltflib.Scene(nodes=scene_nodes)],
+        nodes=nodes,
+        meshes=gltf_meshes,
+        accessors=accessors,
+        images=images,
+        textures=textures,
+        materials=materials,
+        samplers=[
+            pygltflib.Sampler(
+                magFilter=pygltflib.LINEAR,
+                minFilter=pygltflib.NEAREST_MIPMAP_LINEAR,
+                wrapS=pygltflib.REPEAT,
+                wrapT=pygltflib.REPEAT,
+            )
+        ],
+        bufferViews=[
+            pygltflib.BufferView(
+                buffer=0,
+                byteOffset=0,
+                byteLength=len(triangle_io.getvalue()),
+                target=pygltflib.ELEMENT_ARRAY_BUFFER,
+            ),
+            pygltflib.BufferView(
+                buffer=0,
+                byteOffset=len(triangle_io.getvalue()),
+                byteLength=len(vertex_io.getvalue()),
+                byteStride=stride,
+                target=pygltflib.ARRAY_BUFFER,
+            ),
+        ],
+        buffers=[
+            pygltflib.Buffer(
+                byteLength=len(triangle_io.getvalue()) + len(vertex_io.getvalue())
+            )
+        ],
+    )
+
+    if quantize:
+        gltf.extensionsUsed += ["KHR_mesh_quantization", "KHR_texture_transform"]
+        gltf.extensionsRequired += ["KHR_mesh_quantization"]
+
+        # Without the transform, quantized UVs would be read unscaled
+        if image_uris:
+            gltf.extensionsRequired.append("KHR_texture_transform")
+
+    if lods:
+        gltf.extensionsUsed.append("MSFT_lod")
+
+    gltf.set_binary_blob(triangle_io.getvalue() + vertex_io.getvalue())
+
+    return gltf
@@ -0,0 +1,405 @@
+"""
+Geometry layout.
+
+The geometry layout of a model is a tree of commands deciding which parts of
+the display list get drawn and how: with which bone's matrix, at which level
+of detail, behind which selector. Every command starts with its type and its
+size, which is the offset of the next command in the same list (a size of 0
+ends the list). Commands with children point at the first command of each
+child list, relative to their own start.
+
+`GeometryLayout.parse_bytes` turns the commands into a tree of GeoNodes,
+each with the display list ranges it draws itself. `compute_bounds` then
+gives every node the bounding box of the vertices loaded by it and its
+descendants, so a node tree can be culled or partially exported without
+simulating the display list.
+"""
+
+from dataclasses import dataclass
+from enum import IntEnum
+from struct import Struct, error as StructError
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from . import stats
+from .f3d import F3DCommandGVtx
+from .limits import ModelParseError
+from .mesh import Geometry, Mesh, SceneNode
+
+Vector = Tuple[float, float, float]
+Bounds = Tuple[Vector, Vector]
+
+# (first display list command, command count). A count of None runs up to
+# the next G_ENDDL, see `jtn64.model.DisplayListSetupHeader.command_slice`.
+DisplayListRange = Tuple[int, Optional[int]]
+
+COMMAND_HEADER = Struct(">II")
+# Plane point and normal, a flags halfword, then the offsets of the child
+# lists drawn in front of and behind the plane
+SORT = Struct(">3f3fHHI")
+# Child list offset, bone index
+BONE = Struct(">BB2x")
+# First display list command, command count
+LOAD_DL = Struct(">hh")
+SKINNING_ENTRY = Struct(">h")
+# Max and min distance, test point, child list offset
+LOD = Struct(">ff3fI")
+# Child count, selector index, then one offset per child
+SELECTOR = Struct(">hh")
+SELECTOR_CHILD = Struct(">I")
+# Bounding box min and max, child list offset
+DRAW_DISTANCE = Struct(">3h3hH")
+
+# Deeper trees than this are treated as corrupt
+MAX_DEPTH = 64
+
+
+class GeoCommandType(IntEnum):
+    SORT = 0x01
+    BONE = 0x02
+    LOAD_DL = 0x03
+    SKINNING = 0x05
+    LOD = 0x08
+    SELECTOR = 0x0C
+    DRAW_DISTANCE = 0x0D
+
+
+@dataclass
+class GeoNode:
+    """
+    One geometry layout command. `type` is a GeoCommandType, or the raw
+    command number for commands that aren't understood (those never have
+    children). `offset` is the command's position in the layout and
+    identifies the node.
+    """
+
+    __slots__ = ("type", "offset", "display_lists", "children", "properties", "bounds")
+
+    type: int
+    offset: int
+    # Ranges drawn by this node itself, not its children
+    display_lists: List[DisplayListRange]
+    children: List['GeoNode']
+    # Command specific fields, e.g. "bone" for BONE or "max_distance" for LOD
+    properties: dict
+    # (min, max) of every vertex loaded by this node and its descendants,
+    # None until `GeometryLayout.compute_bounds` runs or if nothing is drawn
+    bounds: Optional[Bounds]
+
+    @property
+    def name(self) -> str:
+        if isinstance(self.type, GeoCommandType):
+            kind = self.type.name.lower()
+        else:
+            kind = f"cmd{self.type:x}"
+
+        return f"{kind}_{self.offset:x}"
+
+    def walk(self) -> Iterator['GeoNode']:
+        """
+        This node and its descendants, depth first.
+        """
+
+        yield self
+
+        for child in self.children:
+            yield from child.walk()
+
+    def subtree_display_lists(self) -> List[DisplayListRange]:
+        """
+        Ranges drawn by this node and its descendants, in draw order.
+        """
+
+        return [r for node in self.walk() for r in node.display_lists]
+
+
+def _union(a: Optional[Bounds], b: Optional[Bounds]) -> Optional[Bounds]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+
+    return (
+        tuple(min(x, y) for x, y in zip(a[0], b[0])),
+        tuple(max(x, y) for x, y in zip(a[1], b[1])),
+    )
+
+
+@dataclass
+class GeometryLayout:
+    __slots__ = ("nodes",)
+
+    # Top level command list
+    nodes: List[GeoNode]
+
+    @classmethod
+    def parse_bytes(cls: 'GeometryLayout', data: bytes) -> 'GeometryLayout':
+        visited = set()
+
+        def parse_list(offset: int, depth: int) -> List[GeoNode]:
+            if depth > MAX_DEPTH:
+                raise ModelParseError(f"Geometry layout is nested deeper than {MAX_DEPTH}")
+
+            nodes = []
+
+            while True:
+                if offset + COMMAND_HEADER.size > len(data):
+                    raise ModelParseError(f"Geometry layout command at 0x{offset:x} is out of bounds")
+
+                if offset in visited:
+                    raise ModelParseError(f"Geometry layout command at 0x{offset:x} is reached twice")
+
+                visited.add(offset)
+
+                command, size = COMMAND_HEADER.unpack_from(data, offset)
+                nodes.append(parse_command(command, offset, size, depth))
+
+                if size == 0:
+                    return nodes
+
+                offset += size
+
+        def child_list(offset: int, child_offset: int, depth: int) -> List[GeoNode]:
+            if not child_offset:
+                return []
+
+            return parse_list(offset + child_offset, depth + 1)
+
+        def parse_command(command: int, offset: int, size: int, depth: int) -> GeoNode:
+            body = offset + COMMAND_HEADER.size
+            node = GeoNode(
+                type=command, offset=offset, display_lists=[], children=[],
+                properties={}, bounds=None
+            )
+
+            if command not in GeoCommandType._value2member_map_:
+                stats.count("layout.unknown_commands")
+                return node
+
+            node.type = GeoCommandType(command)
+
+            if node.type is GeoCommandType.SORT:
+                *plane, flags, front, back = SORT.unpack_from(data, body)
+                node.properties.update(point=tuple(plane[:3]), normal=tuple(plane[3:]), flags=flags)
+                node.children = child_list(offset, front, depth) + child_list(offset, back, depth)
+            elif node.type is GeoCommandType.BONE:
+                child_offset, bone = BONE.unpack_from(data, body)
+                node.properties["bone"] = bone
+                node.children = child_list(offset, child_offset, depth)
+            elif node.type is GeoCommandType.LOAD_DL:
+                start, count = LOAD_DL.unpack_from(data, body)
+                node.display_lists.append((start, count))
+            elif node.type is GeoCommandType.SKINNING:
+                # Display list starts, each drawn up to its G_ENDDL. A zero
+                # after the first entry is padding.
+                end = min(offset + size, len(data)) if size else len(data)
+
+                for i in range((end - body) // SKINNING_ENTRY.size):
+                    (start,) = SKINNING_ENTRY.unpack_from(data, body + i * SKINNING_ENTRY.size)
+
+                    if start == 0 and node.display_lists:
+                        break
+
+                    node.display_lists.append((start, None))
+            elif node.type is GeoCommandType.LOD:
+                max_distance, min_distance, *point, child_offset = LOD.unpack_from(data, body)
+                node.properties.update(
+                    max_distance=max_distance, min_distance=min_distance,
+                    point=tuple(point)
+                )
+                node.children = child_list(offset, child_offset, depth)
+            elif node.type is GeoCommandType.SELECTOR:
+                child_count, selector = SELECTOR.unpack_from(data, body)
+                node.properties["selector"] = selector
+
+                for i in range(child_count):
+                    (child_offset,) = SELECTOR_CHILD.unpack_from(
+                        data, body + SELECTOR.size + i * SELECTOR_CHILD.size
+                    )
+                    node.children += child_list(offset, child_offset, depth)
+            elif node.type is GeoCommandType.DRAW_DISTANCE:
+                *box, child_offset = DRAW_DISTANCE.unpack_from(data, body)
+                node.properties.update(min=tuple(box[:3]), max=tuple(box[3:]))
+                node.children = child_list(offset, child_offset, depth)
+
+            return node
+
+        try:
+            nodes = parse_list(0, 0)
+        except StructError as e:
+            # A command body running off the end of the data
+            raise ModelParseError(f"Geometry layout is truncated: {e}") from e
+
+        stats.count("layout.nodes", len(visited))
+
+        return GeometryLayout(nodes=nodes)
+
+    def walk(self) -> Iterator[GeoNode]:
+        for node in self.nodes:
+            yield from node.walk()
+
+    def find(self, offset: int) -> Optional[GeoNode]:
+        """
+        The node of the command at `offset`.
+        """
+
+        for node in self.walk():
+            if node.offset == offset:
+                return node
+
+        return None
+
+    def compute_bounds(self, display_list_setup_header, vertices: Sequence) -> None:
+        """
+        Fill in `bounds` of every node from the G_VTX loads of its display
+        list ranges. Vertices are transformed when they're loaded, so a load
+        is what places a vertex under a node, drawn or not.
+        """
+
+        def loaded_bounds(node: GeoNode) -> Optional[Bounds]:
+            bounds = None
+
+            for index in _loaded_vertices(display_list_setup_header, node.display_lists, len(vertices)):
+                position = vertices[index].position
+                bounds = _union(bounds, (position, position))
+
+            return bounds
+
+        def visit(node: GeoNode) -> Optional[Bounds]:
+            bounds = loaded_bounds(node)
+
+            for child in node.children:
+                bounds = _union(bounds, visit(child))
+
+            node.bounds = bounds
+
+            return bounds
+
+        for node in self.nodes:
+            visit(node)
+
+    def vertex_bones(self, display_list_setup_header, vertex_count: int) -> List[int]:
+        """
+        The bone each vertex is loaded under, from the innermost BONE command
+        around its G_VTX. Vertices outside every BONE command get bone 0.
+        """
+
+        bones = [0] * vertex_count
+
+        def visit(node: GeoNode, bone: int):
+            if node.type is GeoCommandType.BONE:
+                bone = node.properties["bone"]
+
+            for index in _loaded_vertices(display_list_setup_header, node.display_lists, vertex_count):
+                bones[index] = bone
+
+            for child in node.children:
+                visit(child, bone)
+
+        for node in self.nodes:
+            visit(node, 0)
+
+        return bones
+
+
+def _loaded_vertices(display_list_setup_header, ranges: Sequence[DisplayListRange],
+                     vertex_count: int) -> Iterator[int]:
+    """
+    Vertex store indices loaded by G_VTX commands in `ranges`.
+    """
+
+    for command in display_list_setup_header.iter_ranges(ranges):
+        if isinstance(command, F3DCommandGVtx):
+            first = (command.load_address & 0xFFFFFF) // 16
+
+            yield from range(first, min(first + command.verts_to_write, vertex_count))
+
+
+@dataclass
+class LayoutScene:
+    """
+    A geometry layout exported as a node tree, see `build_scene`.
+    """
+
+    __slots__ = ("geometry", "nodes", "source_vertices")
+
+    geometry: Geometry
+    nodes: List[SceneNode]
+    # Vertex store index of every geometry vertex
+    source_vertices: List[int]
+
+
+@stats.timed("layout_scene")
+def build_scene(model, root: Optional[GeoNode] = None) -> LayoutScene:
+    """
+    Simulate every node of the model's geometry layout (or the subtree under
+    `root`) separately, and gather the result as one SceneNode per layout
+    command. Vertices are copied per node so that every node gets its own
+    contiguous vertex range, and so its own bounds when exported.
+
+    Nodes are simulated in draw order with the RSP state carried from one
+    to the next, so a node drawing with the texture an earlier node loaded
+    still gets it.
+    """
+
+    from .model import DisplaylistState
+
+    layout = model.geometry_layout
+    state = DisplaylistState.initial()
+    vertices = model.vertex_store_setup_header.vertices
+
+    positions = []
+    colors = []
+    uvs = []
+    meshes = []
+    source_vertices = []
+
+    def visit(node: GeoNode) -> SceneNode:
+        scene_node = SceneNode(
+            name=node.name,
+            meshes=[],
+            vertex_range=(len(positions), 0),
+            children=[],
+            extras={"type": int(node.type)}
+        )
+
+        if node.bounds is not None:
+            scene_node.extras["bounds"] = {"min": list(node.bounds[0]), "max": list(node.bounds[1])}
+
+        if node.display_lists:
+            result = model.simulate_displaylist(node.display_lists, state)
+            remap = {}
+
+            for mesh in result.meshes:
+                indices = []
+
+                for triangle in mesh.indices:
+                    for vertex in triangle:
+                        if vertex not in remap:
+                            # Same attributes as Model.build_geometry
+                            remap[vertex] = len(positions)
+                            source = vertices[vertex]
+                            uv_scale = result.vertex_uv_scaling.get(vertex, (1.0, 1.0))
+
+                            positions.append(source.position)
+                            colors.append(source.rgb_or_norm)
+                            uvs.append((source.uv[0] * uv_scale[0], source.uv[1] * uv_scale[1]))
+                            source_vertices.append(vertex)
+
+                    indices.append(tuple(remap[vertex] for vertex in triangle))
+
+                scene_node.meshes.append(len(meshes))
+                meshes.append(Mesh(texture_index=mesh.texture_index, indices=indices, vertices=[]))
+
+            scene_node.vertex_range = (scene_node.vertex_range[0], len(remap))
+
+        scene_node.children = [visit(child) for child in node.children]
+
+        return scene_node
+
+    roots = [root] if root is not None else layout.nodes
+
+    return LayoutScene(
+        geometry=Geometry(positions=positions, colors=colors, uvs=uvs, meshes=meshes),
+        nodes=[visit(node) for node in roots],
+        source_vertices=source_vertices
+    )
@@ -0,0 +1,102 @@
+"""
+Parse errors and resource budgets.
+
+Every model parser checks the counts and offsets it reads against the
+length of the buffer before acting on them, so a corrupted or hacked model
+fails fast with a ModelParseError instead of looping over a bogus count,
+and parsing stays linear in the size of the input (see benchmarks/fuzz.py).
+
+A Budget additionally caps the size of a model and the wall time spent
+converting it, so one bad blob can't stall a batch:
+
+    budget = Budget(seconds=5, max_bytes=8 * 1024 * 1024)
+    budget.check_size(len(data))
+
+    with budget.deadline():
+        model = Model.parse_bytes(data)
+        ...
+"""
+
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+
+class ModelParseError(ValueError):
+    """
+    The model data is corrupt, truncated or not a model at all.
+    """
+
+
+class BudgetExceeded(ModelParseError):
+    """
+    A model went over its Budget.
+    """
+
+
+def require_bytes(what: str, end: int, available: int):
+    """
+    Raise a ModelParseError unless `end` bytes of `what` fit in the
+    `available` bytes of the buffer.
+    """
+
+    if end > available:
+        raise ModelParseError(f"{what} needs {end} bytes, only {available} available")
+
+
+@dataclass
+class Budget:
+    __slots__ = ("seconds", "max_bytes")
+
+    # Wall time allowed per model, None for no limit
+    seconds: Optional[float]
+    # Largest (decompressed) model accepted, None for no limit. Parsing is
+    # linear in the input, so this also bounds memory.
+    max_bytes: Optional[int]
+
+    def check_size(self, size: int):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise BudgetExceeded(f"Model is {size} bytes, over the budget of {self.max_bytes}")
+
+    @contextmanager
+    def deadline(self):
+        """
+        Raise BudgetExceeded in the block once it has run for `seconds`.
+
+        The block is interrupted with SIGALRM where that's available and
+        this is the main thread (as in the CLI and its worker processes).
+        Elsewhere it runs to the end, and is only failed afterwards.
+        Deadlines don't nest.
+        """
+
+        if self.seconds is None:
+            yield
+            return
+
+        interruptible = hasattr(signal, "setitimer") \
+            and threading.current_thread() is threading.main_thread()
+
+        if not interruptible:
+            start = time.perf_counter()
+
+            yield
+
+            if time.perf_counter() - start > self.seconds:
+                raise BudgetExceeded(f"Model took longer than {self.seconds}s")
+
+            return
+
+        def expired(signum, frame):
+            raise BudgetExceeded(f"Model took longer than {self.seconds}s")
+
+        previous = signal.signal(signal.SIGALRM, expired)
+        signal.setitimer(signal.ITIMER_REAL, self.seconds)
+
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
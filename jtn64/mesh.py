@@ -1,10 +1,46 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from .f3d import Vertex
 
 
 @dataclass
 class Mesh:
+    __slots__ = ("texture_index", "indices", "vertices")
+
     texture_index: Optional[int]
     indices: List[int]
     vertices: List[Vertex]
+
+
+@dataclass
+class Geometry:
+    """
+    Flattened vertex attributes shared by a list of meshes, ready to be
+    written out. Positions are kept in N64 units, UVs are already scaled by
+    the G_TEXTURE state the display list was in.
+    """
+
+    __slots__ = ("positions", "colors", "uvs", "meshes")
+
+    positions: List[Tuple[int, int, int]]
+    colors: List[Tuple[int, int, int]]
+    uvs: List[Tuple[float, float]]
+    meshes: List[Mesh]
+
+
+@dataclass
+class SceneNode:
+    """
+    A node of an exported node tree, see `jtn64.layout.build_scene`.
+    `meshes` index Geometry.meshes, and every vertex they use lies in the
+    (start, count) `vertex_range` of the geometry, so the node can get its
+    own vertex accessors and bounds.
+    """
+
+    __slots__ = ("name", "meshes", "vertex_range", "children", "extras")
+
+    name: str
+    meshes: List[int]
+    vertex_range: Tuple[int, int]
+    children: List['SceneNode']
+    extras: dict
@@ -1,15 +1,21 @@
-
-from PIL import Image
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from struct import unpack
-from typing import List, Tuple, Dict
-from . import textures
+from struct import error as StructError, unpack
+from typing import Iterable, Iterator, List, Optional, Tuple, Dict, TYPE_CHECKING
+from . import textures, stats
 from .util import BitReader, print_hex, print_bin
 from .f3d import Vertex, F3DCommandType, F3DCommandGVtx, F3DCommandGTri1, \
     F3DCommandGTri2, F3DCommandGTexture, F3DCommandSetTImg, \
     F3DCommandSetTImgTextureFormat, F3DCommandDL, F3DCommandEndDL
 from .textures import TextureType
-from .mesh import Mesh
+from .mesh import Mesh, Geometry
+from .animation import BoneSetup
+from .collision import CollisionList
+from .layout import DisplayListRange, GeometryLayout
+from .limits import ModelParseError, require_bytes
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 @dataclass
@@ -18,6 +24,13 @@ class ModelHeader:
     Descriptions from https://hack64.net/wiki/doku.php?id=banjo_kazooie:model_data
     """
 
+    __slots__ = (
+        "geometry_layout_offset", "texture_setup_offset",
+        "display_list_setup_offset", "vertex_store_setup_offset",
+        "animation_setup_offset", "collision_setup_offset", "vert_count",
+        "tri_count",
+    )
+
     geometry_layout_offset: int
     texture_setup_offset: int
     display_list_setup_offset: int
@@ -30,6 +43,11 @@ class ModelHeader:
 
 @dataclass
 class TextureSubHeader:
+    __slots__ = (
+        "segment_address_offset", "texture_type", "width", "height",
+        "texture_data_length",
+    )
+
     segment_address_offset: int
     texture_type: TextureType
     width: int
@@ -40,7 +58,11 @@ class TextureSubHeader:
     def parse_bytes(cls: 'TextureSubHeader', data: bytes) -> 'TextureSubHeader':
         segment_address_offset, texture_type = unpack(">IH", data[0:6])
         width, height = unpack(">BB", data[8:10])
-        texture_type = TextureType(texture_type)
+
+        try:
+            texture_type = TextureType(texture_type)
+        except ValueError:
+            raise ModelParseError(f"Unknown texture type {texture_type}") from None
 
         if texture_type is TextureType.CI4:
             texture_data_length = (2 * 2**4) + (width * height / 2)
@@ -64,14 +86,31 @@ class TextureSubHeader:
 
 @dataclass
 class TextureSetupHeader:
+    # _offsets and _ends index the sub headers for `find_texture`, they are
+    # built once in __post_init__.
+    __slots__ = (
+        "data_length", "texture_count", "texture_sub_headers", "_offsets", "_ends",
+    )
+
     data_length: int
     texture_count: int
     texture_sub_headers: List[TextureSubHeader]
 
+    def __post_init__(self):
+        self._offsets = [
+            texture.segment_address_offset for texture in self.texture_sub_headers
+        ]
+        self._ends = [
+            texture.segment_address_offset + texture.texture_data_length
+            for texture in self.texture_sub_headers
+        ]
+
     @classmethod
     def parse_bytes(cls: 'TextureSetupHeader', data: bytes) -> 'TextureSetupHeader':
         data_length, texture_count = unpack(">IH", data[0:6])
 
+        require_bytes("Texture setup", 8 + texture_count * 16, len(data))
+
         texture_sub_headers = []
 
         for i in range(texture_count):
@@ -92,28 +131,43 @@ class TextureSetupHeader:
             texture_sub_headers=texture_sub_headers
         )
 
-    def find_nearest_texture(self, segment_address: int):
-        # TODO: this could be a binary search and make Google interviwers happy.
+    def find_nearest_texture(self, segment_address: int) -> Optional[int]:
+        """
+        Index of the last texture starting at or before `segment_address`.
+        Sub headers are sorted by offset, so this is a binary search.
+        """
+
+        index = bisect_right(self._offsets, segment_address) - 1
+
+        return index if index >= 0 else None
+
+    def find_texture(self, segment_address: int) -> Optional[int]:
+        """
+        Like `find_nearest_texture`, but None unless `segment_address` falls
+        inside that texture's data.
+        """
 
-        nearest = None
+        index = self.find_nearest_texture(segment_address)
 
-        for i, texture in enumerate(self.texture_sub_headers):
-            if texture.segment_address_offset <= segment_address:
-                nearest = i
-            else:
-                break
+        if index is None or segment_address >= self._ends[index]:
+            return None
 
-        return nearest
+        return index
 
 
 @dataclass
 class TextureData:
+    __slots__ = ("width", "height", "data", "texture_type")
+
     width: int
     height: int
     data: bytes
     texture_type: TextureType
 
+    @stats.timed("texture_decode")
     def to_rgba(self) -> List[Tuple[int, int, int, int]]:
+        stats.count("texture_decode.pixels", self.width * self.height)
+
         result = []
 
         if self.texture_type is TextureType.CI4:
@@ -126,13 +180,14 @@ class TextureData:
             # colors since its a 4 bit palette, so image data starts at 32
             reader = BitReader(self.data[16*2:])
 
-            for i in range(self.width * self.height):
-                color_index = reader.read_sub(4)
+            for color_index in reader.read_many(4, self.width * self.height).tolist():
+                result.append(palette[color_index])
+        elif self.texture_type is TextureType.CI8:
+            palette = textures.read_palette_rgb555a(self.data, 256)
 
+            for color_index in self.data[256*2:256*2 + self.width * self.height]:
                 result.append(palette[color_index])
         elif self.texture_type is TextureType.RGBA16:
-            reader = BitReader(self.data)
-
             for color in textures.iter_colors_rgb555a(self.data, self.width * self.height):
                 result.append(color)
         elif self.texture_type is TextureType.IA8:
@@ -141,32 +196,95 @@ class TextureData:
 
         return result
 
-    def to_image(self) -> Image:
-        image = Image.new('RGBA', (self.width, self.height))
+    @property
+    def is_palettized(self) -> bool:
+        return self.texture_type in textures.PALETTE_SIZES
+
+    @stats.timed("texture_decode")
+    def to_indexed_image(self) -> 'Image.Image':
+        """
+        Build a mode "P" image for a CI4/CI8 texture straight from its
+        palette and index data, without expanding pixels to RGBA. The palette
+        alpha is kept in `info["transparency"]`, which PNG writes as tRNS.
+        """
+
+        from PIL import Image
+
+        palette_size = textures.PALETTE_SIZES[self.texture_type]
+        palette = textures.read_palette_rgb555a(self.data, palette_size)
 
-        for p, color in enumerate(self.to_rgba()):
-            # y = self.height - (p // self.width) - 1
-            y = p // self.width
-            x = p % self.width
+        stats.count("texture_decode.pixels", self.width * self.height)
 
-            image.putpixel((x, y), color)
+        image = Image.frombytes(
+            "P", (self.width, self.height), self.data[palette_size * 2:],
+            "raw", "P;4" if self.texture_type is TextureType.CI4 else "P"
+        )
+
+        image.putpalette(
+            bytes(c for color in palette for c in color[:3]), "RGB"
+        )
+        image.info["transparency"] = bytes(color[3] for color in palette)
 
         return image
 
+    @stats.timed("texture_image")
+    def to_image(self, rgba: bool = False) -> 'Image.Image':
+        """
+        Palettized textures come back as mode "P" images unless `rgba` is
+        set, everything else as RGBA.
+        """
+
+        from PIL import Image
+
+        if self.is_palettized and not rgba:
+            return self.to_indexed_image()
+
+        return Image.frombytes(
+            "RGBA", (self.width, self.height),
+            bytes(c for color in self.to_rgba() for c in color)
+        )
+
+
+# Vertices the RSP vertex cache holds
+VERTEX_BUFFER_SIZE = 32
+
+
+def _check_triangle(command_index: int, vertices: bytes):
+    # Vertex cache indices are stored doubled
+    if max(vertices) // 2 >= VERTEX_BUFFER_SIZE:
+        raise ModelParseError(
+            f"Triangle at {command_index} uses a vertex past the vertex buffer"
+        )
+
 
 @dataclass
 class DisplayListSetupHeader:
+    __slots__ = ("command_count", "commands", "command_indices")
+
     command_count: int
     commands: list
+    # Position of each parsed command in the display list. Commands that
+    # aren't emulated are skipped, so this is how display list ranges (see
+    # `jtn64.layout`) map onto `commands`.
+    command_indices: List[int]
 
     @classmethod
     def parse_bytes(cls: 'DisplayListSetupHeader', data: bytes) -> 'DisplayListSetupHeader':
         command_count = unpack(">I", data[0:4])[0]
         commands = []
+        command_indices = []
+
+        require_bytes("Display list", 8 + command_count * 8, len(data))
 
         for i in range(command_count):
             command_data = data[i*8 + 8:i*8 + 16]
-            command_type = F3DCommandType(command_data[0])
+
+            try:
+                command_type = F3DCommandType(command_data[0])
+            except ValueError:
+                raise ModelParseError(
+                    f"Unknown display list command 0x{command_data[0]:02x} at {i}"
+                ) from None
 
             if command_type is F3DCommandType.G_VTX:
                 # [II] [xx xx] [SS SS SS SS]
@@ -178,6 +296,12 @@ class DisplayListSetupHeader:
                 verts_to_write = vert_len >> 10
                 vert_data_len = vert_len & 0b0000001111111111
 
+                if write_start + verts_to_write > VERTEX_BUFFER_SIZE:
+                    raise ModelParseError(
+                        f"G_VTX at {i} loads {verts_to_write} vertices at"
+                        f" {write_start}, past the vertex buffer"
+                    )
+
                 commands.append(
                     F3DCommandGVtx(
                         write_start=write_start,
@@ -187,6 +311,8 @@ class DisplayListSetupHeader:
                     )
                 )
             elif command_type is F3DCommandType.G_TRI1:
+                _check_triangle(i, command_data[5:8])
+
                 commands.append(
                     F3DCommandGTri1(
                         vertex_1=command_data[5] // 2,
@@ -195,6 +321,8 @@ class DisplayListSetupHeader:
                     )
                 )
             elif command_type is F3DCommandType.G_TRI2:
+                _check_triangle(i, command_data[1:4] + command_data[5:8])
+
                 commands.append(
                     F3DCommandGTri2(
                         vertex_1=command_data[1] // 2,
@@ -251,14 +379,47 @@ class DisplayListSetupHeader:
             elif command_type is F3DCommandType.G_ENDDL:
                 commands.append(F3DCommandEndDL())
 
+            if len(commands) > len(command_indices):
+                command_indices.append(i)
+
         return DisplayListSetupHeader(
             command_count=command_count,
-            commands=commands
+            commands=commands,
+            command_indices=command_indices
         )
 
+    def command_slice(self, start: int, count: Optional[int] = None) -> slice:
+        """
+        The slice of `commands` parsed from `count` display list commands
+        starting at command `start`. Without `count`, the range runs up to
+        and including the next G_ENDDL.
+        """
+
+        first = bisect_left(self.command_indices, start)
+
+        if count is not None:
+            return slice(first, bisect_left(self.command_indices, start + count))
+
+        for i in range(first, len(self.commands)):
+            if isinstance(self.commands[i], F3DCommandEndDL):
+                return slice(first, i + 1)
+
+        return slice(first, len(self.commands))
+
+    def iter_ranges(self, ranges: Iterable[DisplayListRange]) -> Iterator:
+        """
+        Parsed commands of each (start, count) range in turn, see
+        `command_slice`.
+        """
+
+        for start, count in ranges:
+            yield from self.commands[self.command_slice(start, count)]
+
 
 @dataclass
 class VertexStoreSetupHeader:
+    __slots__ = ("vertices",)
+
     vertices: List[Vertex]
 
     @classmethod
@@ -268,6 +429,8 @@ class VertexStoreSetupHeader:
         vertex_count_doubled = unpack(">H", data[offset:offset + 2])[0]
         vertices = []
 
+        require_bytes("Vertex store", 0x18 + vertex_count_doubled * 16, len(data))
+
         for i in range(vertex_count_doubled):
             start_offset = 0x18 + i * 16
             end_offset = start_offset + 16
@@ -281,10 +444,44 @@ class VertexStoreSetupHeader:
         )
 
 
+@dataclass
+class DisplaylistState:
+    """
+    RSP state that carries over from one display list to the next: the
+    vertex cache, the current texture and the G_TEXTURE scale.
+    """
+
+    __slots__ = (
+        "vertex_index_buffer", "texture_index", "scaling_factor_s", "scaling_factor_t",
+    )
+
+    vertex_index_buffer: List[Optional[int]]
+    texture_index: Optional[int]
+    scaling_factor_s: float
+    scaling_factor_t: float
+
+    @classmethod
+    def initial(cls: 'DisplaylistState') -> 'DisplaylistState':
+        return DisplaylistState(
+            vertex_index_buffer=[None] * VERTEX_BUFFER_SIZE,
+            texture_index=None,
+            scaling_factor_s=1.0,
+            scaling_factor_t=1.0
+        )
+
+
 @dataclass
 class SimulateDisplaylistResult:
+    __slots__ = ("meshes", "vertex_uv_scaling", "unresolved_textures")
+
     meshes: List[Mesh]
     vertex_uv_scaling: Dict[int, Tuple[float, float]]
+    # G_SETTIMG addresses that don't point into any texture. Meshes drawn
+    # with them get no texture.
+    unresolved_textures: List[int]
+
+
+MODEL_HEADER_SIZE = 52
 
 
 @dataclass
@@ -293,6 +490,12 @@ class Model:
     Represents the whole 3D Model.
     """
 
+    __slots__ = (
+        "model_header", "texture_setup_header", "texture_data",
+        "display_list_setup_header", "vertex_store_setup_header", "collision",
+        "bone_setup", "geometry_layout",
+    )
+
     model_header: ModelHeader
 
     texture_setup_header: TextureSetupHeader
@@ -301,8 +504,38 @@ class Model:
     display_list_setup_header: DisplayListSetupHeader
     vertex_store_setup_header: VertexStoreSetupHeader
 
+    # None when the model has no collision setup
+    collision: Optional[CollisionList]
+
+    # None when the model has no animation setup
+    bone_setup: Optional[BoneSetup]
+
+    # None when the model has no geometry layout. Node bounds are filled in.
+    geometry_layout: Optional[GeometryLayout]
+
     @classmethod
+    @stats.timed("parse")
     def parse_bytes(cls: 'Model', data: bytes) -> 'Model':
+        """
+        Parse a decompressed model. Raises ModelParseError if the data is
+        truncated or corrupt.
+        """
+
+        stats.count("parse.bytes", len(data))
+
+        try:
+            return cls._parse_bytes(data)
+        except ModelParseError:
+            raise
+        except (StructError, IndexError, ValueError) as e:
+            # Anything the section parsers didn't check explicitly, e.g. an
+            # unknown enum value
+            raise ModelParseError(f"Corrupt model: {e}") from e
+
+    @classmethod
+    def _parse_bytes(cls: 'Model', data: bytes) -> 'Model':
+        require_bytes("Model header", MODEL_HEADER_SIZE, len(data))
+
         start, \
             geometry_layout_offset, \
             texture_setup_offset, \
@@ -318,11 +551,25 @@ class Model:
             _unused_3, \
             tri_count, \
             vert_count = unpack(
-                ">IIHHIIIIIIIIIHH", data[0:52]
+                ">IIHHIIIIIIIIIHH", data[0:MODEL_HEADER_SIZE]
             )
 
         if start != 0x0B:
-            raise ValueError(f"Invalid magic byte, got {start:x}")
+            raise ModelParseError(f"Invalid magic byte, got {start:x}")
+
+        for name, offset in (
+            ("Geometry layout", geometry_layout_offset),
+            ("Texture setup", texture_setup_offset),
+            ("Display list setup", display_list_setup_offset),
+            ("Vertex store setup", vertex_store_setup_offset),
+            ("Animation setup", animation_setup_offset),
+            ("Collision setup", collision_setup_offset),
+        ):
+            if offset >= len(data):
+                raise ModelParseError(
+                    f"{name} offset 0x{offset:x} is past the end of the model"
+                    f" ({len(data)} bytes)"
+                )
 
         model_header = ModelHeader(
             geometry_layout_offset=geometry_layout_offset,
@@ -351,6 +598,8 @@ class Model:
                 texture_data_start + sub_texture.texture_data_length
             )
 
+            require_bytes("Texture data", texture_data_end, len(data))
+
             texture_data.append(
                 TextureData(
                     width=sub_texture.width,
@@ -368,35 +617,105 @@ class Model:
             data[vertex_store_setup_offset:]
         )
 
+        collision = None
+
+        if collision_setup_offset:
+            collision = CollisionList.parse_bytes(
+                data[collision_setup_offset:], len(vertex_store_setup_header.vertices)
+            )
+
+        bone_setup = None
+
+        if animation_setup_offset:
+            bone_setup = BoneSetup.parse_bytes(data[animation_setup_offset:])
+
+        geometry_layout = None
+
+        if geometry_layout_offset:
+            geometry_layout = GeometryLayout.parse_bytes(data[geometry_layout_offset:])
+            geometry_layout.compute_bounds(
+                display_list_setup_header, vertex_store_setup_header.vertices
+            )
+
+        stats.count("parse.commands", display_list_setup_header.command_count)
+        stats.count("parse.vertices", len(vertex_store_setup_header.vertices))
+        stats.count("parse.textures", len(texture_data))
+
         return Model(
             model_header=model_header,
             texture_setup_header=texture_setup_header,
             texture_data=texture_data,
             display_list_setup_header=display_list_setup_header,
-            vertex_store_setup_header=vertex_store_setup_header
+            vertex_store_setup_header=vertex_store_setup_header,
+            collision=collision,
+            bone_setup=bone_setup,
+            geometry_layout=geometry_layout
+        )
+
+    def build_geometry(self, displaylist_result: SimulateDisplaylistResult = None) -> Geometry:
+        """
+        Gather the vertex attributes used by the simulated display list.
+        """
+
+        if displaylist_result is None:
+            displaylist_result = self.simulate_displaylist()
+
+        vertices = self.vertex_store_setup_header.vertices
+        uv_scaling = displaylist_result.vertex_uv_scaling
+
+        uvs = []
+
+        for vertex_index, vertex in enumerate(vertices):
+            # Fetch the UV scale from the Displaylist result, since it modifies
+            # the vertex buffer
+            uv_scale = uv_scaling.get(vertex_index, (1.0, 1.0))
+
+            uvs.append((
+                float(vertex.uv[0]) * uv_scale[0],
+                float(vertex.uv[1]) * uv_scale[1],
+            ))
+
+        return Geometry(
+            positions=[vertex.position for vertex in vertices],
+            colors=[vertex.rgb_or_norm for vertex in vertices],
+            uvs=uvs,
+            meshes=displaylist_result.meshes
         )
 
-    def simulate_displaylist(self) -> SimulateDisplaylistResult:
+    @stats.timed("simulate")
+    def simulate_displaylist(self, ranges: Optional[Iterable[DisplayListRange]] = None,
+                             state: Optional[DisplaylistState] = None) -> SimulateDisplaylistResult:
         """
-        Walk through the display list and render a list of Meshes.
+        Walk through the display list and render a list of Meshes. With
+        `ranges`, only those (start, count) ranges of the display list are
+        walked, e.g. the ones drawn by part of the geometry layout (see
+        `jtn64.layout.GeoNode.subtree_display_lists`). `state` starts the
+        walk where an earlier one left off, and is updated to where this one
+        ends.
         """
 
         result = SimulateDisplaylistResult(
             meshes=[],
-            vertex_uv_scaling={}
+            vertex_uv_scaling={},
+            unresolved_textures=[]
         )
 
-        vertex_index_buffer = [None] * 32
+        if state is None:
+            state = DisplaylistState.initial()
+
+        vertex_index_buffer = state.vertex_index_buffer
 
-        scaling_factor_s = 1.0
-        scaling_factor_t = 1.0
+        scaling_factor_s = state.scaling_factor_s
+        scaling_factor_t = state.scaling_factor_t
 
         current_mesh = Mesh(
-            texture_index=None,
+            texture_index=state.texture_index,
             indices=[],
             vertices=[]
         )
 
+        find_texture = self.texture_setup_header.find_texture
+
         def _scale_vertex_uv(index):
             if index not in result.vertex_uv_scaling:
                 # print(f"Adding {index} to vertex_uv_scaling")
@@ -405,7 +724,12 @@ class Model:
                     scaling_factor_s, scaling_factor_t
                 )
 
-        for command in self.display_list_setup_header.commands:
+        commands = self.display_list_setup_header.commands
+
+        if ranges is not None:
+            commands = self.display_list_setup_header.iter_ranges(ranges)
+
+        for command in commands:
             if isinstance(command, F3DCommandGVtx):
                 # G_VTX
 
@@ -456,7 +780,10 @@ class Model:
                 # Every time we hit a SETTIMG, just start a new mesh.
 
                 texture_offset = command.texture_segment_address - 0x02000000
-                texture_index = self.texture_setup_header.find_nearest_texture(texture_offset)
+                texture_index = find_texture(texture_offset)
+
+                if texture_index is None:
+                    result.unresolved_textures.append(command.texture_segment_address)
 
                 if texture_index != current_mesh.texture_index:
                     if current_mesh.indices:
@@ -491,4 +818,15 @@ class Model:
         if current_mesh and current_mesh.indices:
             result.meshes.append(current_mesh)
 
+        state.texture_index = current_mesh.texture_index
+        state.scaling_factor_s = scaling_factor_s
+        state.scaling_factor_t = scaling_factor_t
+
+        stats.count("simulate.meshes", len(result.meshes))
+        stats.count("simulate.unresolved_textures", len(result.unresolved_textures))
+        stats.count(
+            "simulate.triangles",
+            sum(len(mesh.indices) for mesh in result.meshes)
+        )
+
         return result
@@ -0,0 +1,231 @@
+"""
+Index and vertex buffer reordering for modern GPUs.
+
+The triangle order that comes out of the display list follows the N64's 32
+entry vertex buffer, which says little about how well it uses a post-transform
+vertex cache. `optimize_geometry` reorders the triangles of every mesh with
+Tom Forsyth's "Linear-Speed Vertex Cache Optimisation", then reorders the
+vertex buffer by first use so vertex fetches walk memory forwards.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from . import stats
+from .mesh import Geometry, Mesh
+
+Triangle = Tuple[int, int, int]
+
+# Tuning constants from Forsyth's article
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+DEFAULT_CACHE_SIZE = 32
+
+
+@dataclass
+class OptimizeReport:
+    acmr_before: float
+    acmr_after: float
+    vertices_before: int
+    vertices_after: int
+
+
+def cache_misses(triangles: Sequence[Triangle], cache_size: int = DEFAULT_CACHE_SIZE) -> int:
+    """
+    Count vertex transforms for `triangles` with a FIFO post-transform cache.
+    """
+
+    cache = []
+    cached = set()
+    misses = 0
+
+    for triangle in triangles:
+        for vertex in triangle:
+            if vertex in cached:
+                continue
+
+            misses += 1
+            cache.append(vertex)
+            cached.add(vertex)
+
+            if len(cache) > cache_size:
+                cached.discard(cache.pop(0))
+
+    return misses
+
+
+def acmr(triangles: Sequence[Triangle], cache_size: int = DEFAULT_CACHE_SIZE) -> float:
+    """
+    Average cache miss ratio: vertex transforms per triangle.
+    """
+
+    if not triangles:
+        return 0.0
+
+    return cache_misses(triangles, cache_size) / len(triangles)
+
+
+def _vertex_score(cache_position: int, remaining: int, cache_size: int) -> float:
+    if remaining == 0:
+        return -1.0
+
+    score = 0.0
+
+    if cache_position >= 0:
+        if cache_position < 3:
+            # The vertices of the last triangle are deliberately given a
+            # fixed score, so strips don't get favoured over fans.
+            score = LAST_TRIANGLE_SCORE
+        else:
+            scale = 1.0 / (cache_size - 3)
+            score = (1.0 - (cache_position - 3) * scale) ** CACHE_DECAY_POWER
+
+    return score + VALENCE_BOOST_SCALE * remaining ** -VALENCE_BOOST_POWER
+
+
+def optimize_vertex_cache(triangles: Sequence[Triangle],
+                          cache_size: int = DEFAULT_CACHE_SIZE) -> List[Triangle]:
+    """
+    Reorder `triangles` for post-transform vertex cache locality.
+    """
+
+    triangle_count = len(triangles)
+
+    if triangle_count < 2:
+        return list(triangles)
+
+    vertex_triangles: Dict[int, List[int]] = {}
+
+    for t, triangle in enumerate(triangles):
+        for vertex in triangle:
+            vertex_triangles.setdefault(vertex, []).append(t)
+
+    remaining = {vertex: len(t) for vertex, t in vertex_triangles.items()}
+    vertex_scores = {
+        vertex: _vertex_score(-1, count, cache_size)
+        for vertex, count in remaining.items()
+    }
+    triangle_scores = [
+        sum(vertex_scores[vertex] for vertex in triangle)
+        for triangle in triangles
+    ]
+
+    emitted = [False] * triangle_count
+    result = []
+    cache: List[int] = []
+    scan_position = 0
+
+    best = max(range(triangle_count), key=triangle_scores.__getitem__)
+
+    while True:
+        triangle = triangles[best]
+
+        emitted[best] = True
+        result.append(triangle)
+
+        for vertex in triangle:
+            remaining[vertex] -= 1
+            vertex_triangles[vertex].remove(best)
+
+        # Move the triangle's vertices to the front of the LRU cache. The
+        # cache holds three extra entries so evicted vertices still get their
+        # scores updated.
+        cache = list(triangle) + [v for v in cache if v not in triangle]
+        evicted = cache[cache_size:]
+        del cache[cache_size:]
+
+        touched = set()
+
+        for position, vertex in enumerate(cache):
+            vertex_scores[vertex] = _vertex_score(position, remaining[vertex], cache_size)
+            touched.update(vertex_triangles[vertex])
+
+        for vertex in evicted:
+            vertex_scores[vertex] = _vertex_score(-1, remaining[vertex], cache_size)
+            touched.update(vertex_triangles[vertex])
+
+        best = -1
+        best_score = -1.0
+
+        for t in touched:
+            score = sum(vertex_scores[vertex] for vertex in triangles[t])
+            triangle_scores[t] = score
+
+            if score > best_score:
+                best = t
+                best_score = score
+
+        if best < 0:
+            # Nothing left next to the cache, so carry on with the first
+            # triangle that hasn't been emitted yet.
+            while scan_position < triangle_count and emitted[scan_position]:
+                scan_position += 1
+
+            if scan_position == triangle_count:
+                break
+
+            best = scan_position
+
+    return result
+
+
+@stats.timed("optimize")
+def optimize_geometry(geometry: Geometry,
+                      cache_size: int = DEFAULT_CACHE_SIZE) -> Tuple[Geometry, OptimizeReport]:
+    """
+    Reorder the triangles of every mesh for vertex cache locality, then
+    reorder (and drop unused) vertices in order of first use.
+    """
+
+    before_misses = 0
+    after_misses = 0
+    triangle_count = 0
+
+    meshes = []
+
+    for mesh in geometry.meshes:
+        indices = optimize_vertex_cache(mesh.indices, cache_size)
+
+        before_misses += cache_misses(mesh.indices, cache_size)
+        after_misses += cache_misses(indices, cache_size)
+        triangle_count += len(indices)
+
+        meshes.append(Mesh(
+            texture_index=mesh.texture_index,
+            indices=indices,
+            vertices=mesh.vertices
+        ))
+
+    remap: Dict[int, int] = {}
+
+    for mesh in meshes:
+        for triangle in mesh.indices:
+            for vertex in triangle:
+                if vertex not in remap:
+                    remap[vertex] = len(remap)
+
+    for mesh in meshes:
+        mesh.indices = [
+            (remap[a], remap[b], remap[c]) for a, b, c in mesh.indices
+        ]
+
+    order = list(remap)
+
+    optimized = Geometry(
+        positions=[geometry.positions[i] for i in order],
+        colors=[geometry.colors[i] for i in order],
+        uvs=[geometry.uvs[i] for i in order],
+        meshes=meshes
+    )
+
+    report = OptimizeReport(
+        acmr_before=before_misses / triangle_count if triangle_count else 0.0,
+        acmr_after=after_misses / triangle_count if triangle_count else 0.0,
+        vertices_before=len(geometry.positions),
+        vertices_after=len(order),
+    )
+
+    return optimized, report
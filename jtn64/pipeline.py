@@ -0,0 +1,141 @@
+"""
+Overlapped batch conversion.
+
+Converting a directory of models one at a time leaves the disk idle while
+the CPU works and the other way around. `run_pipeline` runs three stages
+concurrently on an asyncio loop, joined by bounded queues:
+
+    read (I/O executor) -> convert (CPU executor) -> write (I/O executor)
+
+The reader prefetches up to `prefetch` inputs ahead of the converters, and
+the converters block once `prefetch` results are waiting to be written, so
+a slow stage throttles the ones feeding it instead of filling memory. With
+the stages overlapped, a batch takes about as long as its slowest stage
+rather than the sum of all three.
+
+`convert` runs on `cpu_executor`, usually a ProcessPoolExecutor, so it has
+to be picklable: a module level function, or a functools.partial of one.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from . import stats
+
+DEFAULT_PREFETCH = 4
+
+# (output path, data) pairs
+Outputs = List[Tuple[str, bytes]]
+
+# Marks the end of a queue
+_DONE = object()
+
+
+def read_file(path: str) -> bytes:
+    return Path(path).read_bytes()
+
+
+def write_file(path: str, data: bytes):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+async def _run(paths: Iterable[str], convert: Callable, cpu_executor: Executor,
+               io_executor: Executor, workers: int, prefetch: int,
+               on_result: Optional[Callable], read: Callable, write: Callable):
+    loop = asyncio.get_running_loop()
+
+    read_queue: asyncio.Queue = asyncio.Queue(prefetch)
+    write_queue: asyncio.Queue = asyncio.Queue(prefetch)
+    running_converters = workers
+
+    async def reader():
+        for path in paths:
+            data = await loop.run_in_executor(io_executor, read, path)
+            await read_queue.put((path, data))
+
+        for _ in range(workers):
+            await read_queue.put(_DONE)
+
+    async def converter():
+        nonlocal running_converters
+
+        while True:
+            item = await read_queue.get()
+
+            if item is _DONE:
+                break
+
+            path, data = item
+            result = await loop.run_in_executor(cpu_executor, convert, path, data)
+            await write_queue.put((path, result))
+
+        running_converters -= 1
+
+        if running_converters == 0:
+            await write_queue.put(_DONE)
+
+    async def writer():
+        while True:
+            item = await write_queue.get()
+
+            if item is _DONE:
+                return
+
+            path, (outputs, extra) = item
+
+            for output_path, data in outputs:
+                with stats.timer("write"):
+                    await loop.run_in_executor(io_executor, write, output_path, data)
+
+                stats.count("write.bytes", len(data))
+
+            stats.count("pipeline.models")
+
+            if on_result is not None:
+                on_result(path, extra)
+
+    tasks = [
+        asyncio.ensure_future(reader()),
+        *(asyncio.ensure_future(converter()) for _ in range(workers)),
+        asyncio.ensure_future(writer()),
+    ]
+
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+        for task in done:
+            # Re-raise the first failure, if any
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_pipeline(paths: Iterable[str], convert: Callable[[str, bytes], Tuple[Outputs, object]],
+                 cpu_executor: Executor, workers: int, prefetch: int = DEFAULT_PREFETCH,
+                 on_result: Optional[Callable[[str, object], None]] = None,
+                 io_workers: int = 4, read: Callable[[str], bytes] = read_file,
+                 write: Callable[[str, bytes], None] = write_file):
+    """
+    Convert every file in `paths`. `convert(path, data)` returns the files
+    to write as (path, data) pairs, and an extra value handed to
+    `on_result(path, extra)` once they're written. `workers` conversions
+    run at a time, which should match the size of `cpu_executor`.
+
+    An exception in any stage stops the pipeline and is raised here.
+    """
+
+    if workers < 1:
+        raise ValueError(f"Pipeline needs at least one worker, got {workers}")
+
+    with ThreadPoolExecutor(io_workers, thread_name_prefix="pipeline-io") as io_executor:
+        asyncio.run(_run(
+            paths, convert, cpu_executor, io_executor, workers, max(prefetch, 1),
+            on_result, read, write
+        ))
@@ -0,0 +1,169 @@
+"""
+cProfile and sampling profiler hooks for CLI commands.
+
+`start()` enables a deterministic cProfile profiler together with a sampling
+thread that periodically records the stack of the profiled thread. `stop()`
+writes:
+
+    <prefix>.pstats      cProfile statistics, readable with `pstats`/snakeviz
+    <prefix>.collapsed   "frame;frame;frame count" lines for flamegraph.pl or
+                         speedscope
+
+With `per_model` set, each `model_scope` gets its own `<prefix>.<model>.pstats`
+and the collapsed stacks are rooted at a `model:<name>` frame.
+"""
+
+import cProfile
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every `interval` seconds from a
+    background thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.label: Optional[str] = None
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            if frame is None:
+                continue
+
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+
+            if self.label is not None:
+                stack.append(f"model:{self.label}")
+
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path: Path):
+        with path.open("w") as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    def __init__(self, prefix: str, per_model: bool = False, interval: float = 0.001):
+        self.prefix = prefix
+        self.per_model = per_model
+
+        self.profile = cProfile.Profile()
+        self.model_profiles: Dict[str, cProfile.Profile] = {}
+        self.sampler = SamplingProfiler(threading.get_ident(), interval)
+
+    def start(self):
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self) -> List[Path]:
+        """
+        Stop profiling and write the output files. Returns the written paths.
+        """
+
+        self.profile.disable()
+        self.sampler.stop()
+
+        written = []
+
+        combined = pstats.Stats(self.profile)
+
+        for name, profile in self.model_profiles.items():
+            model_stats = pstats.Stats(profile)
+            combined.add(model_stats)
+
+            model_path = Path(f"{self.prefix}.{_safe_name(name)}.pstats")
+            model_stats.dump_stats(model_path)
+            written.append(model_path)
+
+        pstats_path = Path(f"{self.prefix}.pstats")
+        combined.dump_stats(pstats_path)
+        written.insert(0, pstats_path)
+
+        collapsed_path = Path(f"{self.prefix}.collapsed")
+        self.sampler.write_collapsed(collapsed_path)
+        written.insert(1, collapsed_path)
+
+        return written
+
+    @contextmanager
+    def model_scope(self, name: str):
+        if not self.per_model:
+            yield
+            return
+
+        # Only one cProfile profiler can be active at a time, so the main one
+        # is paused while the model has its own.
+        profile = self.model_profiles.setdefault(name, cProfile.Profile())
+
+        self.profile.disable()
+        self.sampler.label = name
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.sampler.label = None
+            self.profile.enable()
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", Path(name).name)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def start(prefix: str, per_model: bool = False, interval: float = 0.001) -> Profiler:
+    global _profiler
+
+    _profiler = Profiler(prefix, per_model, interval)
+    _profiler.start()
+
+    return _profiler
+
+
+def stop() -> List[Path]:
+    global _profiler
+
+    profiler, _profiler = _profiler, None
+
+    return profiler.stop()
+
+
+def model_scope(name: str):
+    if _profiler is None:
+        return nullcontext()
+
+    return _profiler.model_scope(name)
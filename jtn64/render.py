@@ -0,0 +1,278 @@
+"""
+Headless software rendering, for model thumbnails.
+
+`render_geometry` rasterizes a Geometry with NumPy: an orthographic camera
+looking down at the model from the front left, a z-buffer, nearest texel
+sampling with wrapping, vertex colors, and the same 0.5 alpha cutoff as the
+GLTF export's MASK materials.
+
+Rather than looping over triangles in Python, every triangle is expanded
+into the pixels of its screen bounding box (thumbnails are small, so these
+are few), and coverage, depth, UVs and texels are computed for all of those
+fragments at once. The z-buffer is then resolved by sorting the fragments
+by pixel and depth. Triangles are processed in batches of up to
+FRAGMENT_BATCH fragments to bound memory on big models.
+"""
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+from . import stats
+from .mesh import Geometry
+
+DEFAULT_SIZE = 128
+
+# Camera angles in degrees: turned around the Y axis, then tilted down
+DEFAULT_YAW = 30.0
+DEFAULT_PITCH = 25.0
+
+# Empty border around the model, as a fraction of the image size
+MARGIN = 0.05
+
+ALPHA_CUTOFF = 128
+
+FRAGMENT_BATCH = 1 << 20
+
+
+def _project(positions: np.ndarray, size: int, yaw: float, pitch: float):
+    """
+    Screen x, y (pixels, y down) and depth (smaller is nearer) of every
+    position, scaled so the bounding box of `positions` fills the image.
+    """
+
+    yaw = math.radians(yaw)
+    pitch = math.radians(pitch)
+
+    rotate_y = np.array([
+        [math.cos(yaw), 0, math.sin(yaw)],
+        [0, 1, 0],
+        [-math.sin(yaw), 0, math.cos(yaw)],
+    ])
+    rotate_x = np.array([
+        [1, 0, 0],
+        [0, math.cos(pitch), -math.sin(pitch)],
+        [0, math.sin(pitch), math.cos(pitch)],
+    ])
+
+    view = positions @ (rotate_x @ rotate_y).T
+
+    low = view[:, :2].min(axis=0)
+    high = view[:, :2].max(axis=0)
+    center = (low + high) / 2
+    scale = size * (1 - 2 * MARGIN) / max(float((high - low).max()), 1e-6)
+
+    x = (view[:, 0] - center[0]) * scale + size / 2
+    y = (center[1] - view[:, 1]) * scale + size / 2
+
+    # The camera looks down -Z
+    return x, y, -view[:, 2]
+
+
+def _sample(textures: Sequence[np.ndarray], texture_ids: np.ndarray, uvs: np.ndarray) -> np.ndarray:
+    """
+    RGBA of each fragment's texel, nearest neighbour with wrapping. Texture
+    id -1 is untextured, white.
+    """
+
+    texels = np.full((len(texture_ids), 4), 255, dtype=np.uint8)
+
+    for texture_id in np.unique(texture_ids):
+        if texture_id < 0:
+            continue
+
+        texture = textures[texture_id]
+        height, width = texture.shape[:2]
+        selected = texture_ids == texture_id
+
+        tx = np.floor(uvs[selected, 0] * width).astype(np.int64) % width
+        ty = np.floor(uvs[selected, 1] * height).astype(np.int64) % height
+        texels[selected] = texture[ty, tx]
+
+    return texels
+
+
+@stats.timed("render")
+def render_geometry(geometry: Geometry, textures: Sequence[np.ndarray],
+                    size: int = DEFAULT_SIZE, yaw: float = DEFAULT_YAW,
+                    pitch: float = DEFAULT_PITCH) -> np.ndarray:
+    """
+    Render `geometry` into a size x size RGBA image (uint8 array), with a
+    transparent background. `textures` are (height, width, 4) uint8 RGBA
+    arrays indexed by the meshes' texture indices.
+    """
+
+    image = np.zeros((size, size, 4), dtype=np.uint8)
+
+    triangles = [triangle for mesh in geometry.meshes for triangle in mesh.indices]
+
+    if not triangles:
+        return image
+
+    triangles = np.array(triangles, dtype=np.int64)
+    triangle_textures = np.concatenate([
+        np.full(len(mesh.indices), -1 if mesh.texture_index is None else mesh.texture_index)
+        for mesh in geometry.meshes
+    ])
+
+    # Only frame the vertices that are drawn
+    used = np.unique(triangles)
+    positions = np.asarray(geometry.positions, dtype=np.float64)
+
+    x = np.zeros(len(positions))
+    y = np.zeros(len(positions))
+    depth = np.zeros(len(positions))
+    x[used], y[used], depth[used] = _project(positions[used], size, yaw, pitch)
+
+    uvs = np.asarray(geometry.uvs, dtype=np.float64)
+    colors = np.asarray(geometry.colors, dtype=np.float64)
+
+    # Per triangle vertex coordinates, (triangles, 3)
+    tx, ty, tz = x[triangles], y[triangles], depth[triangles]
+
+    area = (tx[:, 1] - tx[:, 0]) * (ty[:, 2] - ty[:, 0]) \
+        - (ty[:, 1] - ty[:, 0]) * (tx[:, 2] - tx[:, 0])
+
+    # Pixel centers are at +0.5
+    x0 = np.clip(np.ceil(tx.min(axis=1) - 0.5), 0, size).astype(np.int64)
+    x1 = np.clip(np.floor(tx.max(axis=1) - 0.5), -1, size - 1).astype(np.int64)
+    y0 = np.clip(np.ceil(ty.min(axis=1) - 0.5), 0, size).astype(np.int64)
+    y1 = np.clip(np.floor(ty.max(axis=1) - 0.5), -1, size - 1).astype(np.int64)
+
+    widths = np.maximum(x1 - x0 + 1, 0)
+    counts = widths * np.maximum(y1 - y0 + 1, 0)
+    counts[np.abs(area) < 1e-9] = 0
+
+    zbuffer = np.full(size * size, np.inf)
+    pixels = image.reshape(-1, 4)
+
+    drawn = np.flatnonzero(counts)
+    ends = np.cumsum(counts[drawn])
+    start = 0
+
+    stats.count("render.triangles", len(drawn))
+
+    while start < len(drawn):
+        # Always take at least one triangle, however big
+        offset = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, offset + FRAGMENT_BATCH, side="right")), start + 1)
+        batch = drawn[start:stop]
+        start = stop
+
+        _rasterize_batch(
+            batch, counts[batch], x0, y0, widths, tx, ty, tz, area, triangles,
+            triangle_textures, uvs, colors, textures, size, zbuffer, pixels
+        )
+
+    return image
+
+
+def _rasterize_batch(batch, counts, x0, y0, widths, tx, ty, tz, area, triangles,
+                     triangle_textures, uvs, colors, textures, size, zbuffer, pixels):
+    # One fragment per pixel of each triangle's bounding box
+    fragment_triangles = np.repeat(batch, counts)
+    local = np.arange(len(fragment_triangles)) - np.repeat(np.cumsum(counts) - counts, counts)
+    fragment_widths = widths[fragment_triangles]
+
+    px = x0[fragment_triangles] + local % fragment_widths
+    py = y0[fragment_triangles] + local // fragment_widths
+
+    stats.count("render.fragments", len(px))
+
+    cx = px + 0.5
+    cy = py + 0.5
+    vx = tx[fragment_triangles]
+    vy = ty[fragment_triangles]
+
+    # Barycentric weights from edge functions, all the same sign as the
+    # triangle's area when the pixel center is inside
+    weights = np.empty((len(px), 3))
+
+    for i in range(3):
+        a, b = (i + 1) % 3, (i + 2) % 3
+        weights[:, i] = (vx[:, b] - vx[:, a]) * (cy - vy[:, a]) \
+            - (vy[:, b] - vy[:, a]) * (cx - vx[:, a])
+
+    weights /= area[fragment_triangles, None]
+
+    inside = (weights >= -1e-9).all(axis=1)
+
+    fragment_triangles = fragment_triangles[inside]
+    weights = weights[inside]
+    pixel_ids = (py * size + px)[inside]
+
+    vertex_ids = triangles[fragment_triangles]
+    fragment_depth = (tz[fragment_triangles] * weights).sum(axis=1)
+    fragment_uvs = (uvs[vertex_ids] * weights[:, :, None]).sum(axis=1)
+    fragment_colors = (colors[vertex_ids] * weights[:, :, None]).sum(axis=1)
+
+    texels = _sample(textures, triangle_textures[fragment_triangles], fragment_uvs)
+
+    opaque = texels[:, 3] >= ALPHA_CUTOFF
+
+    pixel_ids = pixel_ids[opaque]
+    fragment_depth = fragment_depth[opaque]
+
+    rgb = texels[opaque, :3] * (fragment_colors[opaque] / 255)
+
+    # Nearest fragment per pixel: sort by pixel, then depth, and keep the
+    # first of each pixel
+    order = np.lexsort((fragment_depth, pixel_ids))
+    sorted_pixels = pixel_ids[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_pixels[1:] != sorted_pixels[:-1]
+    nearest = order[first]
+
+    closer = fragment_depth[nearest] < zbuffer[pixel_ids[nearest]]
+    nearest = nearest[closer]
+
+    zbuffer[pixel_ids[nearest]] = fragment_depth[nearest]
+    pixels[pixel_ids[nearest], :3] = np.clip(np.rint(rgb[nearest]), 0, 255).astype(np.uint8)
+    pixels[pixel_ids[nearest], 3] = 255
+
+
+def texture_arrays(model) -> list:
+    """
+    The model's textures as RGBA arrays for `render_geometry`.
+    """
+
+    return [
+        np.asarray(texture.to_image(rgba=True), dtype=np.uint8)
+        for texture in model.texture_data
+    ]
+
+
+def render_model(model, size: int = DEFAULT_SIZE,
+                 geometry: Optional[Geometry] = None) -> np.ndarray:
+    """
+    Render a parsed Model, see `render_geometry`.
+    """
+
+    if geometry is None:
+        geometry = model.build_geometry()
+
+    return render_geometry(geometry, texture_arrays(model), size)
+
+
+def render_thumbnail(model_data: bytes, size: int = DEFAULT_SIZE,
+                     compress_level: Optional[int] = None) -> Optional[bytes]:
+    """
+    Parse a decompressed model and render it to PNG, or None if it has no
+    triangles.
+    """
+
+    from PIL import Image
+
+    from .model import Model
+    from .util import DEFAULT_PNG_LEVEL, encode_png
+
+    model = Model.parse_bytes(model_data)
+    geometry = model.build_geometry()
+
+    if not any(mesh.indices for mesh in geometry.meshes):
+        return None
+
+    image = Image.fromarray(render_model(model, size, geometry), "RGBA")
+
+    return encode_png(image, DEFAULT_PNG_LEVEL if compress_level is None else compress_level)
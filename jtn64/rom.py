@@ -0,0 +1,213 @@
+import mmap
+import zlib
+from array import array
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from struct import unpack
+from typing import Iterator, Optional, Tuple
+
+from . import stats
+
+# Compressed assets start with this magic, followed by a 4 byte size and a
+# raw deflate stream.
+COMPRESSED_MAGIC = b"\x11\x72"
+
+# Decompressed models start with this word.
+MODEL_MAGIC = 0x0B
+
+# Largest decompressed asset accepted. Corrupt streams can inflate to far
+# more than any real model, so decompression stops here instead.
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+# Bytes swapped per pass when converting a ROM to big endian
+SWAP_CHUNK_SIZE = 1024 * 1024
+
+
+class ByteOrder(Enum):
+    """
+    ROM dump layouts, named after their usual file extensions. The first
+    word of every ROM is 0x80371240, which tells them apart.
+    """
+
+    Z64 = "z64"  # Big endian, what the parser expects
+    V64 = "v64"  # 16 bit words byte swapped
+    N64 = "n64"  # 32 bit words little endian
+
+
+ROM_MAGICS = {
+    b"\x80\x37\x12\x40": ByteOrder.Z64,
+    b"\x37\x80\x40\x12": ByteOrder.V64,
+    b"\x40\x12\x37\x80": ByteOrder.N64,
+}
+
+# array typecode whose byteswap() converts each layout to big endian
+_SWAP_TYPECODES = {
+    ByteOrder.V64: "H",
+    ByteOrder.N64: "I" if array("I").itemsize == 4 else "L",
+}
+
+
+def detect_byte_order(rom_data) -> Optional[ByteOrder]:
+    """
+    Byte order of a ROM from its header magic, or None if it isn't one.
+    """
+
+    return ROM_MAGICS.get(bytes(rom_data[0:4]))
+
+
+def _swap_in_place(buffer, byte_order: ByteOrder):
+    typecode = _SWAP_TYPECODES[byte_order]
+    # Trailing bytes that don't fill a word are left alone
+    end = len(buffer) - len(buffer) % 4
+
+    for start in range(0, end, SWAP_CHUNK_SIZE):
+        stop = min(start + SWAP_CHUNK_SIZE, end)
+        words = array(typecode, buffer[start:stop])
+        words.byteswap()
+        buffer[start:stop] = words.tobytes()
+
+
+def to_big_endian(rom_data, byte_order: Optional[ByteOrder] = None) -> bytes:
+    """
+    Convert a ROM to big endian. The byte order is detected from the header
+    unless given; data that isn't recognised is assumed to be big endian
+    already.
+    """
+
+    if byte_order is None:
+        byte_order = detect_byte_order(rom_data)
+
+    if byte_order in (None, ByteOrder.Z64):
+        return rom_data
+
+    with stats.timer("byteswap"):
+        buffer = bytearray(rom_data)
+        _swap_in_place(buffer, byte_order)
+
+    return bytes(buffer)
+
+
+@contextmanager
+def open_rom(path, byte_order: Optional[ByteOrder] = None):
+    """
+    Memory map a ROM file as big endian. Big endian ROMs are mapped read
+    only; other layouts are mapped copy-on-write and swapped in place a chunk
+    at a time, so the file is never modified and never held in memory twice.
+    """
+
+    with Path(path).open("rb") as f:
+        access = mmap.ACCESS_READ
+
+        if byte_order is None:
+            byte_order = detect_byte_order(f.read(4))
+
+        if byte_order not in (None, ByteOrder.Z64):
+            access = mmap.ACCESS_COPY
+
+        rom_data = mmap.mmap(f.fileno(), 0, access=access)
+
+    try:
+        if access == mmap.ACCESS_COPY:
+            with stats.timer("byteswap"):
+                _swap_in_place(rom_data, byte_order)
+
+        yield rom_data
+    finally:
+        rom_data.close()
+
+
+def _inflate(data) -> Optional[bytes]:
+    """
+    Decompress a raw deflate stream, or None if it inflates past
+    MAX_DECOMPRESSED_SIZE. Raises zlib.error if the stream is corrupt or
+    truncated, like zlib.decompress.
+    """
+
+    decompressor = zlib.decompressobj(wbits=-15)
+    decompressed = decompressor.decompress(data, MAX_DECOMPRESSED_SIZE)
+
+    if decompressor.unconsumed_tail:
+        stats.count("zlib.oversized")
+
+        return None
+
+    if not decompressor.eof:
+        raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+
+    return decompressed
+
+
+def _decompress_model(rom_data, offset: int) -> Optional[bytes]:
+    size = int.from_bytes(rom_data[offset + 2:offset + 6], byteorder='big')
+
+    # If it's greater than 5mb, it's probably not a valid object.
+    if size > 5 * 1024 * 1024:
+        return None
+
+    data = rom_data[offset + 6:offset + size]
+
+    try:
+        with stats.timer("zlib"):
+            decompressed = _inflate(data)
+    except zlib.error:
+        return None
+
+    if decompressed is None:
+        return None
+
+    stats.count("zlib.bytes_out", len(decompressed))
+
+    if len(decompressed) > 32 and unpack(">I", decompressed[0:4])[0] == MODEL_MAGIC:
+        return decompressed
+
+    return None
+
+
+def iter_models(rom_data) -> Iterator[Tuple[int, bytes]]:
+    """
+    Finds models from rom data (bytes or an mmap from `open_rom`). Scans the
+    entire ROM looking for the Zlib header (0x1172) and then attempts to
+    decompress it. Yields the ROM offset and decompressed data of every model
+    found.
+    """
+
+    stats.count("scan.bytes", len(rom_data))
+
+    # Candidates need 17 bytes after the magic's first byte
+    limit = len(rom_data) - 16
+    i = rom_data.find(COMPRESSED_MAGIC, 0, limit)
+
+    while i != -1:
+        stats.count("scan.candidates")
+
+        decompressed = _decompress_model(rom_data, i)
+
+        if decompressed is None:
+            stats.count("scan.misses")
+        else:
+            stats.count("scan.hits")
+
+            yield i, decompressed
+
+        i = rom_data.find(COMPRESSED_MAGIC, i + 1, limit)
+
+
+def read_model(rom_data, offset: int) -> bytes:
+    """
+    Decompress the model stored at `offset`, as yielded by `iter_models`.
+    """
+
+    if rom_data[offset:offset + 2] != COMPRESSED_MAGIC:
+        raise ValueError(f"No compressed asset at 0x{offset:08x}")
+
+    size = int.from_bytes(rom_data[offset + 2:offset + 6], byteorder='big')
+
+    decompressed = _inflate(rom_data[offset + 6:offset + size])
+
+    if decompressed is None:
+        raise ValueError(
+            f"Asset at 0x{offset:08x} inflates past {MAX_DECOMPRESSED_SIZE} bytes"
+        )
+
+    return decompressed
@@ -0,0 +1,275 @@
+"""
+Long-lived conversion service listening on a local Unix socket.
+
+The process keeps ROM indexes, parsed models, encoded textures and finished
+GLB files in memory, so repeated requests skip process startup and parsing.
+
+Protocol: the client sends one JSON object per line. The server answers each
+with one JSON header line, followed by the raw bytes of every part listed in
+the header, back to back:
+
+    -> {"op": "gltf", "rom": "roms/bk.z64", "offset": 2209552}
+    <- {"ok": true, "parts": [{"name": "0021b710_model.glb", "length": 1234}]}
+    <- <1234 bytes>
+
+Operations:
+
+    ping                         no parts
+    index     rom                {"offsets": [...]} in the header
+    gltf      rom+offset | path  one GLB part
+    textures  rom+offset | path  one PNG part per texture
+
+Errors are reported as {"ok": false, "error": "..."} with no parts.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import stats
+from .model import Model, SimulateDisplaylistResult
+from .rom import iter_models, read_model, to_big_endian
+from .util import encode_pngs, png_to_data_uri
+
+
+@dataclass
+class CachedModel:
+    name: str
+    model: Model
+    displaylist_result: Optional[SimulateDisplaylistResult] = None
+    pngs: Optional[List[bytes]] = None
+    glb: Optional[bytes] = None
+
+
+@dataclass
+class RomIndex:
+    # (st_mtime_ns, st_size) of the ROM when it was scanned
+    version: Tuple[int, int]
+    data: bytes
+    offsets: List[int] = field(default_factory=list)
+
+
+def _file_version(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConversionService:
+    """
+    Handles requests against in-memory caches. Safe to call from several
+    threads; work done twice by racing requests is simply discarded.
+    """
+
+    def __init__(self, max_models: int = 256):
+        self.max_models = max_models
+
+        self._lock = threading.Lock()
+        self._roms: Dict[Path, RomIndex] = {}
+        self._models: "OrderedDict[tuple, CachedModel]" = OrderedDict()
+
+    def load_rom(self, rom_path: str) -> RomIndex:
+        path = Path(rom_path).resolve()
+        version = _file_version(path)
+
+        with self._lock:
+            index = self._roms.get(path)
+
+        if index is not None and index.version == version:
+            return index
+
+        data = to_big_endian(path.read_bytes())
+        index = RomIndex(
+            version=version,
+            data=data,
+            offsets=[offset for offset, _ in iter_models(data)]
+        )
+
+        with self._lock:
+            self._roms[path] = index
+
+        return index
+
+    def get_model(self, request: dict) -> CachedModel:
+        if "rom" in request:
+            index = self.load_rom(request["rom"])
+            offset = int(request["offset"])
+
+            key = ("rom", Path(request["rom"]).resolve(), index.version, offset)
+            name = f"{offset:08x}_model"
+        elif "path" in request:
+            path = Path(request["path"]).resolve()
+
+            key = ("path", path, _file_version(path))
+            name = path.stem
+        else:
+            raise ValueError("Request needs either 'rom' and 'offset' or 'path'")
+
+        with self._lock:
+            cached = self._models.get(key)
+
+            if cached is not None:
+                self._models.move_to_end(key)
+
+                return cached
+
+        if key[0] == "rom":
+            if offset not in index.offsets:
+                raise ValueError(f"No model at offset 0x{offset:08x}")
+
+            data = read_model(index.data, offset)
+        else:
+            data = path.read_bytes()
+
+        cached = CachedModel(name=name, model=Model.parse_bytes(data))
+
+        with self._lock:
+            cached = self._models.setdefault(key, cached)
+
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+        return cached
+
+    def get_pngs(self, cached: CachedModel) -> List[bytes]:
+        if cached.pngs is None:
+            cached.pngs = encode_pngs(
+                texture.to_image() for texture in cached.model.texture_data
+            )
+
+        return cached.pngs
+
+    def get_glb(self, cached: CachedModel) -> bytes:
+        from .glb import geometry_to_glb
+
+        if cached.glb is None:
+            if cached.displaylist_result is None:
+                cached.displaylist_result = cached.model.simulate_displaylist()
+
+            image_uris = [png_to_data_uri(png) for png in self.get_pngs(cached)]
+
+            cached.glb = geometry_to_glb(
+                cached.model.build_geometry(cached.displaylist_result), image_uris
+            )
+
+        return cached.glb
+
+    def handle(self, request: dict) -> Tuple[dict, List[Tuple[str, bytes]]]:
+        """
+        Returns the header fields and (name, data) parts for one request.
+        """
+
+        op = request.get("op")
+
+        if op == "ping":
+            return {}, []
+        elif op == "index":
+            return {"offsets": self.load_rom(request["rom"]).offsets}, []
+        elif op == "gltf":
+            cached = self.get_model(request)
+
+            return {}, [(f"{cached.name}.glb", self.get_glb(cached))]
+        elif op == "textures":
+            cached = self.get_model(request)
+
+            return {}, [
+                (f"{cached.name}_texture_{i}.png", png)
+                for i, png in enumerate(self.get_pngs(cached))
+            ]
+
+        raise ValueError(f"Unknown op {op!r}")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                with stats.timer("serve.request"):
+                    header, parts = self.server.service.handle(json.loads(line))
+            except Exception as e:
+                header, parts = {"ok": False, "error": f"{type(e).__name__}: {e}"}, []
+            else:
+                header = {"ok": True, **header}
+
+            header["parts"] = [
+                {"name": name, "length": len(data)} for name, data in parts
+            ]
+
+            self.wfile.write(json.dumps(header).encode() + b"\n")
+
+            for _, data in parts:
+                self.wfile.write(data)
+
+            self.wfile.flush()
+
+
+def _is_socket(path: str) -> bool:
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: ConversionService):
+        # A socket left behind by a previous server is replaced; anything
+        # else at the path is left alone
+        if _is_socket(socket_path):
+            os.unlink(socket_path)
+        elif os.path.lexists(socket_path):
+            raise FileExistsError(f"{socket_path} exists and isn't a socket")
+
+        self.service = service
+
+        super().__init__(socket_path, _RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+
+        if _is_socket(self.server_address):
+            os.unlink(self.server_address)
+
+
+class Client:
+    """
+    Minimal client for `ConversionServer`, keeping one connection open.
+    """
+
+    def __init__(self, socket_path: str):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, **payload) -> Tuple[dict, Dict[str, bytes]]:
+        self._file.write(json.dumps(payload).encode() + b"\n")
+        self._file.flush()
+
+        header = json.loads(self._file.readline())
+        parts = {
+            part["name"]: self._file.read(part["length"])
+            for part in header["parts"]
+        }
+
+        return header, parts
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,292 @@
+"""
+Mesh simplification for generating LODs.
+
+Uses Garland & Heckbert quadric error metrics with half-edge collapses: a
+vertex is always collapsed onto one of its neighbours, so the simplified
+meshes keep indexing into the original vertex buffer and no new UVs or colors
+have to be invented.
+
+To respect UV seams and texture boundaries, a vertex is never removed if it
+lies on an open edge of its mesh, is used by more than one mesh (a texture
+boundary), or shares its position with another vertex (a UV or color seam).
+"""
+
+import heapq
+from typing import Dict, List, Sequence, Set, Tuple
+
+from . import stats
+from .mesh import Geometry, Mesh
+
+Quadric = Tuple[float, ...]
+
+# Collapses that turn a triangle's normal by more than this (as a dot product
+# of unit normals) are rejected.
+MIN_NORMAL_DOT = 0.2
+
+DEFAULT_RATIOS = (0.5, 0.25)
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _cross(a, b):
+    return (
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0],
+    )
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _normal(p0, p1, p2):
+    return _cross(_sub(p1, p0), _sub(p2, p0))
+
+
+def _plane_quadric(p0, p1, p2) -> Quadric:
+    n = _normal(p0, p1, p2)
+    length = _dot(n, n) ** 0.5
+
+    if length == 0:
+        return (0.0,) * 10
+
+    # Weighting by area (half the normal length) makes large faces matter
+    # more than slivers.
+    area = length / 2
+    a, b, c = n[0] / length, n[1] / length, n[2] / length
+    d = -_dot((a, b, c), p0)
+
+    return (
+        a * a * area, a * b * area, a * c * area, a * d * area,
+        b * b * area, b * c * area, b * d * area,
+        c * c * area, c * d * area,
+        d * d * area,
+    )
+
+
+def _add_quadric(q: Quadric, r: Quadric) -> Quadric:
+    return tuple(x + y for x, y in zip(q, r))
+
+
+def _quadric_error(q: Quadric, p) -> float:
+    x, y, z = p
+
+    return (
+        q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x
+        + q[4] * y * y + 2 * q[5] * y * z + 2 * q[6] * y
+        + q[7] * z * z + 2 * q[8] * z
+        + q[9]
+    )
+
+
+def locked_vertices(geometry: Geometry) -> Set[int]:
+    """
+    Vertices on UV/color seams or shared between meshes.
+    """
+
+    locked = set()
+
+    first_position: Dict[tuple, int] = {}
+
+    for vertex, position in enumerate(geometry.positions):
+        other = first_position.setdefault(tuple(position), vertex)
+
+        if other != vertex:
+            locked.add(vertex)
+            locked.add(other)
+
+    owner: Dict[int, int] = {}
+
+    for mesh_index, mesh in enumerate(geometry.meshes):
+        for triangle in mesh.indices:
+            for vertex in triangle:
+                if owner.setdefault(vertex, mesh_index) != mesh_index:
+                    locked.add(vertex)
+
+    return locked
+
+
+def simplify_triangles(triangles: Sequence[Tuple[int, int, int]], positions,
+                       target_count: int, locked: Set[int]) -> List[Tuple[int, int, int]]:
+    """
+    Collapse edges until `target_count` triangles remain, or no collapse is
+    possible without touching a locked or open-edge vertex. Collapses that
+    would leave fewer than `target_count` triangles are skipped, so a small
+    closed mesh is never collapsed away entirely; as most collapses remove
+    two triangles, this can stop one above `target_count`.
+    """
+
+    triangles = [list(triangle) for triangle in triangles]
+    alive = [True] * len(triangles)
+    alive_count = len(triangles)
+
+    if alive_count <= target_count:
+        return [tuple(t) for t in triangles]
+
+    positions = {
+        vertex: tuple(float(c) for c in positions[vertex])
+        for triangle in triangles for vertex in triangle
+    }
+
+    vertex_triangles: Dict[int, Set[int]] = {v: set() for v in positions}
+    edge_count: Dict[Tuple[int, int], int] = {}
+    quadrics: Dict[int, Quadric] = {v: (0.0,) * 10 for v in positions}
+
+    for t, (a, b, c) in enumerate(triangles):
+        quadric = _plane_quadric(positions[a], positions[b], positions[c])
+
+        for vertex in (a, b, c):
+            vertex_triangles[vertex].add(t)
+            quadrics[vertex] = _add_quadric(quadrics[vertex], quadric)
+
+        for u, v in ((a, b), (b, c), (c, a)):
+            key = (u, v) if u < v else (v, u)
+            edge_count[key] = edge_count.get(key, 0) + 1
+
+    locked = set(locked)
+
+    for (u, v), count in edge_count.items():
+        if count == 1:
+            locked.add(u)
+            locked.add(v)
+
+    # Heap entries are (cost, u, v, version of u). Only u's version is
+    # tracked; a changed quadric at v is caught by recomputing on pop.
+    version = {vertex: 0 for vertex in positions}
+    heap = []
+
+    def neighbours(u):
+        result = set()
+
+        for t in vertex_triangles[u]:
+            result.update(triangles[t])
+
+        result.discard(u)
+
+        return result
+
+    def collapse_cost(u, v):
+        return _quadric_error(_add_quadric(quadrics[u], quadrics[v]), positions[v])
+
+    def push_collapse(u, v):
+        if u not in locked:
+            heapq.heappush(heap, (collapse_cost(u, v), u, v, version[u]))
+
+    for u in positions:
+        for v in neighbours(u):
+            push_collapse(u, v)
+
+    while heap and alive_count > target_count:
+        cost, u, v, u_version = heapq.heappop(heap)
+
+        if version[u] != u_version:
+            continue
+
+        u_triangles = vertex_triangles[u]
+        removed = sum(1 for t in u_triangles if v in triangles[t])
+
+        if not removed or alive_count - removed < target_count:
+            continue
+
+        # Link condition: collapsing an interior edge whose endpoints share
+        # more than the two opposite vertices would pinch the surface.
+        if len(neighbours(u) & neighbours(v)) > 2:
+            continue
+
+        current_cost = collapse_cost(u, v)
+
+        if current_cost > cost + 1e-9 * abs(cost):
+            heapq.heappush(heap, (current_cost, u, v, u_version))
+            continue
+
+        # Reject collapses that would flip or squash a surviving triangle
+        valid = True
+
+        for t in u_triangles:
+            triangle = triangles[t]
+
+            if v in triangle:
+                continue
+
+            before = _normal(*(positions[x] for x in triangle))
+            after = _normal(*(positions[v if x == u else x] for x in triangle))
+
+            before_length = _dot(before, before) ** 0.5
+            after_length = _dot(after, after) ** 0.5
+
+            if after_length == 0 or (
+                before_length and _dot(before, after) < MIN_NORMAL_DOT * before_length * after_length
+            ):
+                valid = False
+                break
+
+        if not valid:
+            continue
+
+        for t in list(u_triangles):
+            triangle = triangles[t]
+
+            if v in triangle:
+                alive[t] = False
+                alive_count -= 1
+
+                for x in triangle:
+                    if x != u:
+                        vertex_triangles[x].discard(t)
+            else:
+                triangle[triangle.index(u)] = v
+                vertex_triangles[v].add(t)
+
+        vertex_triangles[u] = set()
+        quadrics[v] = _add_quadric(quadrics[v], quadrics[u])
+
+        version[u] += 1
+        version[v] += 1
+
+        for n in neighbours(v):
+            push_collapse(v, n)
+            push_collapse(n, v)
+
+    return [tuple(t) for t, a in zip(triangles, alive) if a]
+
+
+@stats.timed("simplify")
+def generate_lods(geometry: Geometry, ratios: Sequence[float] = DEFAULT_RATIOS) -> List[List[Mesh]]:
+    """
+    Returns one list of meshes per ratio, each targeting that fraction of the
+    original triangle count. Every level indexes into `geometry`'s vertex
+    buffer, and is simplified from the previous level to keep the cost down.
+    """
+
+    locked = locked_vertices(geometry)
+
+    levels = []
+    previous = geometry.meshes
+
+    for ratio in ratios:
+        level = []
+
+        for original, mesh in zip(geometry.meshes, previous):
+            target = max(1, int(len(original.indices) * ratio))
+            indices = simplify_triangles(mesh.indices, geometry.positions, target, locked)
+
+            # An empty mesh would be written as an empty index accessor, so
+            # keep the previous level instead
+            if not indices:
+                indices = mesh.indices
+
+            level.append(Mesh(
+                texture_index=mesh.texture_index,
+                indices=indices,
+                vertices=mesh.vertices
+            ))
+
+        stats.count("simplify.triangles", sum(len(m.indices) for m in level))
+
+        levels.append(level)
+        previous = level
+
+    return levels
@@ -0,0 +1,212 @@
+"""
+Lightweight timers and counters for the extraction pipeline.
+
+Collection is off by default, in which case `timer` and `count` cost a global
+lookup and nothing else. Once `enable()` has been called, every timer and
+counter is recorded into an aggregate, and also into the current model while
+inside a `model_scope`.
+
+    with stats.timer("parse"):
+        ...
+
+    @stats.timed("simulate")
+    def simulate_displaylist(self):
+        ...
+
+    stats.count("parse.bytes", len(data))
+
+Timers are inclusive, so a texture decode that happens while building a GLTF
+counts towards both `texture_decode` and `gltf_build`. Timers recorded from
+worker threads (PNG encoding) add up per thread, so they can exceed the wall
+time of the stage that started them.
+"""
+
+import threading
+import time
+from functools import wraps
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+
+class Stats:
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def add_time(self, name: str, seconds: float):
+        self.timings[name] += seconds
+        self.calls[name] += 1
+
+    def add_count(self, name: str, value: int):
+        self.counters[name] += value
+
+    def merge(self, other: "Stats"):
+        """
+        Add everything recorded in `other`, e.g. by a worker process.
+        """
+
+        for name, seconds in other.timings.items():
+            self.timings[name] += seconds
+            self.calls[name] += other.calls[name]
+
+        for name, value in other.counters.items():
+            self.counters[name] += value
+
+    def to_dict(self) -> dict:
+        ratios = {}
+
+        for name, hits in self.counters.items():
+            if not name.endswith(".hits"):
+                continue
+
+            prefix = name[:-len(".hits")]
+            total = hits + self.counters.get(f"{prefix}.misses", 0)
+
+            if total:
+                ratios[f"{prefix}.hit_ratio"] = hits / total
+
+        return {
+            "timings": {
+                name: {"seconds": seconds, "calls": self.calls[name]}
+                for name, seconds in sorted(self.timings.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "ratios": ratios,
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.aggregate = Stats()
+        self.models: Dict[str, Stats] = {}
+        self.current: Optional[Stats] = None
+        # Stages like PNG encoding record from worker threads
+        self.lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float):
+        with self.lock:
+            self.aggregate.add_time(name, seconds)
+
+            if self.current is not None:
+                self.current.add_time(name, seconds)
+
+    def add_count(self, name: str, value: int):
+        with self.lock:
+            self.aggregate.add_count(name, value)
+
+            if self.current is not None:
+                self.current.add_count(name, value)
+
+    def add_model(self, name: str, stats: Stats):
+        """
+        Merge stats recorded elsewhere for the model called `name` into
+        the aggregate and that model.
+        """
+
+        with self.lock:
+            self.aggregate.merge(stats)
+            self.models.setdefault(name, Stats()).merge(stats)
+
+    def report(self) -> dict:
+        return {
+            "aggregate": self.aggregate.to_dict(),
+            "models": {
+                name: stats.to_dict() for name, stats in self.models.items()
+            },
+        }
+
+
+_recorder: Optional[Recorder] = None
+_null_context = nullcontext()
+
+
+def enable() -> Recorder:
+    """
+    Start recording, discarding anything recorded previously.
+    """
+
+    global _recorder
+
+    _recorder = Recorder()
+
+    return _recorder
+
+
+def disable():
+    global _recorder
+
+    _recorder = None
+
+
+def get_recorder() -> Optional[Recorder]:
+    return _recorder
+
+
+@contextmanager
+def _timer(recorder: Recorder, name: str):
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        recorder.add_time(name, time.perf_counter() - start)
+
+
+def timer(name: str):
+    """
+    Context manager that adds the elapsed wall time to `name`.
+    """
+
+    if _recorder is None:
+        return _null_context
+
+    return _timer(_recorder, name)
+
+
+def timed(name: str):
+    """
+    Decorator version of `timer`.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+
+            with _timer(_recorder, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: int = 1):
+    if _recorder is not None:
+        _recorder.add_count(name, value)
+
+
+@contextmanager
+def _model_scope(recorder: Recorder, name: str):
+    previous = recorder.current
+    recorder.current = recorder.models.setdefault(name, Stats())
+
+    try:
+        yield recorder.current
+    finally:
+        recorder.current = previous
+
+
+def model_scope(name: str):
+    """
+    Context manager that attributes everything recorded inside it to the
+    model called `name`, in addition to the aggregate.
+    """
+
+    if _recorder is None:
+        return _null_context
+
+    return _model_scope(_recorder, name)
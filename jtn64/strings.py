@@ -0,0 +1,117 @@
+"""
+Text extraction from ROMs, like the `strings` tool:
+
+    with open_rom("roms/bk.z64") as rom_data:
+        for offset, text in find_strings(rom_data, min_length=6):
+            ...
+
+Scanning is vectorized: NumPy marks every byte that can appear in text in
+the encoding and finds the runs of at least `min_length` of them. In a
+single byte encoding those runs are the strings. In a multibyte one they
+are only candidates, and a compiled regular expression for one character
+finds the real strings inside each run. A regex over the whole ROM would
+work too, but the regex engine steps through the ROM one byte at a time,
+which is several times slower than the vectorized scan.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Tuple
+
+from . import stats
+
+DEFAULT_MIN_LENGTH = 4
+
+# Inclusive byte ranges that can appear in text in each encoding
+TEXT_BYTES = {
+    # Printable ASCII, space to tilde
+    "ascii": [(0x20, 0x7E)],
+    # Printable ASCII, half width katakana, and the lead and trail bytes of
+    # double byte characters, for the Japanese releases
+    "shift_jis": [(0x20, 0x7E), (0x80, 0xFC)],
+}
+
+# Regular expression for one character in each multibyte encoding
+CHARACTER_PATTERNS = {
+    # Single byte character, or a lead byte then a trail byte
+    "shift_jis": rb"[\x20-\x7e\xa1-\xdf]|[\x81-\x9f\xe0-\xef][\x40-\x7e\x80-\xfc]",
+}
+
+ENCODINGS = list(TEXT_BYTES)
+
+
+@lru_cache(maxsize=None)
+def _string_pattern(encoding: str, min_length: int):
+    return re.compile(rb"(?:%s){%d,}" % (CHARACTER_PATTERNS[encoding], min_length))
+
+
+def _text_runs(data, encoding: str, min_length: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) of every run of at least `min_length` bytes that can
+    appear in text in `encoding`.
+    """
+
+    import numpy as np
+
+    if len(data) < min_length:
+        return []
+
+    table = np.zeros(256, dtype=bool)
+
+    for low, high in TEXT_BYTES[encoding]:
+        table[low:high + 1] = True
+
+    text = table[np.frombuffer(data, dtype=np.uint8)]
+
+    # Whether a run of min_length text bytes starts at each offset, which
+    # leaves only the runs long enough to keep
+    window = text[:len(text) - min_length + 1].copy()
+
+    for i in range(1, min_length):
+        window &= text[i:len(text) - min_length + 1 + i]
+
+    edges = np.flatnonzero(window[1:] != window[:-1]) + 1
+    starts = edges[window[edges]].tolist()
+    ends = (edges[~window[edges]] + min_length - 1).tolist()
+
+    if window[0]:
+        starts.insert(0, 0)
+
+    if window[-1]:
+        ends.append(len(text))
+
+    return list(zip(starts, ends))
+
+
+@stats.timed("find_strings")
+def find_strings(data, min_length: int = DEFAULT_MIN_LENGTH,
+                 encoding: str = "ascii") -> List[Tuple[int, str]]:
+    """
+    (offset, text) of every run of at least `min_length` printable
+    characters in `data`, in `encoding` (one of ENCODINGS). `data` can be
+    anything supporting the buffer protocol and slicing to bytes, such as
+    a memory mapped ROM.
+    """
+
+    if encoding not in TEXT_BYTES:
+        raise ValueError(f"Unsupported encoding {encoding!r}, expected one of {ENCODINGS}")
+
+    if min_length < 1:
+        raise ValueError(f"Minimum string length must be at least 1, not {min_length}")
+
+    runs = _text_runs(data, encoding, min_length)
+
+    if encoding in CHARACTER_PATTERNS:
+        pattern = _string_pattern(encoding, min_length)
+
+        strings = [
+            (match.start(), match.group().decode(encoding, errors="replace"))
+            for start, end in runs
+            for match in pattern.finditer(data, start, end)
+        ]
+    else:
+        strings = [(start, data[start:end].decode(encoding)) for start, end in runs]
+
+    stats.count("strings", len(strings))
+
+    return strings
@@ -10,90 +10,94 @@ class TextureType(IntEnum):
     IA8 = 16
 
 
+# Number of palette entries for the color indexed texture types. The palette
+# comes first in the texture data, 2 bytes per color.
+PALETTE_SIZES = {
+    TextureType.CI4: 2**4,
+    TextureType.CI8: 2**8,
+}
+
+
+def _colors(red, green, blue, alpha):
+    return zip(red.tolist(), green.tolist(), blue.tolist(), alpha.tolist())
+
+
 def iter_colors_rgb5a3(data, size):
-    palette_reader = BitReader(data)
+    import numpy as np
 
-    for _ in range(size):
-        if palette_reader.read_sub(1) == 0:
-            alpha = palette_reader.read_sub(3) * 0x20
-            red = palette_reader.read_sub(4) * 0x11
-            green = palette_reader.read_sub(4) * 0x11
-            blue = palette_reader.read_sub(4) * 0x11
-        else:
-            alpha = 255
+    colors = BitReader(data).read_many(16, size).astype(np.int32)
 
-            red = palette_reader.read_sub(5) * 0x8
-            green1 = palette_reader.read_sub(2)
-            green2 = palette_reader.read_sub(3)
-            blue = palette_reader.read_sub(5) * 0x8
+    opaque = (colors >> 15) == 1
 
-            green = ((green1 << 3) & green2) * 0x8
+    # Top bit clear: 3 bits alpha, 4 bits each of red, green and blue
+    alpha = np.where(opaque, 255, ((colors >> 12) & 0x7) * 0x20)
+    red = np.where(opaque, ((colors >> 10) & 0x1F) * 0x8, ((colors >> 8) & 0xF) * 0x11)
+    blue = np.where(opaque, (colors & 0x1F) * 0x8, (colors & 0xF) * 0x11)
 
-        yield red, green, blue, alpha
+    # Top bit set: 5 bits each. Green is read as 2 + 3 bits and combined
+    # with `&`, as it always has been (which makes it 0).
+    green1 = (colors >> 8) & 0x3
+    green2 = (colors >> 5) & 0x7
+    green = np.where(
+        opaque, ((green1 << 3) & green2) * 0x8, ((colors >> 4) & 0xF) * 0x11
+    )
+
+    return _colors(red, green, blue, alpha)
 
 
 def iter_colors_rgb565(data, size):
     # Used for texture type 1 (CI4)
 
-    reader = BitReader(data)
+    import numpy as np
 
-    for _ in range(size):
-        red = reader.read_sub(5) * 0x8
-        green1 = reader.read_sub(3)
-        green2 = reader.read_sub(3)
-        blue = reader.read_sub(5) * 0x8
+    colors = BitReader(data).read_many(16, size)
 
-        green = ((green1 << 3) | green2) * 0x4
+    red = (colors >> 11) * 0x8
+    green = ((colors >> 5) & 0x3F) * 0x4
+    blue = (colors & 0x1F) * 0x8
 
-        yield red, green, blue, 255
+    return _colors(red, green, blue, np.full_like(colors, 255))
 
 
 def iter_colors_rgb555a(data, size):
-    reader = BitReader(data)
-
-    for _ in range(size):
-        red = reader.read_sub(5) * 0x8
-        green1 = reader.read_sub(3)
-        green2 = reader.read_sub(2)
-        blue = reader.read_sub(5) * 0x8
-        alpha = reader.read_sub(1) * 0xFF
+    colors = BitReader(data).read_many(16, size)
 
-        green = ((green1 << 2) | green2) * 0x8
+    red = (colors >> 11) * 0x8
+    green = ((colors >> 6) & 0x1F) * 0x8
+    blue = ((colors >> 1) & 0x1F) * 0x8
+    alpha = (colors & 0x1) * 0xFF
 
-        yield red, green, blue, alpha
+    return _colors(red, green, blue, alpha)
 
 
 def iter_colors_ia8(data, size):
-    reader = BitReader(data)
-
-    for _ in range(size):
-        color = reader.read_sub(8)
+    colors = BitReader(data).read_many(8, size).tolist()
 
-        yield (color, color, color, color)
+    return zip(colors, colors, colors, colors)
 
 
-def read_palette_rgb5a3(data):
+def read_palette_rgb5a3(data, count=16):
     palette = []
 
-    for color in iter_colors_rgb5a3(data, 16):
+    for color in iter_colors_rgb5a3(data, count):
         palette.append(color)
 
     return palette
 
 
-def read_palette_rgb565(data):
+def read_palette_rgb565(data, count=16):
     palette = []
 
-    for color in iter_colors_rgb565(data, 16):
+    for color in iter_colors_rgb565(data, count):
         palette.append(color)
 
     return palette
 
 
-def read_palette_rgb555a(data):
+def read_palette_rgb555a(data, count=16):
     palette = []
 
-    for color in iter_colors_rgb555a(data, 16):
+    for color in iter_colors_rgb555a(data, count):
         palette.append(color)
 
     return palette
@@ -0,0 +1,196 @@
+import math
+
+import numpy as np
+import pygltflib
+import pytest
+from click.testing import CliRunner
+
+import decompile
+from jtn64 import Model, ModelParseError
+from jtn64.animation import Animation, Transform, build_skin, euler_to_quaternion
+from jtn64.glb import SKIN_STRIDE, geometry_to_glb
+from jtn64.layout import build_scene
+
+from benchmarks.synthetic import build_animation, build_model
+
+IMAGE_URIS = ["data:image/png;base64,AAAA"] * 2
+
+
+def _rotation_matrix(axis, angle):
+    c, s = math.cos(angle), math.sin(angle)
+
+    if axis == 0:
+        return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+    elif axis == 1:
+        return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def _quaternion_matrix(q):
+    x, y, z, w = q
+
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def test_parse_bone_setup():
+    model = Model.parse_bytes(build_model(triangle_count=100, bone_count=3))
+
+    assert [bone.id for bone in model.bone_setup.bones] == [0, 1, 2]
+    assert model.bone_setup.parents() == [None, 0, 1]
+    assert model.bone_setup.bones[2].position == (0.0, 512.0, 0.0)
+
+    assert Model.parse_bytes(build_model(triangle_count=100)).bone_setup is None
+
+
+def test_parse_animation():
+    animation = Animation.parse_bytes(build_animation(bone_count=2, frame_count=11))
+
+    assert (animation.start_frame, animation.end_frame) == (0, 10)
+    assert animation.frame_count == 11
+    assert [(t.bone_id, t.transform) for t in animation.tracks] == [
+        (0, Transform.ROTATE_X), (1, Transform.ROTATE_X), (0, Transform.TRANSLATE_Y),
+    ]
+    assert animation.tracks[2].frames.tolist() == [0, 5, 10]
+    assert animation.tracks[2].values.tolist() == [0, 40, 80]
+
+
+def test_bad_animation(tmp_path):
+    data = build_animation(bone_count=2, frame_count=11)
+
+    for truncated in (data[:4], data[:len(data) - 2]):
+        with pytest.raises(ModelParseError):
+            Animation.parse_bytes(truncated)
+
+    model_path = tmp_path / "model.bin"
+    model_path.write_bytes(build_model(triangle_count=100, bone_count=2))
+    animation_path = tmp_path / "walk.bin"
+    animation_path.write_bytes(data[:len(data) - 2])
+
+    result = CliRunner().invoke(decompile.cli, [
+        "dump-model-gltf", "--animation", str(animation_path), str(model_path)
+    ])
+
+    assert result.exit_code == 2
+    assert "walk.bin" in result.output
+
+
+def test_euler_to_quaternion():
+    angles = [(0.3, -1.2, 2.0), (math.pi / 2, 0, 0), (0, 0, 0)]
+    quaternions = euler_to_quaternion(np.array(angles))
+
+    for (x, y, z), q in zip(angles, quaternions):
+        expected = _rotation_matrix(1, y) @ _rotation_matrix(0, x) @ _rotation_matrix(2, z)
+
+        assert np.allclose(_quaternion_matrix(q), expected)
+
+
+def test_quaternions_stay_in_one_hemisphere():
+    # A full turn around X passes through q = -q halfway
+    angles = np.zeros((64, 3))
+    angles[:, 0] = np.linspace(0, 2 * math.pi, 64)
+
+    quaternions = euler_to_quaternion(angles)
+
+    assert np.all(np.sum(quaternions[1:] * quaternions[:-1], axis=1) > 0)
+
+
+def test_sample_animation():
+    model = Model.parse_bytes(build_model(triangle_count=100, bone_count=2))
+    sampled = Animation.parse_bytes(build_animation(bone_count=2, frame_count=11)).sample(
+        model.bone_setup
+    )
+
+    assert sampled.times.tolist() == [frame / 30 for frame in range(11)]
+    assert sampled.rotated.tolist() == [True, True]
+    assert sampled.translated.tolist() == [True, False]
+    assert sampled.scaled.tolist() == [False, False]
+
+    # Root translation is keyed every 5 frames and interpolated between,
+    # the child keeps its rest offset from the root
+    assert np.allclose(sampled.translations[0, :, 1], np.arange(11) * 8)
+    assert np.allclose(sampled.translations[1], [0, 256, 0])
+    assert np.allclose(sampled.scales, 1)
+    assert np.allclose(np.linalg.norm(sampled.rotations, axis=-1), 1)
+
+
+def test_skinned_glb():
+    model = Model.parse_bytes(build_model(triangle_count=100, texture_count=2, bone_count=3))
+    geometry = model.build_geometry()
+    skin = build_skin(
+        model.bone_setup,
+        [("wave", Animation.parse_bytes(build_animation(bone_count=3)))]
+    )
+
+    for quantize in (False, True):
+        gltf = pygltflib.GLTF2.load_from_bytes(
+            geometry_to_glb(geometry, IMAGE_URIS, quantize, skin=skin)
+        )
+        blob = gltf.binary_blob()
+
+        assert len(blob) == gltf.buffers[0].byteLength
+
+        joints = gltf.skins[0].joints
+        assert [gltf.nodes[j].name for j in joints] == ["bone_0", "bone_1", "bone_2"]
+        assert gltf.nodes[joints[0]].children == [joints[1]]
+        assert joints[0] in gltf.scenes[0].nodes
+
+        for node in gltf.nodes[:len(geometry.meshes)]:
+            assert node.skin == 0
+            assert node.scale is None
+
+        animation = gltf.animations[0]
+        assert animation.name == "wave"
+        assert [c.target.path for c in animation.channels] == [
+            "rotation", "translation", "rotation", "rotation",
+        ]
+
+        inverse_bind = gltf.accessors[gltf.skins[0].inverseBindMatrices]
+        view = gltf.bufferViews[inverse_bind.bufferView]
+        matrices = np.frombuffer(
+            blob, "<f4", inverse_bind.count * 16, view.byteOffset
+        ).reshape(-1, 4, 4)
+        scale = 1 / 128 if quantize else 1
+
+        assert np.allclose(matrices[2, 3], [0, -4, 0, 1])
+        assert np.allclose(matrices[:, 0, 0], scale)
+
+
+def test_skinned_scene_glb():
+    model = Model.parse_bytes(
+        build_model(triangle_count=300, texture_count=2, bone_count=3, layout_groups=3)
+    )
+    scene = build_scene(model)
+    skin = build_skin(
+        model.bone_setup,
+        [("wave", Animation.parse_bytes(build_animation(bone_count=3)))]
+    )
+
+    gltf = pygltflib.GLTF2.load_from_bytes(
+        geometry_to_glb(scene.geometry, IMAGE_URIS, skin=skin, scene_nodes=scene.nodes)
+    )
+    primitives = [
+        primitive for node in gltf.nodes if node.skin is not None
+        for primitive in gltf.meshes[node.mesh].primitives
+    ]
+
+    assert len({p.attributes.POSITION for p in primitives}) > 1
+
+    for primitive in primitives:
+        attributes = primitive.attributes
+        position = gltf.accessors[attributes.POSITION]
+        joints = gltf.accessors[attributes.JOINTS_0]
+        weights = gltf.accessors[attributes.WEIGHTS_0]
+
+        # The skin attributes cover the same vertices as the node's positions,
+        # whose buffer view starts after the indices
+        view = gltf.bufferViews[position.bufferView]
+        start = (view.byteOffset - gltf.bufferViews[0].byteLength) // view.byteStride
+
+        assert joints.count == weights.count == position.count
+        assert joints.byteOffset == start * SKIN_STRIDE
+        assert weights.byteOffset == start * SKIN_STRIDE + 4
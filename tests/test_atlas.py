@@ -0,0 +1,69 @@
+from PIL import Image
+
+from jtn64.atlas import build_atlas, pack_rectangles, tiling_textures
+from jtn64.mesh import Geometry, Mesh
+
+
+def test_pack_rectangles_no_overlap():
+    sizes = [(32, 32), (16, 64), (8, 8), (64, 16), (8, 8), (32, 32)]
+
+    width, height, positions = pack_rectangles(sizes)
+
+    rects = [
+        (x, y, x + w, y + h) for (x, y), (w, h) in zip(positions, sizes)
+    ]
+
+    for i, a in enumerate(rects):
+        assert a[2] <= width and a[3] <= height
+
+        for b in rects[i + 1:]:
+            assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1]
+
+
+def test_build_atlas():
+    colors = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)]
+    images = [Image.new("RGBA", (8, 16), color) for color in colors]
+
+    # Left and right halves of each texture get different colors, so the
+    # remapped UVs can be checked against the atlas.
+    for image in images:
+        image.paste((255, 255, 255, 255), (4, 0, 8, 16))
+
+    # Vertex 1 is shared by the meshes of textures 0 and 1.
+    geometry = Geometry(
+        positions=[(0, 0, 0), (1, 0, 0), (0, 0, 1), (1, 0, 1), (2, 0, 2)],
+        colors=[(0, 0, 0)] * 5,
+        uvs=[(0.1, 0.5), (0.9, 0.5), (0.1, 0.9), (0.2, 0.2), (3.0, 0.5)],
+        meshes=[
+            Mesh(texture_index=0, indices=[(0, 1, 2)], vertices=[]),
+            Mesh(texture_index=1, indices=[(1, 2, 3)], vertices=[]),
+            Mesh(texture_index=2, indices=[(2, 3, 4)], vertices=[]),
+        ]
+    )
+
+    assert tiling_textures(geometry) == {2}
+
+    result = build_atlas(geometry, images)
+    atlas = result.images[0]
+
+    assert set(result.placements) == {0, 1}
+    assert result.images[1] is images[2]
+    assert [mesh.texture_index for mesh in result.geometry.meshes] == [0, 1]
+    assert len(result.geometry.meshes[0].indices) == 2
+
+    for (source_triangle, texture_index), triangle in zip(
+        [((0, 1, 2), 0), ((1, 2, 3), 1)], result.geometry.meshes[0].indices
+    ):
+        for source_vertex, vertex in zip(source_triangle, triangle):
+            u, v = geometry.uvs[source_vertex]
+            atlas_u, atlas_v = result.geometry.uvs[vertex]
+
+            expected = images[texture_index].getpixel((int(u * 8), int(v * 16)))
+            actual = atlas.getpixel((int(atlas_u * atlas.width), int(atlas_v * atlas.height)))
+
+            assert actual == expected
+
+    # The tiling texture keeps its original UVs
+    tiled = result.geometry.meshes[1].indices[0]
+
+    assert [result.geometry.uvs[v] for v in tiled] == [geometry.uvs[v] for v in (2, 3, 4)]
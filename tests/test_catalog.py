@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from jtn64.catalog import Catalog
+from jtn64.limits import Budget
+from jtn64.textures import TextureType
+
+from benchmarks.synthetic import build_model, build_rom
+
+CI4_QUERY = """
+    SELECT DISTINCT models.tri_count
+    FROM models JOIN textures ON textures.model_hash = models.hash
+    WHERE models.tri_count > 200 AND textures.texture_type = 'CI4'
+"""
+
+
+def _models():
+    return [
+        build_model(triangle_count=300, texture_type=TextureType.CI4, texture_count=2),
+        build_model(triangle_count=400, texture_type=TextureType.RGBA16, collision=True),
+        build_model(triangle_count=100, texture_type=TextureType.CI4, layout_groups=2, bone_count=3),
+    ]
+
+
+def test_catalog_rom(tmp_path):
+    rom_path = tmp_path / "rom.z64"
+    rom_path.write_bytes(build_rom(_models()))
+
+    with Catalog(tmp_path / "catalog.sqlite") as catalog:
+        update = catalog.add_source(rom_path)
+
+        assert (update.skipped, update.models, update.new_models) == (False, 3, 3)
+        assert [row["tri_count"] for row in catalog.query(CI4_QUERY)] == [300]
+
+        rows = {row["tri_count"]: row for row in catalog.query("SELECT * FROM models")}
+
+        assert rows[400]["collision_tri_count"] == 400
+        assert rows[100]["bone_count"] == 3
+        assert rows[100]["layout_node_count"] > 0
+        assert all(row["error"] is None for row in rows.values())
+        assert rows[300]["min_x"] <= rows[300]["max_x"]
+
+        textures = catalog.query(
+            "SELECT * FROM textures WHERE model_hash = ? ORDER BY texture_index",
+            (rows[300]["hash"],)
+        )
+
+        assert [(t["texture_type"], t["width"]) for t in textures] == [("CI4", 32)] * 2
+
+        offsets = catalog.query("SELECT offset FROM occurrences ORDER BY offset")
+        assert offsets[0]["offset"] == 0x1000
+
+
+def test_catalog_is_incremental(tmp_path):
+    models = _models()
+    rom_path = tmp_path / "rom.z64"
+    rom_path.write_bytes(build_rom(models))
+
+    with Catalog(tmp_path / "catalog.sqlite") as catalog:
+        catalog.add_source(rom_path)
+
+        assert catalog.add_source(rom_path).skipped
+
+        # Touched but unchanged
+        os.utime(rom_path, ns=(0, 0))
+        assert catalog.add_source(rom_path).skipped
+
+        # A second ROM sharing two of the models only parses the new one
+        other_path = tmp_path / "other.z64"
+        other_path.write_bytes(build_rom(models[:2] + [build_model(triangle_count=50)]))
+
+        update = catalog.add_source(other_path)
+        assert (update.models, update.new_models) == (3, 1)
+
+        # Rescanning a changed ROM replaces its rows and drops models nothing
+        # references any more
+        rom_path.write_bytes(build_rom(models[:1]))
+
+        update = catalog.add_source(rom_path)
+        assert (update.skipped, update.models, update.new_models) == (False, 1, 0)
+
+        assert sorted(row[0] for row in catalog.query("SELECT tri_count FROM models")) == [50, 300, 400]
+        assert catalog.query("SELECT COUNT(*) FROM occurrences")[0][0] == 4
+
+
+def test_catalog_model_file_and_errors(tmp_path):
+    model_path = tmp_path / "model.bin"
+    model_path.write_bytes(build_model(triangle_count=60))
+
+    broken_path = tmp_path / "broken.bin"
+    broken_path.write_bytes(build_model(triangle_count=60)[:60])
+
+    with Catalog(tmp_path / "catalog.sqlite") as catalog:
+        assert catalog.add_source(model_path).models == 1
+        assert catalog.add_source(broken_path).models == 1
+
+        rows = catalog.query("SELECT tri_count, error FROM models ORDER BY size DESC")
+
+        assert rows[0]["tri_count"] == 60 and rows[0]["error"] is None
+        assert rows[1]["tri_count"] is None and rows[1]["error"]
+
+
+def test_catalog_retries_budget_failures(tmp_path):
+    model_path = tmp_path / "model.bin"
+    model_path.write_bytes(build_model(triangle_count=60))
+    catalog_path = tmp_path / "catalog.sqlite"
+
+    with Catalog(catalog_path, Budget(seconds=None, max_bytes=100)) as catalog:
+        catalog.add_source(model_path)
+
+        assert catalog.query("SELECT error FROM models")[0]["error"].startswith("BudgetExceeded")
+
+    # A bigger budget parses it on the next scan
+    with Catalog(catalog_path) as catalog:
+        update = catalog.add_source(model_path, force=True)
+
+        assert update.new_models == 1
+
+        row = catalog.query("SELECT tri_count, error FROM models")[0]
+
+        assert row["tri_count"] == 60 and row["error"] is None
+
+        # Parsed models aren't parsed again
+        assert catalog.add_source(model_path, force=True).new_models == 0
+
+
+def test_catalog_version(tmp_path):
+    path = tmp_path / "catalog.sqlite"
+    Catalog(path).close()
+
+    with Catalog(path) as catalog:
+        catalog.connection.execute("PRAGMA user_version = 99")
+
+    with pytest.raises(ValueError):
+        Catalog(path)
@@ -0,0 +1,85 @@
+import json
+
+import pygltflib
+import pytest
+
+from jtn64 import Model
+from jtn64.chunks import INDEX_FILENAME, iter_chunks, write_chunks
+
+from benchmarks.synthetic import build_model
+
+CHUNK_SIZE = 256
+
+
+def _geometry():
+    model = Model.parse_bytes(build_model(triangle_count=1200, texture_count=3))
+
+    return model.build_geometry()
+
+
+def _triangles(geometry, textures=None):
+    return sorted(
+        (
+            mesh.texture_index if textures is None or mesh.texture_index is None
+            else textures[mesh.texture_index],
+            tuple((geometry.positions[v], geometry.uvs[v]) for v in triangle),
+        )
+        for mesh in geometry.meshes for triangle in mesh.indices
+    )
+
+
+def test_chunks_cover_every_triangle():
+    geometry = _geometry()
+    chunks = list(iter_chunks(geometry, CHUNK_SIZE))
+
+    assert len(chunks) > 1
+    assert len({chunk.cell for chunk in chunks}) == len(chunks)
+
+    triangles = []
+
+    for chunk in chunks:
+        triangles += _triangles(chunk.geometry, chunk.textures)
+
+        low, high = chunk.bounds
+
+        for position in chunk.geometry.positions:
+            assert all(low[i] <= position[i] <= high[i] for i in range(3))
+
+        # Centroids fall in the chunk's cell
+        for mesh in chunk.geometry.meshes:
+            for triangle in mesh.indices:
+                for axis in range(3):
+                    centroid = sum(chunk.geometry.positions[v][axis] for v in triangle) / 3
+                    assert centroid // CHUNK_SIZE == chunk.cell[axis]
+
+        # One mesh per texture, every vertex used
+        textures = [mesh.texture_index for mesh in chunk.geometry.meshes]
+        assert len(set(textures)) == len(textures)
+        assert {v for mesh in chunk.geometry.meshes for t in mesh.indices for v in t} == set(
+            range(len(chunk.geometry.positions))
+        )
+
+    assert sorted(triangles) == _triangles(geometry)
+
+
+def test_chunk_size_must_be_positive():
+    with pytest.raises(ValueError):
+        list(iter_chunks(_geometry(), 0))
+
+
+def test_write_chunks(tmp_path):
+    geometry = _geometry()
+    image_uris = [f"texture_{i}.png" for i in range(3)]
+
+    index = write_chunks(tmp_path, "level", geometry, image_uris, CHUNK_SIZE)
+
+    assert json.loads((tmp_path / INDEX_FILENAME).read_text()) == index
+    assert sum(chunk["triangles"] for chunk in index["chunks"]) == 1200
+
+    for chunk in index["chunks"]:
+        gltf = pygltflib.GLTF2.load_binary(str(tmp_path / chunk["file"]))
+        position = gltf.accessors[gltf.meshes[0].primitives[0].attributes.POSITION]
+
+        assert position.min == chunk["min"]
+        assert position.max == chunk["max"]
+        assert {image.uri for image in gltf.images} <= set(image_uris)
@@ -0,0 +1,130 @@
+import math
+import random
+import struct
+
+import pygltflib
+import pytest
+
+from jtn64 import Model, ModelParseError
+from jtn64.collision import CollisionBVH, closest_point_on_triangle
+from jtn64.glb import geometry_to_glb
+
+from benchmarks.synthetic import build_model
+
+
+def _random_triangles(count, seed=0):
+    rng = random.Random(seed)
+    triangles = []
+
+    for _ in range(count):
+        centre = [rng.uniform(-1000, 1000) for _ in range(3)]
+        triangles.append(tuple(
+            tuple(c + rng.uniform(-60, 60) for c in centre) for _ in range(3)
+        ))
+
+    return triangles
+
+
+def _brute_force_raycast(triangles, origin, direction, max_distance=math.inf):
+    best = None
+
+    for i, triangle in enumerate(triangles):
+        hit = CollisionBVH([triangle]).raycast(origin, direction, max_distance)
+
+        if hit is not None and (best is None or hit.distance < best[0]):
+            best = (hit.distance, i)
+
+    return best
+
+
+def test_parse_collision():
+    model = Model.parse_bytes(build_model(triangle_count=100, collision=True))
+
+    assert len(model.collision.geos) == 1
+    assert len(model.collision.tris) == 100
+    assert model.collision.tris[0].vertices == (0, 16, 1)
+
+    assert Model.parse_bytes(build_model(triangle_count=100)).collision is None
+
+
+def test_collision_vertex_out_of_range():
+    data = bytearray(build_model(triangle_count=100, collision=True))
+    collision_offset = struct.unpack_from(">I", data, 28)[0]
+    geo_count = struct.unpack_from(">h", data, collision_offset + 16)[0]
+
+    # First vertex of the first triangle, after the header and the geos
+    struct.pack_into(">H", data, collision_offset + 24 + geo_count * 4, 0xFFFF)
+
+    with pytest.raises(ModelParseError):
+        Model.parse_bytes(bytes(data))
+
+
+def test_bvh_matches_brute_force():
+    triangles = _random_triangles(500)
+    bvh = CollisionBVH(triangles)
+    rng = random.Random(1)
+
+    rays = [
+        ((rng.uniform(-1000, 1000), 2000, rng.uniform(-1000, 1000)), (0, -1, 0))
+        for _ in range(50)
+    ] + [
+        (
+            tuple(rng.uniform(-1000, 1000) for _ in range(3)),
+            tuple(rng.uniform(-1, 1) for _ in range(3))
+        )
+        for _ in range(50)
+    ]
+
+    hits = bvh.raycast_many(rays)
+
+    assert any(hits)
+
+    for (origin, direction), hit in zip(rays, hits):
+        expected = _brute_force_raycast(triangles, origin, direction)
+
+        if expected is None:
+            assert hit is None
+        else:
+            assert hit.triangle == expected[1]
+            assert math.isclose(hit.distance, expected[0])
+
+    points = [tuple(rng.uniform(-1000, 1000) for _ in range(3)) for _ in range(30)]
+
+    for point, nearest in zip(points, bvh.nearest_many(points)):
+        expected = min(
+            math.dist(point, closest_point_on_triangle(point, *triangle))
+            for triangle in triangles
+        )
+
+        assert math.isclose(nearest.distance, expected)
+
+
+def test_segment_cast():
+    bvh = CollisionBVH([((0, 0, 0), (10, 0, 0), (0, 0, 10))])
+
+    hit = bvh.segment_cast((1, 5, 1), (1, -5, 1))
+
+    assert hit.distance == 0.5
+    assert hit.point == (1, 0, 1)
+    assert bvh.segment_cast((1, 5, 1), (1, 1, 1)) is None
+    assert bvh.segment_cast_many([((1, -1, 1), (1, 1, 1))])[0].triangle == 0
+
+
+def test_collision_node_export():
+    model = Model.parse_bytes(build_model(triangle_count=60, texture_count=1, collision=True))
+    positions = [vertex.position for vertex in model.vertex_store_setup_header.vertices]
+
+    gltf = pygltflib.GLTF2.load_from_bytes(geometry_to_glb(
+        model.build_geometry(), ["data:image/png;base64,AAAA"],
+        collision=model.collision.to_mesh(positions)
+    ))
+
+    node = gltf.nodes[-1]
+
+    assert node.name == "collision"
+    assert len(gltf.nodes) - 1 in gltf.scenes[0].nodes
+
+    primitive = gltf.meshes[node.mesh].primitives[0]
+
+    assert gltf.accessors[primitive.indices].count == 60 * 3
+    assert primitive.material is None
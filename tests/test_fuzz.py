@@ -0,0 +1,73 @@
+import struct
+import time
+
+import pytest
+
+from jtn64 import Model, ModelParseError
+from jtn64.limits import Budget, BudgetExceeded
+
+from benchmarks.fuzz import LINEAR_TOLERANCE, fuzz, superlinearity, worst_case_times
+from benchmarks.synthetic import build_model
+
+
+def _patch(data: bytes, offset: int, fmt: str, value: int) -> bytes:
+    data = bytearray(data)
+    struct.pack_into(fmt, data, offset, value)
+
+    return bytes(data)
+
+
+def test_fuzzed_models_parse_or_raise_model_parse_error():
+    report = fuzz(600, seed=1)
+
+    assert report.crashes == []
+    assert report.parsed and report.rejected
+
+
+def test_parse_time_is_linear():
+    assert superlinearity(worst_case_times(mutations=5)) < LINEAR_TOLERANCE
+
+
+def test_bad_counts_are_rejected():
+    model_data = build_model(triangle_count=100)
+    display_list_offset, vertex_store_offset = struct.unpack_from(">II", model_data, 12)
+
+    for offset, fmt, value in (
+        (display_list_offset, ">I", 0xFFFFFFFF),   # Command count
+        (vertex_store_offset + 20, ">H", 0xFFFF),  # Vertex count
+        (0x38 + 4, ">H", 0xFFFF),                  # Texture count
+        (0x38 + 8 + 4, ">H", 0x7),                 # Texture type
+        (12, ">I", len(model_data)),               # Display list offset
+    ):
+        with pytest.raises(ModelParseError):
+            Model.parse_bytes(_patch(model_data, offset, fmt, value))
+
+    with pytest.raises(ModelParseError):
+        Model.parse_bytes(model_data[:40])
+
+
+def test_budget():
+    budget = Budget(seconds=0.05, max_bytes=1000)
+
+    budget.check_size(1000)
+
+    with pytest.raises(BudgetExceeded):
+        budget.check_size(1001)
+
+    start = time.perf_counter()
+
+    with pytest.raises(BudgetExceeded):
+        with budget.deadline():
+            while True:
+                pass
+
+    assert time.perf_counter() - start < 1
+
+    # The alarm is disarmed afterwards
+    with budget.deadline():
+        pass
+
+    time.sleep(0.1)
+
+    with Budget(seconds=None, max_bytes=None).deadline():
+        time.sleep(0.01)
@@ -0,0 +1,64 @@
+import io
+import json
+
+import pygltflib
+import pytest
+
+from jtn64 import Model, glb
+from jtn64.glb import geometry_to_glb, write_glb
+from jtn64.gltf import geometry_to_gltf
+from jtn64.simplify import generate_lods
+
+from benchmarks.synthetic import build_model
+
+IMAGE_URIS = ["data:image/png;base64,AAAA"] * 3
+
+
+def _document(gltf):
+    document = json.loads(gltf.to_json())
+    document.pop("asset")
+
+    return document
+
+
+def test_matches_pygltflib():
+    model = Model.parse_bytes(build_model(triangle_count=600, texture_count=3))
+    geometry = model.build_geometry()
+    lods = generate_lods(geometry, [0.5])
+
+    for quantize in (False, True):
+        for levels in ((), lods):
+            expected = geometry_to_gltf(geometry, IMAGE_URIS, quantize=quantize, lods=levels)
+            glb = pygltflib.GLTF2.load_from_bytes(
+                geometry_to_glb(geometry, IMAGE_URIS, quantize, levels)
+            )
+
+            assert _document(glb) == _document(expected)
+            assert glb.binary_blob() == expected.binary_blob()
+
+
+def test_write_glb_length():
+    model = Model.parse_bytes(build_model(triangle_count=100, texture_count=3))
+
+    out = io.BytesIO()
+    written = write_glb(out, model.build_geometry(), IMAGE_URIS)
+
+    assert written == len(out.getvalue())
+    assert out.getvalue()[:4] == b"glTF"
+    assert int.from_bytes(out.getvalue()[8:12], "little") == written
+
+
+def test_write_glb_checks_chunk_length(monkeypatch):
+    model = Model.parse_bytes(build_model(triangle_count=100, texture_count=3))
+    write_vertices = glb._write_vertices
+
+    def short_vertices(out, geometry, quantize):
+        written = write_vertices(io.BytesIO(), geometry, quantize)
+        out.write(bytes(written - 4))
+
+        return written - 4
+
+    monkeypatch.setattr(glb, "_write_vertices", short_vertices)
+
+    with pytest.raises(ValueError):
+        write_glb(io.BytesIO(), model.build_geometry(), IMAGE_URIS)
@@ -0,0 +1,83 @@
+import struct
+from dataclasses import replace
+
+import pygltflib
+
+from jtn64 import Model
+from jtn64.gltf import geometry_to_gltf, model_to_gltf, uv_fraction_bits
+
+from benchmarks.synthetic import build_model
+
+
+def _read_vertices(gltf, position_type, uv_type):
+    accessors = gltf.accessors[-3:]
+    view = gltf.bufferViews[1]
+    blob = gltf.binary_blob()
+
+    vertices = []
+
+    for i in range(accessors[0].count):
+        start = view.byteOffset + i * view.byteStride
+
+        position = struct.unpack_from(position_type * 3, blob, start)
+        uv = struct.unpack_from(uv_type * 2, blob, start + accessors[2].byteOffset)
+
+        vertices.append((position, uv))
+
+    return vertices
+
+
+def test_uv_fraction_bits():
+    assert uv_fraction_bits([(0.0, 0.5)]) == 15
+    assert uv_fraction_bits([(1.0, 0.5)]) == 14
+    assert uv_fraction_bits([(-7.5, 3.0)]) == 12
+
+
+def test_quantized_matches_float():
+    model = Model.parse_bytes(build_model(triangle_count=200, texture_count=2))
+
+    full = model_to_gltf(model)
+    quantized = model_to_gltf(model, quantize=True)
+
+    assert quantized.extensionsRequired == ["KHR_mesh_quantization", "KHR_texture_transform"]
+    assert quantized.accessors[-3].componentType == pygltflib.SHORT
+    assert quantized.bufferViews[1].byteStride < full.bufferViews[1].byteStride
+
+    position_scale = quantized.nodes[0].scale[0]
+    uv_scale = quantized.materials[0].pbrMetallicRoughness.baseColorTexture \
+        .extensions["KHR_texture_transform"]["scale"][0]
+
+    full_vertices = _read_vertices(full, "f", "f")
+    quantized_vertices = _read_vertices(quantized, "h", "h")
+
+    for (position, uv), (q_position, q_uv) in zip(full_vertices, quantized_vertices):
+        assert [p * position_scale for p in q_position] == list(position)
+        assert abs(q_uv[0] * uv_scale - uv[0]) <= uv_scale
+        assert abs(q_uv[1] * uv_scale - uv[1]) <= uv_scale
+
+
+def test_msft_lod_nodes():
+    model = Model.parse_bytes(build_model(triangle_count=90, texture_count=2))
+    geometry = model.build_geometry()
+
+    lods = [
+        [replace(mesh, indices=mesh.indices[:len(mesh.indices) // 2]) for mesh in geometry.meshes],
+        [replace(mesh, indices=mesh.indices[:1]) for mesh in geometry.meshes],
+    ]
+
+    gltf = geometry_to_gltf(geometry, ["data:,"] * 2, lods=lods)
+    mesh_count = len(geometry.meshes)
+
+    assert "MSFT_lod" in gltf.extensionsUsed
+    assert gltf.scenes[0].nodes == list(range(mesh_count))
+    assert len(gltf.nodes) == mesh_count * 3
+
+    for mesh_index in range(mesh_count):
+        ids = gltf.nodes[mesh_index].extensions["MSFT_lod"]["ids"]
+
+        for level, node_index in enumerate(ids):
+            node = gltf.nodes[node_index]
+            indices = gltf.accessors[gltf.meshes[node.mesh].primitives[0].indices]
+
+            assert node.name == f"mesh_{mesh_index}_lod{level + 1}"
+            assert indices.count == len(lods[level][mesh_index].indices) * 3
@@ -0,0 +1,139 @@
+import struct
+
+import pygltflib
+import pytest
+
+from jtn64 import Model
+from jtn64.glb import geometry_to_glb
+from jtn64.layout import GeoCommandType, GeometryLayout, build_scene
+
+from benchmarks.synthetic import BATCH_VERTICES, build_model
+
+IMAGE_URIS = ["data:image/png;base64,AAAA"] * 2
+
+
+def _model(**options):
+    return Model.parse_bytes(build_model(triangle_count=300, texture_count=2, layout_groups=3, **options))
+
+
+def _triangles(geometry, meshes):
+    return sorted(
+        (mesh.texture_index, tuple(geometry.positions[v] for v in triangle))
+        for mesh in meshes for triangle in mesh.indices
+    )
+
+
+def test_parse_layout():
+    layout = _model().geometry_layout
+
+    assert [node.type for node in layout.nodes] == [GeoCommandType.BONE] * 3
+    assert [node.properties["bone"] for node in layout.nodes] == [0, 1, 2]
+    assert [len(node.children) for node in layout.nodes] == [4, 4, 2]
+    assert all(child.type is GeoCommandType.LOAD_DL for child in layout.nodes[0].children)
+    assert layout.find(layout.nodes[1].offset) is layout.nodes[1]
+
+    assert Model.parse_bytes(build_model(triangle_count=100)).geometry_layout is None
+
+
+def test_layout_bounds():
+    model = _model()
+
+    for node in model.geometry_layout.walk():
+        result = model.simulate_displaylist(node.subtree_display_lists())
+        used = [
+            model.vertex_store_setup_header.vertices[v].position
+            for mesh in result.meshes for triangle in mesh.indices for v in triangle
+        ]
+
+        low, high = node.bounds
+        assert all(low[i] <= p[i] <= high[i] for p in used for i in range(3))
+
+    root_bounds = [node.bounds for node in model.geometry_layout.nodes]
+    assert root_bounds[0][1][1] < root_bounds[1][0][1]
+
+
+def test_subtree_simulation():
+    model = _model()
+    full = model.simulate_displaylist()
+    geometry = model.build_geometry(full)
+
+    parts = []
+
+    for node in model.geometry_layout.nodes:
+        parts += model.simulate_displaylist(node.subtree_display_lists()).meshes
+
+    assert _triangles(geometry, parts) == _triangles(geometry, full.meshes)
+    assert sum(len(mesh.indices) for mesh in parts) == 300
+
+
+def test_vertex_bones():
+    model = _model()
+    bones = model.geometry_layout.vertex_bones(model.display_list_setup_header, 320)
+
+    # 10 strips split 4, 4, 2
+    assert bones == [0] * 4 * BATCH_VERTICES + [1] * 4 * BATCH_VERTICES + [2] * 2 * BATCH_VERTICES
+
+
+def test_scene_glb():
+    model = _model()
+    flat = model.build_geometry()
+    scene = build_scene(model)
+
+    assert _triangles(scene.geometry, scene.geometry.meshes) == _triangles(flat, flat.meshes)
+    assert [scene.geometry.positions[i] for i in range(len(scene.source_vertices))] == [
+        flat.positions[v] for v in scene.source_vertices
+    ]
+
+    gltf = pygltflib.GLTF2.load_from_bytes(
+        geometry_to_glb(scene.geometry, IMAGE_URIS, scene_nodes=scene.nodes)
+    )
+
+    assert len(gltf.binary_blob()) == gltf.buffers[0].byteLength
+    assert [gltf.nodes[i].name for i in gltf.scenes[0].nodes] == [
+        node.name for node in model.geometry_layout.nodes
+    ]
+
+    for node in model.geometry_layout.walk():
+        if not node.display_lists:
+            continue
+
+        gltf_node = next(n for n in gltf.nodes if n.name == node.name)
+        mesh_node = gltf.nodes[gltf_node.children[0]]
+        position = gltf.accessors[gltf.meshes[mesh_node.mesh].primitives[0].attributes.POSITION]
+
+        assert position.min == [c / 128 for c in node.bounds[0]]
+        assert position.max == [c / 128 for c in node.bounds[1]]
+
+
+def test_subtree_scene():
+    model = _model()
+    root = model.geometry_layout.nodes[2]
+    scene = build_scene(model, root)
+
+    assert [node.name for node in scene.nodes] == [root.name]
+    assert sum(len(mesh.indices) for mesh in scene.geometry.meshes) == 300 - 8 * 30
+
+
+def test_bad_layout():
+    load_dl = struct.pack(">IIhh", GeoCommandType.LOAD_DL, 0, 0, 1)
+
+    def selector(*child_offsets):
+        return struct.pack(
+            f">IIhh{len(child_offsets)}I", GeoCommandType.SELECTOR, 0,
+            len(child_offsets), 0, *child_offsets
+        )
+
+    layout = GeometryLayout.parse_bytes(selector(16) + load_dl)
+    assert layout.nodes[0].children[0].display_lists == [(0, 1)]
+
+    # Both children point at the same list
+    with pytest.raises(ValueError):
+        GeometryLayout.parse_bytes(selector(20, 20) + load_dl)
+
+    # Child list past the end
+    with pytest.raises(ValueError):
+        GeometryLayout.parse_bytes(selector(64) + load_dl)
+
+    # Truncated command body
+    with pytest.raises(ValueError):
+        GeometryLayout.parse_bytes(load_dl[:10])
@@ -2,6 +2,8 @@ from jtn64 import Model, ModelHeader, TextureSetupHeader, TextureSubHeader
 from struct import pack
 from pathlib import Path
 
+from benchmarks.synthetic import build_model
+
 
 def test_parse_model():
     model_data = pack(
@@ -103,3 +105,107 @@ def test_texture_find_offset():
 
     assert header_2.find_nearest_texture(0x0) == 0
     assert header_2.find_nearest_texture(0x10) == 0
+
+
+def test_parse_model_synthetic():
+    model_data = build_model(
+        triangle_count=100, texture_count=3, texture_size=16,
+        texture_switch_every=1
+    )
+
+    model = Model.parse_bytes(model_data)
+    result = model.simulate_displaylist()
+
+    assert model.model_header.tri_count == 100
+    assert len(model.texture_data) == 3
+    assert sum(len(mesh.indices) for mesh in result.meshes) == 100
+    assert [mesh.texture_index for mesh in result.meshes] == [0, 1, 2, 0]
+
+
+def test_palettized_texture_image():
+    from jtn64.textures import TextureType
+    from jtn64.util import encode_png
+
+    for texture_type in (TextureType.CI4, TextureType.CI8):
+        model = Model.parse_bytes(build_model(
+            triangle_count=30, texture_count=1, texture_size=32,
+            texture_type=texture_type
+        ))
+        texture = model.texture_data[0]
+
+        indexed = texture.to_image()
+        rgba = texture.to_image(rgba=True)
+
+        assert indexed.mode == "P"
+        assert rgba.mode == "RGBA"
+        assert list(indexed.convert("RGBA").getdata()) == list(rgba.getdata())
+
+        png = encode_png(indexed)
+
+        assert b"tRNS" in png
+        assert len(png) < len(encode_png(rgba))
+
+
+def test_parsed_records_are_slotted():
+    model = Model.parse_bytes(build_model(triangle_count=30, texture_count=1))
+
+    records = [
+        model, model.model_header, model.texture_data[0],
+        model.vertex_store_setup_header.vertices[0],
+        *model.display_list_setup_header.commands,
+        *model.simulate_displaylist().meshes,
+    ]
+
+    for record in records:
+        assert not hasattr(record, "__dict__"), type(record).__name__
+
+
+def test_find_texture_range():
+    header = TextureSetupHeader(
+        data_length=0,
+        texture_count=2,
+        texture_sub_headers=[
+            TextureSubHeader(
+                segment_address_offset=0x0,
+                texture_type=1,
+                width=8,
+                height=8,
+                texture_data_length=0x80
+            ),
+            TextureSubHeader(
+                segment_address_offset=0x100,
+                texture_type=1,
+                width=8,
+                height=8,
+                texture_data_length=0x80
+            ),
+        ]
+    )
+
+    assert header.find_texture(0x0) == 0
+    assert header.find_texture(0x7F) == 0
+    assert header.find_texture(0x80) is None
+    assert header.find_nearest_texture(0x80) == 0
+    assert header.find_texture(0x100) == 1
+    assert header.find_texture(0x180) is None
+    assert header.find_nearest_texture(-1) is None
+
+
+def test_unresolved_settimg():
+    from jtn64.f3d import F3DCommandSetTImg
+
+    model = Model.parse_bytes(build_model(
+        triangle_count=100, texture_count=2, texture_size=16,
+        texture_switch_every=1
+    ))
+
+    assert model.simulate_displaylist().unresolved_textures == []
+
+    commands = model.display_list_setup_header.commands
+    first = next(c for c in commands if isinstance(c, F3DCommandSetTImg))
+    first.texture_segment_address = 0x02000000 + 0x10000
+
+    result = model.simulate_displaylist()
+
+    assert result.unresolved_textures == [0x02010000]
+    assert result.meshes[0].texture_index is None
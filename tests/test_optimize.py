@@ -0,0 +1,76 @@
+import random
+
+from jtn64.mesh import Geometry, Mesh
+from jtn64.optimize import acmr, optimize_geometry, optimize_vertex_cache
+
+
+def _grid(size):
+    triangles = []
+
+    for y in range(size - 1):
+        for x in range(size - 1):
+            a = y * size + x
+            b = a + 1
+            c = a + size
+            d = c + 1
+
+            triangles += [(a, c, b), (b, c, d)]
+
+    return triangles
+
+
+def test_acmr():
+    assert acmr([(0, 1, 2), (2, 1, 3)], cache_size=32) == 2.0
+    assert acmr([]) == 0.0
+
+
+def test_optimize_vertex_cache_shuffled_grid():
+    triangles = _grid(40)
+    random.Random(0).shuffle(triangles)
+
+    optimized = optimize_vertex_cache(triangles)
+
+    assert sorted(optimized) == sorted(triangles)
+    assert acmr(optimized) < acmr(triangles) / 2
+
+
+def test_optimize_geometry():
+    triangles = _grid(10)
+    random.Random(1).shuffle(triangles)
+
+    vertex_count = 10 * 10 + 5  # trailing vertices are never used
+
+    geometry = Geometry(
+        positions=[(i, i, i) for i in range(vertex_count)],
+        colors=[(i, 0, 0) for i in range(vertex_count)],
+        uvs=[(i, 0.0) for i in range(vertex_count)],
+        meshes=[
+            Mesh(texture_index=0, indices=triangles[:100], vertices=[]),
+            Mesh(texture_index=1, indices=triangles[100:], vertices=[]),
+        ]
+    )
+
+    optimized, report = optimize_geometry(geometry)
+
+    assert report.acmr_after < report.acmr_before
+    assert report.vertices_after == 100
+    assert len(optimized.positions) == 100
+
+    # Same triangles, in terms of the vertices they reference
+    for mesh, optimized_mesh in zip(geometry.meshes, optimized.meshes):
+        assert sorted(
+            tuple(geometry.positions[v] for v in triangle) for triangle in mesh.indices
+        ) == sorted(
+            tuple(optimized.positions[v] for v in triangle) for triangle in optimized_mesh.indices
+        )
+
+    # Vertices are numbered in order of first use
+    seen = []
+
+    for mesh in optimized.meshes:
+        for triangle in mesh.indices:
+            for vertex in triangle:
+                if vertex not in seen:
+                    seen.append(vertex)
+
+    assert seen == list(range(100))
@@ -0,0 +1,113 @@
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from jtn64.pipeline import run_pipeline
+
+from benchmarks.synthetic import build_model
+
+STAGE_SECONDS = 0.03
+
+
+def _convert(path, data):
+    return [(path + ".out", data.upper())], len(data)
+
+
+def test_pipeline_converts_everything():
+    written = {}
+    results = {}
+
+    with ThreadPoolExecutor(2) as executor:
+        run_pipeline(
+            [f"model{i}" for i in range(20)], _convert, executor, 2, 3,
+            on_result=results.__setitem__,
+            read=lambda path: path.encode(),
+            write=written.__setitem__
+        )
+
+    assert written == {f"model{i}.out": f"MODEL{i}".encode() for i in range(20)}
+    assert results == {f"model{i}": len(f"model{i}") for i in range(20)}
+
+
+def test_pipeline_overlaps_stages():
+    def slow(result):
+        time.sleep(STAGE_SECONDS)
+
+        return result
+
+    paths = [str(i) for i in range(12)]
+
+    with ThreadPoolExecutor(1) as executor:
+        start = time.perf_counter()
+        run_pipeline(
+            paths, lambda path, data: slow(([(path, data)], None)), executor, 1,
+            read=lambda path: slow(path.encode()),
+            write=lambda path, data: slow(None)
+        )
+        elapsed = time.perf_counter() - start
+
+    # Sequentially this would take 3 stages per item
+    assert elapsed < len(paths) * STAGE_SECONDS * 2
+
+
+def test_pipeline_backpressure():
+    prefetch = 2
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def read(path):
+        nonlocal in_flight, peak
+
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+
+        return path.encode()
+
+    def write(path, data):
+        nonlocal in_flight
+
+        # A slow disk: everything upstream should stall rather than pile up
+        time.sleep(0.01)
+
+        with lock:
+            in_flight -= 1
+
+    with ThreadPoolExecutor(2) as executor:
+        run_pipeline([str(i) for i in range(30)], _convert, executor, 2, prefetch, read=read, write=write)
+
+    # Each queue, each worker, the item being read and the one being written
+    assert peak <= 2 * prefetch + 2 + 2
+
+
+def test_pipeline_errors():
+    def convert(path, data):
+        if path == "3":
+            raise ValueError("bad model")
+
+        return _convert(path, data)
+
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError, match="bad model"):
+            run_pipeline(
+                [str(i) for i in range(10)], convert, executor, 2,
+                read=lambda path: path.encode(), write=lambda path, data: None
+            )
+
+
+def test_pipeline_processes(tmp_path):
+    paths = []
+
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.bin"))
+        (tmp_path / f"{i}.bin").write_bytes(build_model(triangle_count=50, seed=i))
+
+    with ProcessPoolExecutor(2) as executor:
+        run_pipeline(paths, _convert, executor, 2)
+
+    for path in paths:
+        assert Path(path + ".out").read_bytes() == Path(path).read_bytes().upper()
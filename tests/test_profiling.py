@@ -0,0 +1,27 @@
+import pstats
+
+from jtn64 import Model, profiling
+
+from benchmarks.synthetic import build_model
+
+
+def test_profile_per_model(tmp_path):
+    model_data = build_model(triangle_count=60, texture_count=1)
+    prefix = tmp_path / "profile"
+
+    profiling.start(str(prefix), per_model=True)
+
+    with profiling.model_scope("models/a.bin"):
+        Model.parse_bytes(model_data).simulate_displaylist()
+
+    written = profiling.stop()
+
+    assert written == [
+        tmp_path / "profile.pstats",
+        tmp_path / "profile.collapsed",
+        tmp_path / "profile.a.bin.pstats",
+    ]
+
+    functions = {name for _, _, name in pstats.Stats(str(written[2])).stats}
+
+    assert "simulate_displaylist" in functions
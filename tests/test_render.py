@@ -0,0 +1,126 @@
+import io
+
+import numpy as np
+from click.testing import CliRunner
+from PIL import Image
+
+import decompile
+from jtn64 import render
+from jtn64.mesh import Geometry, Mesh
+from jtn64.render import render_geometry, render_thumbnail
+
+from benchmarks.synthetic import build_model
+
+WHITE = (255, 255, 255)
+
+
+def _quad(geometry, z, size, texture_index=None, color=WHITE, uv_scale=1.0):
+    """
+    Append a square facing the camera, centered on the origin.
+    """
+
+    start = len(geometry.positions)
+
+    for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+        geometry.positions.append((x * size, y * size, z))
+        geometry.colors.append(color)
+        # V points down the image, like GLTF
+        geometry.uvs.append(((x + 1) / 2 * uv_scale, (1 - y) / 2 * uv_scale))
+
+    geometry.meshes.append(Mesh(
+        texture_index=texture_index,
+        indices=[(start, start + 1, start + 2), (start, start + 2, start + 3)],
+        vertices=[]
+    ))
+
+
+def _render(geometry, textures=(), size=32):
+    return render_geometry(geometry, list(textures), size, yaw=0, pitch=0)
+
+
+def test_depth_test():
+    geometry = Geometry(positions=[], colors=[], uvs=[], meshes=[])
+
+    # A small red square in front of a big blue one, drawn first so the
+    # blue one has to fail the depth test
+    _quad(geometry, 10, 50, color=(255, 0, 0))
+    _quad(geometry, 0, 100, color=(0, 0, 255))
+
+    image = _render(geometry)
+
+    assert tuple(image[16, 16]) == (255, 0, 0, 255)
+    assert tuple(image[2, 2]) == (0, 0, 255, 255)
+
+    # Background stays transparent outside the margin
+    assert image[0, 0, 3] == 0
+
+
+def test_texturing():
+    texture = np.zeros((2, 2, 4), dtype=np.uint8)
+    texture[0, 0] = (255, 0, 0, 255)
+    texture[0, 1] = (0, 255, 0, 255)
+    texture[1, 0] = (0, 0, 255, 255)
+    # Cut out by the alpha test
+    texture[1, 1] = (255, 255, 255, 0)
+
+    geometry = Geometry(positions=[], colors=[], uvs=[], meshes=[])
+    _quad(geometry, 0, 100, texture_index=0, color=(255, 255, 128))
+
+    image = _render(geometry, [texture])
+
+    assert tuple(image[8, 8]) == (255, 0, 0, 255)
+    assert tuple(image[8, 24]) == (0, 255, 0, 255)
+    # Vertex color modulates the texture
+    assert tuple(image[24, 8]) == (0, 0, 128, 255)
+    assert image[24, 24, 3] == 0
+
+    # UVs past 1 wrap
+    wrapped = Geometry(positions=[], colors=[], uvs=[], meshes=[])
+    _quad(wrapped, 0, 100, texture_index=0, uv_scale=2.0)
+
+    image = _render(wrapped, [texture])
+
+    assert tuple(image[4, 4]) == tuple(image[4, 18]) == (255, 0, 0, 255)
+
+
+def test_fragment_batches(monkeypatch):
+    model_data = build_model(triangle_count=500)
+    full = render_thumbnail(model_data, 64)
+
+    monkeypatch.setattr(render, "FRAGMENT_BATCH", 64)
+
+    assert render_thumbnail(model_data, 64) == full
+
+    image = Image.open(io.BytesIO(full))
+
+    assert image.size == (64, 64)
+    assert image.mode == "RGBA"
+    assert np.asarray(image)[..., 3].any()
+
+
+def test_empty_model():
+    assert render_thumbnail(build_model(triangle_count=0)) is None
+
+
+def test_thumbnails_command(tmp_path):
+    paths = []
+
+    for name, triangle_count in (("model", 100), ("empty", 0)):
+        path = tmp_path / f"{name}.bin"
+        path.write_bytes(build_model(triangle_count=triangle_count))
+        paths.append(str(path))
+
+    broken_path = tmp_path / "broken.bin"
+    broken_path.write_bytes(build_model(triangle_count=100)[:60])
+    paths.append(str(broken_path))
+
+    output_dir = tmp_path / "thumbnails"
+    result = CliRunner().invoke(decompile.cli, [
+        "thumbnails", "--jobs", "1", "--output-dir", str(output_dir), *paths
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert "Rendered 1 of 3 models" in result.output
+    assert "Skipped 1 models without triangles." in result.output
+    assert "broken.bin" in result.output
+    assert [path.name for path in output_dir.iterdir()] == ["model.png"]
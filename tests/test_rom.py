@@ -0,0 +1,71 @@
+import struct
+import zlib
+
+import pytest
+
+from jtn64.rom import (
+    ByteOrder, detect_byte_order, iter_models, open_rom, read_model, to_big_endian
+)
+
+from benchmarks.synthetic import build_model, build_rom
+
+
+def _v64(rom):
+    swapped = bytearray(len(rom))
+    swapped[0::2] = rom[1::2]
+    swapped[1::2] = rom[0::2]
+
+    return bytes(swapped)
+
+
+def _n64(rom):
+    swapped = bytearray(len(rom))
+
+    for lane in range(4):
+        swapped[lane::4] = rom[3 - lane::4]
+
+    return bytes(swapped)
+
+
+def test_byte_order_conversion(tmp_path):
+    rom = build_rom([build_model(triangle_count=60)] * 3)
+
+    for name, data, byte_order in (
+        ("rom.z64", rom, ByteOrder.Z64),
+        ("rom.v64", _v64(rom), ByteOrder.V64),
+        ("rom.n64", _n64(rom), ByteOrder.N64),
+    ):
+        assert detect_byte_order(data) is byte_order
+        assert to_big_endian(data) == rom
+
+        path = tmp_path / name
+        path.write_bytes(data)
+
+        with open_rom(path) as rom_data:
+            assert rom_data[:] == rom
+            assert len(list(iter_models(rom_data))) == 3
+
+        # The file itself is left alone
+        assert path.read_bytes() == data
+
+
+def test_unknown_header_is_left_alone():
+    data = bytes(range(64))
+
+    assert detect_byte_order(data) is None
+    assert to_big_endian(data) is data
+
+
+def test_truncated_stream_is_rejected():
+    rom = bytearray(build_rom([build_model(triangle_count=60)] * 2))
+    (offset, _), (second, _) = iter_models(bytes(rom))
+    size = struct.unpack_from(">I", rom, offset + 2)[0]
+
+    # Cut the first stream in half
+    struct.pack_into(">I", rom, offset + 2, 6 + (size - 6) // 2)
+    rom = bytes(rom)
+
+    assert [offset for offset, _ in iter_models(rom)] == [second]
+
+    with pytest.raises(zlib.error):
+        read_model(rom, offset)
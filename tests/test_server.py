@@ -0,0 +1,78 @@
+import socket
+import threading
+
+import pygltflib
+import pytest
+
+from jtn64.server import Client, ConversionServer, ConversionService
+
+from benchmarks.synthetic import build_model, build_rom
+
+
+def test_serve_rom(tmp_path):
+    rom_path = tmp_path / "rom.z64"
+    rom_path.write_bytes(build_rom([
+        build_model(triangle_count=60, texture_count=2, texture_size=8),
+        build_model(triangle_count=90, texture_count=1, texture_size=8),
+    ]))
+
+    service = ConversionService()
+    server = ConversionServer(str(tmp_path / "s.sock"), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with Client(str(tmp_path / "s.sock")) as client:
+            header, _ = client.request(op="index", rom=str(rom_path))
+
+            assert header["ok"]
+            assert len(header["offsets"]) == 2
+
+            offset = header["offsets"][1]
+
+            header, parts = client.request(op="gltf", rom=str(rom_path), offset=offset)
+
+            assert header["ok"]
+
+            glb = parts[f"{offset:08x}_model.glb"]
+            gltf = pygltflib.GLTF2.load_from_bytes(glb)
+
+            assert len(gltf.images) == 1
+
+            # Served from the cache the second time around
+            _, parts_again = client.request(op="gltf", rom=str(rom_path), offset=offset)
+
+            assert parts_again[f"{offset:08x}_model.glb"] == glb
+
+            header, parts = client.request(op="textures", rom=str(rom_path), offset=offset)
+
+            assert list(parts) == [f"{offset:08x}_model_texture_0.png"]
+            assert parts[f"{offset:08x}_model_texture_0.png"].startswith(b"\x89PNG")
+
+            header, parts = client.request(op="gltf", rom=str(rom_path), offset=1)
+
+            assert not header["ok"]
+            assert parts == {}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_socket_path_must_be_a_socket(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("keep me")
+
+    with pytest.raises(FileExistsError):
+        ConversionServer(str(path), ConversionService())
+
+    assert path.read_text() == "keep me"
+
+    # A socket left behind by a server that didn't clean up is replaced
+    socket_path = tmp_path / "s.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(socket_path))
+    stale.close()
+
+    ConversionServer(str(socket_path), ConversionService()).server_close()
+
+    assert not socket_path.exists()
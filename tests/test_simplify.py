@@ -0,0 +1,104 @@
+from jtn64.mesh import Geometry, Mesh
+from jtn64.simplify import generate_lods, locked_vertices
+
+
+def _grid_geometry(size, bump=False):
+    positions = []
+
+    for y in range(size):
+        for x in range(size):
+            height = 16 * ((x * y) % 3) if bump else 0
+            positions.append((x * 64, height, y * 64))
+
+    triangles = []
+
+    for y in range(size - 1):
+        for x in range(size - 1):
+            a = y * size + x
+            b = a + 1
+            c = a + size
+            d = c + 1
+
+            triangles += [(a, c, b), (b, c, d)]
+
+    return Geometry(
+        positions=positions,
+        colors=[(0, 0, 0)] * len(positions),
+        uvs=[(0.0, 0.0)] * len(positions),
+        meshes=[Mesh(texture_index=0, indices=triangles, vertices=[])]
+    )
+
+
+def _border(size):
+    return {
+        y * size + x
+        for y in range(size) for x in range(size)
+        if x in (0, size - 1) or y in (0, size - 1)
+    }
+
+
+def test_lods_reduce_flat_grid():
+    size = 12
+    geometry = _grid_geometry(size)
+    triangle_count = len(geometry.meshes[0].indices)
+
+    lod_1, lod_2 = generate_lods(geometry, ratios=(0.5, 0.25))
+
+    # Each collapse removes two triangles, and none goes below the target
+    assert triangle_count // 2 <= len(lod_1[0].indices) <= triangle_count // 2 + 1
+    assert len(lod_2[0].indices) < len(lod_1[0].indices)
+
+    # Open edges are kept intact
+    used = {v for triangle in lod_2[0].indices for v in triangle}
+
+    assert _border(size) <= used
+
+
+def test_lods_keep_orientation():
+    geometry = _grid_geometry(12, bump=True)
+
+    for level in generate_lods(geometry, ratios=(0.3,)):
+        for a, b, c in level[0].indices:
+            pa, pb, pc = (geometry.positions[v] for v in (a, b, c))
+            # No triangle of the grid gets flipped (up is -y with this winding)
+            normal_y = (pc[2] - pa[2]) * (pb[0] - pa[0]) - (pc[0] - pa[0]) * (pb[2] - pa[2])
+
+            assert normal_y <= 0
+
+
+def test_lods_keep_closed_meshes():
+    tetrahedron = (
+        [(0, 0, 0), (100, 0, 0), (0, 100, 0), (0, 0, 100)],
+        [(0, 2, 1), (0, 1, 3), (0, 3, 2), (1, 2, 3)],
+    )
+    octahedron = (
+        [(100, 0, 0), (-100, 0, 0), (0, 100, 0), (0, -100, 0), (0, 0, 100), (0, 0, -100)],
+        [(0, 2, 4), (2, 1, 4), (1, 3, 4), (3, 0, 4), (2, 0, 5), (1, 2, 5), (3, 1, 5), (0, 3, 5)],
+    )
+
+    for positions, triangles in (tetrahedron, octahedron):
+        geometry = Geometry(
+            positions=positions,
+            colors=[(0, 0, 0)] * len(positions),
+            uvs=[(0.0, 0.0)] * len(positions),
+            meshes=[Mesh(texture_index=0, indices=triangles, vertices=[])]
+        )
+        ratios = (0.5, 0.25, 0.1)
+
+        for ratio, level in zip(ratios, generate_lods(geometry, ratios=ratios)):
+            # Never collapsed below the target, and never to nothing
+            assert len(level[0].indices) >= max(1, int(len(triangles) * ratio))
+
+
+def test_locked_vertices_seams_and_shared():
+    geometry = Geometry(
+        positions=[(0, 0, 0), (1, 0, 0), (0, 0, 1), (0, 0, 0), (5, 5, 5)],
+        colors=[(0, 0, 0)] * 5,
+        uvs=[(0.0, 0.0)] * 5,
+        meshes=[
+            Mesh(texture_index=0, indices=[(0, 1, 2)], vertices=[]),
+            Mesh(texture_index=1, indices=[(3, 1, 4)], vertices=[]),
+        ]
+    )
+
+    assert locked_vertices(geometry) == {0, 3, 1}
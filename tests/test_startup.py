@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Generous enough for a slow CI box; importing PIL and pygltflib eagerly
+# roughly doubles it.
+IMPORT_BUDGET_SECONDS = 0.5
+
+HEAVY_MODULES = ["PIL", "pygltflib", "zlib", "numpy", "jtn64.model", "jtn64.gltf"]
+
+
+def _run(code):
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+
+    return json.loads(output)
+
+
+def test_cli_import_is_lazy():
+    loaded = _run(
+        "import json, sys, decompile;"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+
+    assert loaded == []
+
+
+def test_package_import_is_lazy():
+    loaded = _run(
+        "import json, sys, jtn64;"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+
+    assert loaded == []
+
+
+def test_cli_import_time():
+    seconds = _run(
+        "import time;"
+        "start = time.perf_counter();"
+        "import decompile;"
+        "print(time.perf_counter() - start)"
+    )
+
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+def test_lazy_names():
+    import jtn64
+    from jtn64.model import Model
+
+    assert jtn64.Model is Model
+    assert "Model" in dir(jtn64)
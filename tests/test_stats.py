@@ -0,0 +1,33 @@
+from jtn64 import Model, stats
+
+from benchmarks.synthetic import build_model
+
+
+def test_stats_disabled_by_default():
+    assert stats.get_recorder() is None
+
+    with stats.timer("parse"):
+        stats.count("parse.bytes", 10)
+
+
+def test_stats_model_scope():
+    model_data = build_model(triangle_count=60, texture_count=1)
+
+    recorder = stats.enable()
+
+    try:
+        with stats.model_scope("a"):
+            Model.parse_bytes(model_data).simulate_displaylist()
+
+        stats.count("scan.hits", 3)
+        stats.count("scan.misses", 1)
+    finally:
+        stats.disable()
+
+    report = recorder.report()
+
+    assert report["models"]["a"]["counters"]["parse.bytes"] == len(model_data)
+    assert report["models"]["a"]["counters"]["simulate.triangles"] == 60
+    assert report["models"]["a"]["timings"]["parse"]["calls"] == 1
+    assert "scan.hits" not in report["models"]["a"]["counters"]
+    assert report["aggregate"]["ratios"]["scan.hit_ratio"] == 0.75
@@ -0,0 +1,80 @@
+import json
+import random
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from jtn64.rom import ByteOrder, open_rom
+from jtn64.strings import find_strings
+
+import decompile
+
+from benchmarks.synthetic import build_model, build_rom
+
+
+def _rom_with_text():
+    rom = bytearray(build_rom([build_model(triangle_count=50)], padding=0x100))
+    text = [(0x200, b"BANJO-KAZOOIE"), (0x300, b"Hi!"), (0x400, b"Gruntilda's Lair")]
+
+    # The header padding is zeroes, so the text is surrounded by non-text
+    for offset, string in text:
+        rom[offset:offset + len(string)] = string
+
+    return bytes(rom)
+
+
+def test_find_strings():
+    rom = _rom_with_text()
+    found = dict(find_strings(rom, min_length=6))
+
+    assert found[0x200] == "BANJO-KAZOOIE"
+    assert found[0x400] == "Gruntilda's Lair"
+    assert 0x300 not in found
+
+    assert dict(find_strings(rom, min_length=3))[0x300] == "Hi!"
+
+    data = b"\x00" + "バンジョー".encode("shift_jis") + b"\x00"
+
+    assert find_strings(data, encoding="shift_jis") == [(1, "バンジョー")]
+    assert find_strings(data) == []
+
+    with pytest.raises(ValueError):
+        find_strings(rom, encoding="utf-32")
+
+
+def test_dump_strings(tmp_path):
+    rom = _rom_with_text()
+    path = tmp_path / "bk.n64"
+
+    # Little endian dumps are searched as big endian
+    words = [rom[i:i + 4][::-1] for i in range(0, len(rom), 4)]
+    path.write_bytes(b"".join(words))
+
+    with open_rom(path, ByteOrder.N64) as rom_data:
+        assert bytes(rom_data) == rom
+
+    runner = CliRunner()
+    result = runner.invoke(decompile.cli, ["dump-strings", str(path), "--min-length", "10", "--json"])
+
+    assert result.exit_code == 0, result.output
+
+    strings = {entry["offset"]: entry["text"] for entry in json.loads(result.output)}
+
+    assert strings[0x200] == "BANJO-KAZOOIE"
+    assert all(len(text) >= 10 for text in strings.values())
+
+    result = runner.invoke(decompile.cli, ["dump-strings", str(path), "--min-length", "10"])
+
+    assert "00000200  BANJO-KAZOOIE\n" in result.output
+
+
+def test_scan_speed():
+    # An 8MB ROM of random bytes is about as dense in short runs as real data
+    rng = random.Random(0)
+    data = rng.getrandbits(8 * 8 * 1024 * 1024).to_bytes(8 * 1024 * 1024, "big")
+
+    start = time.perf_counter()
+    find_strings(data)
+
+    assert time.perf_counter() - start < 2
@@ -1,5 +1,13 @@
+import io
+import random
 import struct
+
+import pytest
+from PIL import Image
+
 from jtn64 import BitReader
+from jtn64.textures import iter_colors_rgb5a3
+from jtn64.util import encode_png, encode_pngs
 
 
 def test_bitreader():
@@ -12,3 +20,79 @@ def test_bitreader():
     assert reader.read_sub(1) == 1
     assert reader.read_sub(5) == 2
     assert reader.read_sub(2) == 3
+
+
+def _noise(seed, size=64):
+    rng = random.Random(seed)
+
+    return Image.frombytes(
+        "RGBA", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 4))
+    )
+
+
+def test_encode_pngs_keeps_order():
+    images = [_noise(seed) for seed in range(6)]
+
+    assert encode_pngs(images, workers=3) == [encode_png(image) for image in images]
+    assert encode_pngs(images, workers=1) == [encode_png(image) for image in images]
+
+
+def test_png_compress_level():
+    image = Image.new("RGBA", (128, 128), (10, 20, 30, 255))
+
+    stored = encode_png(image, compress_level=0)
+    compressed = encode_png(image, compress_level=9)
+
+    assert len(stored) > 128 * 128 * 4
+    assert len(compressed) < len(stored)
+    assert Image.open(io.BytesIO(stored)).tobytes() == image.tobytes()
+
+
+def _bits(data):
+    return "".join(f"{byte:08b}" for byte in data)
+
+
+def test_read_bits():
+    rng = random.Random(0)
+    data = bytes(rng.getrandbits(8) for _ in range(64))
+    bits = _bits(data)
+    reader = BitReader(data)
+    position = 0
+
+    for width in (1, 3, 13, 64, 7, 33, 61, 5, 0, 58, 2):
+        assert reader.read_bits(width) == int(bits[position:position + width] or "0", 2)
+        position += width
+        assert reader.bit_offset == position
+
+    with pytest.raises(ValueError):
+        reader.read_bits(len(bits) - position + 1)
+
+
+def test_read_many():
+    rng = random.Random(1)
+    data = bytes(rng.getrandbits(8) for _ in range(256))
+
+    for skip in (0, 3, 8):
+        for width in (1, 4, 5, 8, 12, 16, 32):
+            count = (len(data) * 8 - skip) // width - 1
+            expected = BitReader(data)
+            expected.read_bits(skip)
+            values = [expected.read_bits(width) for _ in range(count)]
+
+            reader = BitReader(data)
+            reader.read_bits(skip)
+
+            assert reader.read_many(width, count).tolist() == values
+            # Reading carries on after the bulk read
+            assert reader.read_bits(width) == expected.read_bits(width)
+
+    with pytest.raises(ValueError):
+        BitReader(data).read_many(16, 129)
+
+
+def test_rgb5a3_green():
+    # Kept from the original decoder: the two halves of green are and-ed
+    colors = list(iter_colors_rgb5a3(bytes([0xFF, 0xFF, 0x7F, 0xFF]), 2))
+
+    assert colors[0] == (248, 0, 248, 255)
+    assert all(type(channel) is int for color in colors for channel in color)